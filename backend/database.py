@@ -1,14 +1,464 @@
 import sqlite3
+import asyncio
+import hashlib
 import os
+from contextlib import asynccontextmanager
 from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence
+
+import aiosqlite
 
 DATABASE_PATH = "forensics.db"
 
+# Bulk load tuning: rows per executemany call and rows per committed transaction
+BULK_BATCH_SIZE = 5000
+BULK_ROWS_PER_TRANSACTION = 100000
+
+# Bumped whenever migrate_db gains a step; stored in PRAGMA user_version
+SCHEMA_VERSION = 9
+
+PACKET_COLUMNS = (
+    "session_id", "timestamp", "src_ip", "dst_ip", "protocol", "size", "direction",
+    "ts_us", "direction_code", "protocol_code", "flow_id"
+)
+FLOW_COLUMNS = (
+    "session_id", "flow_id", "ip_protocol", "protocol", "local_ip", "local_port", "remote_ip", "remote_port",
+    "first_ts_us", "last_ts_us", "packets", "bytes",
+    "outbound_packets", "outbound_bytes", "inbound_packets", "inbound_bytes"
+)
+FLOW_FEATURE_COLUMNS = (
+    "session_id", "flow_id", "records_out", "records_in", "cell_records_out", "cell_records_in",
+    "cells_out", "cells_in", "burst_count", "bursts"
+)
+
+# Small integer codes stored next to the text columns. Protocols outside the
+# table are stored as 0 and keep their name in the text column.
+DIRECTION_CODES = {"outbound": 0, "inbound": 1, "unknown": 2}
+PROTOCOL_CODES = {
+    "TCP": 1, "UDP": 2, "TLS": 3, "HTTP": 4, "HTTPS": 5,
+    "DNS": 6, "ICMP": 7, "ICMPV6": 8, "IP": 9, "ETH": 10
+}
+DIRECTION_NAMES = {code: name for name, code in DIRECTION_CODES.items()}
+PROTOCOL_NAMES = {code: name for name, code in PROTOCOL_CODES.items()}
+NODE_COLUMNS = ("fingerprint", "nickname", "ip_masked", "port", "bandwidth", "flags", "node_type", "uptime", "country")
+
+# WAL lets readers run alongside the ingest writer; synchronous=NORMAL is
+# durable in WAL mode and avoids an fsync per transaction.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-65536",  # 64 MiB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=30000",
+)
+
+def configure_connection(conn: sqlite3.Connection):
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+
 def get_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
+    """
+    Blocking connection for code running off the event loop: job handlers,
+    the batch process pool, startup seeding and scripts. Request handlers
+    use db_pool instead.
+    """
+    conn = sqlite3.connect(DATABASE_PATH, timeout=30)
     conn.row_factory = sqlite3.Row
+    configure_connection(conn)
     return conn
 
+class AsyncConnectionPool:
+    """
+    Pre-opened aiosqlite connections for request handlers, so queries never
+    block the event loop and no request pays for a fresh connection.
+
+    WAL allows one writer alongside any number of readers: there is a single
+    writer connection, serialized by a lock and committed (or rolled back)
+    when its block exits, and a bounded set of query-only readers handed out
+    from a queue. Opened on startup and closed on shutdown; the first use
+    opens it if startup has not.
+    """
+    def __init__(self, readers: int = 8):
+        self.readers = readers
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._reader_queue: Optional[asyncio.Queue] = None
+        self._all_readers: List[aiosqlite.Connection] = []
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._open_lock = asyncio.Lock()
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(DATABASE_PATH, timeout=30)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    async def open(self):
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            self._write_lock = asyncio.Lock()
+            self._reader_queue = asyncio.Queue()
+            self._all_readers = [await self._connect(read_only=True) for _ in range(self.readers)]
+            for conn in self._all_readers:
+                self._reader_queue.put_nowait(conn)
+            self._writer = await self._connect()
+
+    async def close(self):
+        async with self._open_lock:
+            for conn in self._all_readers + ([self._writer] if self._writer else []):
+                await conn.close()
+            self._writer = None
+            self._all_readers = []
+            self._reader_queue = None
+            # Locks and queues bind to the loop that first uses them
+            self._open_lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._writer is None:
+            await self.open()
+        conn = await self._reader_queue.get()
+        try:
+            yield conn
+        finally:
+            self._reader_queue.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[aiosqlite.Connection]:
+        if self._writer is None:
+            await self.open()
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+db_pool = AsyncConnectionPool(readers=int(os.getenv("DB_READERS", "8")))
+
+async def fetch_all(sql: str, params: Sequence = ()) -> List[Dict]:
+    """Runs a read query on the pool and returns the rows as dicts."""
+    async with db_pool.read() as conn:
+        rows = await conn.execute_fetchall(sql, params)
+    return [dict(row) for row in rows]
+
+async def fetch_one(sql: str, params: Sequence = ()) -> Optional[Dict]:
+    async with db_pool.read() as conn:
+        async with conn.execute(sql, params) as cursor:
+            row = await cursor.fetchone()
+    return dict(row) if row else None
+
+class BulkWriter:
+    """
+    Buffers rows for one table and writes them with executemany, committing
+    every `rows_per_transaction` rows. With `rebuild_indexes=True` the
+    table's secondary indexes are dropped for the load and recreated on close,
+    which is much faster for multi-million-row loads.
+    """
+    def __init__(self, conn: sqlite3.Connection, table: str, columns: Sequence[str],
+                 batch_size: int = BULK_BATCH_SIZE,
+                 rows_per_transaction: int = BULK_ROWS_PER_TRANSACTION,
+                 rebuild_indexes: bool = False,
+                 or_ignore: bool = False):
+        self.conn = conn
+        self.table = table
+        self.columns = tuple(columns)
+        self.batch_size = batch_size
+        self.rows_per_transaction = rows_per_transaction
+        self.rows_written = 0
+        self._pending: List[tuple] = []
+        self._uncommitted = 0
+        self._dropped_indexes: List[str] = []
+        
+        verb = "INSERT OR IGNORE" if or_ignore else "INSERT"
+        placeholders = ", ".join("?" for _ in self.columns)
+        self.sql = f"{verb} INTO {table} ({', '.join(self.columns)}) VALUES ({placeholders})"
+        
+        if rebuild_indexes:
+            self._drop_indexes()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.conn.rollback()
+            self._restore_indexes()
+
+    def add(self, row: Sequence):
+        self._pending.append(row)
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def add_many(self, rows: Iterable[Sequence]):
+        pending = self._pending
+        batch_size = self.batch_size
+        for row in rows:
+            pending.append(row)
+            if len(pending) >= batch_size:
+                self.flush()
+                pending = self._pending
+
+    def flush(self, commit: bool = False):
+        if self._pending:
+            cursor = self.conn.executemany(self.sql, self._pending)
+            self.rows_written += cursor.rowcount if cursor.rowcount >= 0 else len(self._pending)
+            self._uncommitted += len(self._pending)
+            self._pending = []
+        if self._uncommitted and (commit or self._uncommitted >= self.rows_per_transaction):
+            self.conn.commit()
+            self._uncommitted = 0
+
+    def close(self):
+        self.flush(commit=True)
+        self._restore_indexes()
+
+    def _drop_indexes(self):
+        rows = self.conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (self.table,)
+        ).fetchall()
+        for name, sql in rows:
+            self.conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+            self._dropped_indexes.append(sql)
+        self.conn.commit()
+
+    def _restore_indexes(self):
+        for sql in self._dropped_indexes:
+            self.conn.execute(sql)
+        if self._dropped_indexes:
+            self.conn.commit()
+        self._dropped_indexes = []
+
+def iso_to_epoch_us(timestamp: Optional[str]) -> Optional[int]:
+    """
+    Converts a stored ISO timestamp to integer epoch microseconds. Naive
+    timestamps are local time, as written by the simulators and PCAP parser.
+    Whole seconds are converted separately so no float rounding creeps in.
+    """
+    if timestamp is None:
+        return None
+    try:
+        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    return int(dt.replace(microsecond=0).timestamp()) * 1_000_000 + dt.microsecond
+
+def packet_row(packet: Dict) -> tuple:
+    ts_us = packet.get('ts_us')
+    if ts_us is None:
+        ts_us = iso_to_epoch_us(packet['timestamp'])
+    return (
+        packet['session_id'],
+        packet['timestamp'],
+        packet['src_ip'],
+        packet['dst_ip'],
+        packet['protocol'],
+        packet['size'],
+        packet['direction'],
+        ts_us,
+        DIRECTION_CODES.get(packet['direction'], 0),
+        PROTOCOL_CODES.get(packet['protocol'], 0),
+        packet.get('flow_id')
+    )
+
+class PacketWriter(BulkWriter):
+    """BulkWriter for the packets table that accepts packet dicts."""
+    def __init__(self, conn: sqlite3.Connection, **kwargs):
+        super().__init__(conn, "packets", PACKET_COLUMNS, **kwargs)
+
+    def add_packets(self, packets: Iterable[Dict]):
+        self.add_many(map(packet_row, packets))
+
+COLUMN_FETCH_SIZE = 50000
+
+def load_packet_columns(conn: sqlite3.Connection, session_id: str,
+                        chunk_size: int = COLUMN_FETCH_SIZE):
+    """
+    Loads a session's packets straight into a PacketColumns without building
+    a dict per packet. Rows are fetched as plain tuples in chunks and
+    appended to NumPy arrays; protocol and endpoint strings are dictionary
+    encoded as they stream in. Returns None if the session has no packets.
+    """
+    import numpy as np
+    from backend.services.packet_columns import PacketColumns, DIRECTION_UNKNOWN, factorize
+    
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute('''
+        SELECT COALESCE(ts_us, 0), ts_us IS NOT NULL, size, COALESCE(direction_code, ?),
+               protocol, src_ip, dst_ip
+        FROM packets WHERE session_id = ? ORDER BY ts_us, id
+    ''', (DIRECTION_UNKNOWN, session_id))
+    
+    chunks = {"ts_us": [], "ts_valid": [], "size": [], "direction": [], "protocol": [], "src_ip": [], "dst_ip": []}
+    protocol_lookup: Dict = {}
+    ip_lookup: Dict = {}
+    
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        ts_us, ts_valid, size, direction, protocol, src_ip, dst_ip = zip(*rows)
+        chunks["ts_us"].append(np.array(ts_us, dtype=np.int64))
+        chunks["ts_valid"].append(np.array(ts_valid, dtype=bool))
+        chunks["size"].append(np.array(size, dtype=np.int64))
+        chunks["direction"].append(np.array(direction, dtype=np.uint8))
+        chunks["protocol"].append(factorize(protocol, protocol_lookup)[0])
+        chunks["src_ip"].append(factorize(src_ip, ip_lookup)[0])
+        chunks["dst_ip"].append(factorize(dst_ip, ip_lookup)[0])
+    
+    if not chunks["size"]:
+        return None
+    
+    columns = {name: np.concatenate(parts) for name, parts in chunks.items()}
+    ts_valid = columns.pop("ts_valid")
+    return PacketColumns(
+        protocol_names=list(protocol_lookup),
+        ip_names=list(ip_lookup),
+        ts_valid=None if ts_valid.all() else ts_valid,
+        **columns
+    )
+
+SESSION_FINGERPRINT_SQL = '''
+    SELECT COUNT(*), COALESCE(MAX(id), 0), MIN(ts_us), MAX(ts_us)
+    FROM packets WHERE session_id = ?
+'''
+
+def session_fingerprint(conn: sqlite3.Connection, session_id: str) -> str:
+    """
+    Content fingerprint of a session's packet set. AUTOINCREMENT ids are
+    never reused, so any insert or delete changes the result. The aggregates
+    take one scan of the session's idx_packets_session_ts entries, about
+    0.2 s per million packets: far cheaper than reloading them, but it grows
+    with the session. stats_counters keeps no per-session packet count, and
+    a trigger on packets would tax every ingest insert.
+    """
+    row = conn.execute(SESSION_FINGERPRINT_SQL, (session_id,)).fetchone()
+    return hashlib.sha256(repr(tuple(row)).encode()).hexdigest()
+
+async def session_fingerprint_async(conn: aiosqlite.Connection, session_id: str) -> str:
+    async with conn.execute(SESSION_FINGERPRINT_SQL, (session_id,)) as cursor:
+        row = await cursor.fetchone()
+    return hashlib.sha256(repr(tuple(row)).encode()).hexdigest()
+
+# Bucket widths of the packet_rollups pyramid. Each level divides the next,
+# so every level is built from the one below rather than from packets.
+ROLLUP_LEVELS_MS = (10, 100, 1000, 10000, 60000, 600000, 3600000)
+
+def _rollup_statements(session_id: str) -> List[tuple]:
+    finest = ROLLUP_LEVELS_MS[0]
+    statements = [
+        ("DELETE FROM packet_rollups WHERE session_id = ?", (session_id,)),
+        ('''
+            INSERT INTO packet_rollups (session_id, level_ms, bucket, direction_code, protocol, packets, bytes)
+            SELECT session_id, ?, ts_us / ?, IFNULL(direction_code, ?), protocol, COUNT(*), SUM(size)
+            FROM packets WHERE session_id = ? AND ts_us IS NOT NULL
+            GROUP BY 3, 4, 5
+        ''', (finest, finest * 1000, DIRECTION_CODES["unknown"], session_id))
+    ]
+    for lower, level in zip(ROLLUP_LEVELS_MS, ROLLUP_LEVELS_MS[1:]):
+        statements.append(('''
+            INSERT INTO packet_rollups (session_id, level_ms, bucket, direction_code, protocol, packets, bytes)
+            SELECT session_id, ?, bucket / ?, direction_code, protocol, SUM(packets), SUM(bytes)
+            FROM packet_rollups WHERE session_id = ? AND level_ms = ?
+            GROUP BY 3, 4, 5
+        ''', (level, level // lower, session_id, lower)))
+    return statements
+
+def build_packet_rollups(conn: sqlite3.Connection, session_id: str):
+    """
+    (Re)writes the session's packet_rollups: packets and bytes per bucket,
+    direction and protocol at every ROLLUP_LEVELS_MS width. Called once a
+    session's packets are written; the caller commits.
+    """
+    for sql, params in _rollup_statements(session_id):
+        conn.execute(sql, params)
+
+async def build_packet_rollups_async(conn: aiosqlite.Connection, session_id: str):
+    for sql, params in _rollup_statements(session_id):
+        await conn.execute(sql, params)
+
+def insert_nodes(conn: sqlite3.Connection, nodes: List[Dict]) -> int:
+    """Bulk-inserts simulated relays, skipping duplicate fingerprints. Returns rows inserted."""
+    with BulkWriter(conn, "tor_nodes", NODE_COLUMNS, or_ignore=True) as writer:
+        writer.add_many(tuple(node[c] for c in NODE_COLUMNS) for node in nodes)
+    return writer.rows_written
+
+async def insert_nodes_async(conn: aiosqlite.Connection, nodes: List[Dict]) -> int:
+    before = conn.total_changes
+    await conn.executemany(
+        f"INSERT OR IGNORE INTO tor_nodes ({', '.join(NODE_COLUMNS)}) VALUES ({', '.join('?' * len(NODE_COLUMNS))})",
+        [tuple(node[c] for c in NODE_COLUMNS) for node in nodes]
+    )
+    return conn.total_changes - before
+
+async def insert_packets_async(conn: aiosqlite.Connection, packets: List[Dict]):
+    """Pool-writer counterpart of PacketWriter for request-sized packet sets."""
+    sql = f"INSERT INTO packets ({', '.join(PACKET_COLUMNS)}) VALUES ({', '.join('?' * len(PACKET_COLUMNS))})"
+    for start in range(0, len(packets), BULK_BATCH_SIZE):
+        await conn.executemany(sql, [packet_row(p) for p in packets[start:start + BULK_BATCH_SIZE]])
+
+# stats_counters rows kept current by triggers: one (scope, key) counter per
+# table row count and per distinct value of the dashboard's GROUP BY columns.
+# NULL keys are stored as ''.
+STATS_COUNTER_SOURCES = {
+    "tor_nodes": {"node_type": "node_type", "country": "country"},
+    "traffic_sessions": {},
+    "analyses": {"analysis_status": "status"},
+}
+
+def _bump_counter(scope: str, key: str, delta: int) -> str:
+    return (
+        f"INSERT INTO stats_counters (scope, key, count) VALUES ('{scope}', {key}, {delta}) "
+        f"ON CONFLICT(scope, key) DO UPDATE SET count = count + ({delta});"
+    )
+
+def _counter_key(row: str, column: str) -> str:
+    return f"IFNULL({row}.{column}, '')"
+
+def _stats_trigger_sql() -> List[str]:
+    statements = []
+    for table, columns in STATS_COUNTER_SOURCES.items():
+        for event, row, delta in (("INSERT", "NEW", 1), ("DELETE", "OLD", -1)):
+            body = [_bump_counter("table", f"'{table}'", delta)]
+            body += [_bump_counter(scope, _counter_key(row, col), delta) for scope, col in columns.items()]
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_{event.lower()} AFTER {event} ON {table} "
+                f"BEGIN {' '.join(body)} END"
+            )
+        for scope, col in columns.items():
+            body = [_bump_counter(scope, _counter_key("OLD", col), -1), _bump_counter(scope, _counter_key("NEW", col), 1)]
+            statements.append(
+                f"CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_{col} AFTER UPDATE OF {col} ON {table} "
+                f"WHEN OLD.{col} IS NOT NEW.{col} BEGIN {' '.join(body)} END"
+            )
+    return statements
+
+def _backfill_stats_counters(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM stats_counters")
+    for table, columns in STATS_COUNTER_SOURCES.items():
+        conn.execute(f"INSERT INTO stats_counters (scope, key, count) SELECT 'table', '{table}', COUNT(*) FROM {table}")
+        for scope, col in columns.items():
+            conn.execute(
+                f"INSERT INTO stats_counters (scope, key, count) "
+                f"SELECT '{scope}', IFNULL({col}, ''), COUNT(*) FROM {table} GROUP BY IFNULL({col}, '')"
+            )
+
+async def read_stats_counters(conn: aiosqlite.Connection) -> Dict[str, Dict[Optional[str], int]]:
+    """All non-zero counters as {scope: {key: count}}."""
+    counters: Dict[str, Dict[Optional[str], int]] = {}
+    rows = await conn.execute_fetchall("SELECT scope, key, count FROM stats_counters WHERE count != 0")
+    for scope, key, count in rows:
+        counters.setdefault(scope, {})[key if key != "" else None] = count
+    return counters
+
 def init_db():
     conn = get_connection()
     cursor = conn.cursor()
@@ -53,6 +503,10 @@ def init_db():
             protocol TEXT NOT NULL,
             size INTEGER NOT NULL,
             direction TEXT NOT NULL,
+            ts_us INTEGER,
+            direction_code INTEGER,
+            protocol_code INTEGER,
+            flow_id INTEGER,
             FOREIGN KEY (session_id) REFERENCES traffic_sessions(session_id)
         )
     ''')
@@ -107,8 +561,169 @@ def init_db():
     ''')
     
     conn.commit()
+    
+    migrate_db(conn)
     conn.close()
 
+def _column_names(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+def _add_column_if_missing(conn: sqlite3.Connection, table: str, column: str, definition: str):
+    if column not in _column_names(conn, table):
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+def migrate_db(conn: sqlite3.Connection):
+    """
+    Brings an existing database up to SCHEMA_VERSION. Each step is
+    idempotent so a partially migrated database can be re-run safely.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    
+    if version < 1:
+        # v1: integer-encoded timestamps and codes, composite session/time index
+        _add_column_if_missing(conn, "packets", "ts_us", "INTEGER")
+        _add_column_if_missing(conn, "packets", "direction_code", "INTEGER")
+        _add_column_if_missing(conn, "packets", "protocol_code", "INTEGER")
+        
+        conn.create_function("iso_to_epoch_us", 1, iso_to_epoch_us, deterministic=True)
+        direction_case = " ".join(f"WHEN '{name}' THEN {code}" for name, code in DIRECTION_CODES.items())
+        protocol_case = " ".join(f"WHEN '{name}' THEN {code}" for name, code in PROTOCOL_CODES.items())
+        conn.execute(f'''
+            UPDATE packets SET
+                ts_us = iso_to_epoch_us(timestamp),
+                direction_code = CASE direction {direction_case} ELSE 0 END,
+                protocol_code = CASE protocol {protocol_case} ELSE 0 END
+            WHERE ts_us IS NULL
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_packets_session_ts ON packets (session_id, ts_us)")
+    
+    if version < 2:
+        # v2: persistent job queue (see services/job_queue.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                progress TEXT,
+                attempts INTEGER DEFAULT 0,
+                max_attempts INTEGER DEFAULT 3,
+                cancel_requested INTEGER DEFAULT 0,
+                run_after REAL DEFAULT 0,
+                created_at TIMESTAMP NOT NULL,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, run_after)")
+    
+    if version < 3:
+        # v3: trigger-maintained counters behind /api/stats and /api/nodes/stats
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS stats_counters (
+                scope TEXT NOT NULL,
+                key TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, key)
+            ) WITHOUT ROWID
+        ''')
+        for statement in _stats_trigger_sql():
+            conn.execute(statement)
+        _backfill_stats_counters(conn)
+    
+    if version < 4:
+        # v4: per-session time-bucket rollups behind /api/sessions/{id}/timeline
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS packet_rollups (
+                session_id TEXT NOT NULL,
+                level_ms INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                direction_code INTEGER NOT NULL,
+                protocol TEXT NOT NULL,
+                packets INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                PRIMARY KEY (session_id, level_ms, bucket, direction_code, protocol)
+            ) WITHOUT ROWID
+        ''')
+        for (session_id,) in conn.execute("SELECT session_id FROM traffic_sessions").fetchall():
+            build_packet_rollups(conn, session_id)
+    
+    if version < 5:
+        # v5: sessions may point at a memory-mapped column store (services/column_store.py)
+        _add_column_if_missing(conn, "traffic_sessions", "column_store_path", "TEXT")
+    
+    if version < 6:
+        # v6: per-packet flow ids and the flow table built during ingest (services/flow_table.py)
+        _add_column_if_missing(conn, "packets", "flow_id", "INTEGER")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS flows (
+                session_id TEXT NOT NULL,
+                flow_id INTEGER NOT NULL,
+                ip_protocol TEXT NOT NULL,
+                protocol TEXT,
+                local_ip TEXT NOT NULL,
+                local_port INTEGER,
+                remote_ip TEXT NOT NULL,
+                remote_port INTEGER,
+                first_ts_us INTEGER NOT NULL,
+                last_ts_us INTEGER NOT NULL,
+                packets INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                outbound_packets INTEGER NOT NULL,
+                outbound_bytes INTEGER NOT NULL,
+                inbound_packets INTEGER NOT NULL,
+                inbound_bytes INTEGER NOT NULL,
+                PRIMARY KEY (session_id, flow_id)
+            ) WITHOUT ROWID
+        ''')
+    
+    if version < 7:
+        # v7: Tor cell features of TLS flows (services/cell_features.py); bursts
+        # are packed little-endian int16 cell counts, positive for outbound, of
+        # the first MAX_BURSTS bursts, while burst_count counts all of them
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS flow_features (
+                session_id TEXT NOT NULL,
+                flow_id INTEGER NOT NULL,
+                records_out INTEGER NOT NULL,
+                records_in INTEGER NOT NULL,
+                cell_records_out INTEGER NOT NULL,
+                cell_records_in INTEGER NOT NULL,
+                cells_out INTEGER NOT NULL,
+                cells_in INTEGER NOT NULL,
+                burst_count INTEGER NOT NULL,
+                bursts BLOB,
+                PRIMARY KEY (session_id, flow_id)
+            ) WITHOUT ROWID
+        ''')
+    
+    if version < 8:
+        # v8: external lookups shared across cases (services/reputation_cache.py)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS reputation_cache (
+                provider TEXT NOT NULL,
+                indicator TEXT NOT NULL,
+                result TEXT NOT NULL,
+                negative INTEGER NOT NULL DEFAULT 0,
+                fetched_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (provider, indicator)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_reputation_cache_expires ON reputation_cache (expires_at)")
+    
+    if version < 9:
+        # v9: rollups file packets without a direction under "unknown" instead of -1
+        for (session_id,) in conn.execute(
+            "SELECT DISTINCT session_id FROM packet_rollups WHERE direction_code < 0"
+        ).fetchall():
+            build_packet_rollups(conn, session_id)
+    
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
 if __name__ == "__main__":
     init_db()
     print("Database initialized successfully")
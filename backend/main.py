@@ -7,9 +7,15 @@ from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables from .env file
 
-from backend.database import init_db, get_connection
+from backend.database import init_db, db_pool, get_connection, insert_nodes, build_packet_rollups, PacketWriter
 
-from backend.routers import nodes, sessions, analysis, reports, osint, threat_intel, stats
+from backend.routers import nodes, sessions, analysis, reports, osint, threat_intel, stats, jobs, events
+from backend.services.batch_analysis import batch_analysis
+from backend.services.column_store import write_session_columns
+from backend.services.event_bus import event_bus
+from backend.services.job_queue import job_queue
+from backend.services.osint_scanner import scanner_service
+from backend.services.reputation_cache import reputation_cache
 from backend.services.tor_simulator import generate_simulated_nodes, generate_demo_traffic
 import uuid
 from datetime import datetime
@@ -41,6 +47,8 @@ app.include_router(reports.router)
 app.include_router(osint.router)
 app.include_router(threat_intel.router)
 app.include_router(stats.router)
+app.include_router(jobs.router)
+app.include_router(events.router)
 
 @app.on_event("startup")
 async def startup_event():
@@ -54,24 +62,7 @@ async def startup_event():
     if node_count == 0:
         print("Initializing demo data...")
         nodes_data = generate_simulated_nodes(30)
-        for node in nodes_data:
-            try:
-                cursor.execute('''
-                    INSERT INTO tor_nodes (fingerprint, nickname, ip_masked, port, bandwidth, flags, node_type, uptime, country)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    node['fingerprint'],
-                    node['nickname'],
-                    node['ip_masked'],
-                    node['port'],
-                    node['bandwidth'],
-                    node['flags'],
-                    node['node_type'],
-                    node['uptime'],
-                    node['country']
-                ))
-            except:
-                pass
+        insert_nodes(conn, nodes_data)
         
         session_id = f"INIT-{uuid.uuid4().hex[:8].upper()}"
         packets = generate_demo_traffic(session_id, 150)
@@ -81,8 +72,8 @@ async def startup_event():
         total_bytes = sum(p['size'] for p in packets)
         
         cursor.execute('''
-            INSERT INTO traffic_sessions (session_id, name, description, start_time, end_time, packet_count, total_bytes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO traffic_sessions (session_id, name, description, start_time, end_time, packet_count, total_bytes, column_store_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             session_id,
             "Initial Demo Session",
@@ -90,27 +81,36 @@ async def startup_event():
             start_time,
             end_time,
             len(packets),
-            total_bytes
+            total_bytes,
+            write_session_columns(session_id, packets)
         ))
         
-        for packet in packets:
-            cursor.execute('''
-                INSERT INTO packets (session_id, timestamp, src_ip, dst_ip, protocol, size, direction)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                packet['session_id'],
-                packet['timestamp'],
-                packet['src_ip'],
-                packet['dst_ip'],
-                packet['protocol'],
-                packet['size'],
-                packet['direction']
-            ))
+        with PacketWriter(conn) as writer:
+            writer.add_packets(packets)
+        build_packet_rollups(conn, session_id)
         
         conn.commit()
         print("Demo data initialized successfully!")
     
     conn.close()
+    
+    expired = reputation_cache.purge_expired()
+    if expired:
+        print(f"Reputation cache: purged {expired} expired entries")
+    
+    await db_pool.open()
+    event_bus.attach()
+    await scanner_service.start()
+    job_queue.start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    job_queue.stop()
+    batch_analysis.shutdown()
+    await osint.osint_engine.close()
+    await scanner_service.close()
+    event_bus.close()
+    await db_pool.close()
 
 @app.get("/api/health")
 async def health_check():
@@ -38,6 +38,9 @@ class Packet(BaseModel):
     protocol: str
     size: int
     direction: str
+    ts_us: Optional[int] = None
+    direction_code: Optional[int] = None
+    protocol_code: Optional[int] = None
 
 class AnalysisCreate(BaseModel):
     session_id: str
@@ -107,3 +110,31 @@ class ThreatIntel(BaseModel):
     severity: str = "Low"
     last_updated: Optional[datetime] = None
     raw_data: Optional[str] = None
+
+class FlowCorrelationRequest(BaseModel):
+    ingress_session_id: str
+    egress_session_id: str
+    bin_width: float = 0.1   # seconds
+    max_lag: float = 2.0     # seconds
+    metric: str = "bytes"    # bytes | packets
+    min_packets: int = 5
+    top_k: int = 20
+
+class LiveCorrelationRequest(BaseModel):
+    source: str = "file"              # file | socket
+    path: Optional[str] = None        # capture file under LIVE_CAPTURE_DIR, for source=file
+    address: Optional[str] = None     # loopback host:port or unix:/path, for source=socket
+    time_window: float = 5.0          # seconds
+    idle_timeout: float = 30.0        # seconds without data before the feed is considered ended
+    max_duration: Optional[float] = None  # seconds of wall time, unlimited by default
+
+class BatchAnalysisRequest(BaseModel):
+    session_ids: Optional[List[str]] = None
+    # Alternatively, every session overlapping [start_time, end_time]
+    start_time: Optional[datetime] = None
+    end_time: Optional[datetime] = None
+
+class JobCreate(BaseModel):
+    job_type: str
+    payload: dict = {}
+    max_attempts: int = 3
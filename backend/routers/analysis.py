@@ -1,93 +1,242 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import JSONResponse
+from collections import deque
 from typing import List, Dict, Any
+import asyncio
+import hashlib
+import os
+import time
+from fastapi.concurrency import run_in_threadpool
 # Ensure backend directory is in python path or use relative imports where appropriate
-from backend.database import get_connection
+from backend.database import db_pool, fetch_all, fetch_one, get_connection, session_fingerprint, session_fingerprint_async
+from backend.models.schemas import BatchAnalysisRequest, FlowCorrelationRequest, LiveCorrelationRequest
 from backend.services.ai_assistant import SecurityAnalystAI
+from backend.services.analysis_cache import analysis_cache
+from backend.services.batch_analysis import batch_analysis
+from backend.services.cell_features import load_cell_summary
+from backend.services.column_store import load_columns
 from backend.services.correlation_engine import CorrelationEngine
+from backend.services.event_bus import event_bus
+from backend.services.flow_correlator import FlowCorrelator, flows_from_columns
+from backend.services.job_queue import FINISHED_STATUSES, REQUEST_WAIT_TIMEOUT, JobContext, PermanentJobError, job_queue
+from backend.services.online_correlator import connect_feed, follow_file, parse_feed_address, resolve_capture_path
+from backend.services.pcap_reader import PcapFormatError, PcapStreamReader
 
 router = APIRouter(prefix="/api/analysis", tags=["Traffic Analysis"])
 
+# Window events kept in a live correlation job's result
+LIVE_EVENT_HISTORY = 100
+# Live jobs hold a job worker for as long as the feed runs; at least one
+# worker is always left for analyses, reports and OSINT lookups
+MAX_LIVE_JOBS = min(int(os.getenv("LIVE_MAX_JOBS", "2")), job_queue.workers - 1)
+_live_submit_lock = asyncio.Lock()
+
 ai_service = SecurityAnalystAI()
 
-@router.get("/{session_id}/insights")
-async def get_session_insights(session_id: str):
+def _nodes_fingerprint(nodes: List[Dict]) -> str:
+    # Circuit selection depends on the relay set, so it is part of the correlation cache key
+    signature = [(n.get('id'), n.get('node_type'), n.get('bandwidth'), n.get('uptime')) for n in nodes]
+    return hashlib.sha256(repr(signature).encode()).hexdigest()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return analysis_cache.stats()
+
+def _correlate_flows(correlator: FlowCorrelator, request: FlowCorrelationRequest) -> Dict:
+    conn = get_connection()
+    try:
+        ingress_columns = load_columns(conn, request.ingress_session_id)
+        if request.egress_session_id == request.ingress_session_id:
+            egress_columns = ingress_columns
+        else:
+            egress_columns = load_columns(conn, request.egress_session_id)
+    finally:
+        conn.close()
+
+    if ingress_columns is None:
+        raise HTTPException(status_code=404, detail="Ingress session not found or empty")
+    if egress_columns is None:
+        raise HTTPException(status_code=404, detail="Egress session not found or empty")
+
+    ingress = flows_from_columns(ingress_columns, request.min_packets)
+    egress = flows_from_columns(egress_columns, request.min_packets)
+    return correlator.correlate(
+        ingress, egress, request.top_k,
+        request.egress_session_id == request.ingress_session_id
+    )
+
+@router.post("/flow-correlation")
+async def run_flow_correlation(request: FlowCorrelationRequest):
     """
-    Run statistical AI analysis on a specific session to find anomalies.
+    Match every flow in the ingress (entry-side) session against every flow in
+    the egress (exit-side) session and return the top-k pairings by
+    cross-correlation score. Both sessions may be the same capture.
+    """
+    if request.top_k < 1:
+        raise HTTPException(status_code=400, detail="top_k must be at least 1")
+    try:
+        correlator = FlowCorrelator(request.bin_width, request.max_lag, request.metric)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Column loading and FFT scoring are blocking; keep both off the event loop
+    result = await run_in_threadpool(_correlate_flows, correlator, request)
+    result["ingress_session_id"] = request.ingress_session_id
+    result["egress_session_id"] = request.egress_session_id
+    return result
+
+@router.post("/batch", status_code=202)
+async def run_batch_correlation(request: BatchAnalysisRequest):
+    """
+    Queue correlation analysis for many sessions, given either explicit
+    session IDs or a time range, across a process pool. Poll the returned
+    status_url for progress; results are upserted into analyses.
+    """
+    if request.session_ids:
+        session_ids = list(dict.fromkeys(request.session_ids))
+    elif request.start_time or request.end_time:
+        query = "SELECT session_id FROM traffic_sessions WHERE 1=1"
+        params = []
+        if request.end_time:
+            query += " AND start_time <= ?"
+            params.append(request.end_time.isoformat())
+        if request.start_time:
+            query += " AND COALESCE(end_time, start_time) >= ?"
+            params.append(request.start_time.isoformat())
+        session_ids = [row["session_id"] for row in await fetch_all(query + " ORDER BY start_time", params)]
+    else:
+        raise HTTPException(status_code=400, detail="Provide session_ids or a start_time/end_time range")
+
+    if not session_ids:
+        raise HTTPException(status_code=404, detail="No sessions matched the request")
+
+    job = await job_queue.submit("batch_correlation", {"session_ids": session_ids}, max_attempts=1)
+    return {
+        "batch_id": job["job_id"],
+        "status": job["status"],
+        "total": len(session_ids),
+        "status_url": f"/api/analysis/batch/{job['job_id']}"
+    }
+
+@router.get("/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
     """
+    Progress of a batch correlation run.
+    """
+    job = await job_queue.get(batch_id)
+    if not job or job["job_type"] != "batch_correlation":
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    status = {
+        "batch_id": job["job_id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "error": job["error"],
+        "total": len(job["payload"]["session_ids"]),
+        **job["progress"],
+        **(job["result"] or {})
+    }
+    if "elapsed_seconds" in job:
+        status["elapsed_seconds"] = job["elapsed_seconds"]
+    return status
+
+def _session_insights(session_id: str) -> Dict:
+    # Fetch packets for the session as columns
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Fetch packets for the session
-    cursor.execute("SELECT * FROM packets WHERE session_id = ? ORDER BY timestamp", (session_id,))
-    rows = cursor.fetchall()
-    conn.close()
+    try:
+        packets = load_columns(conn, session_id)
+    finally:
+        conn.close()
     
-    if not rows:
+    if packets is None:
         raise HTTPException(status_code=404, detail="Session not found or empty")
-        
-    packets = [dict(row) for row in rows]
     
     # Run the AI engine
     try:
-        insights = ai_service.analyze_session(packets)
         return ai_service.analyze_session(packets)
     except Exception as e:
         print(f"AI Analysis Error: {e}")
         raise HTTPException(status_code=500, detail="Failed to run analysis")
 
+@router.get("/{session_id}/insights")
+async def get_session_insights(session_id: str):
+    """
+    Run statistical AI analysis on a specific session to find anomalies.
+    Results are cached until the session's packet set changes.
+    """
+    async with db_pool.read() as conn:
+        fingerprint = await session_fingerprint_async(conn, session_id)
+    
+    cached = analysis_cache.get(session_id, "insights", fingerprint)
+    if cached is not None:
+        return cached
+    
+    # Loading columns and running the AI engine both block
+    insights = await run_in_threadpool(_session_insights, session_id)
+    
+    analysis_cache.put(session_id, "insights", fingerprint, insights)
+    return insights
+
 @router.get("/")
 async def get_analyses():
     """
     Get all past analyses.
     """
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM analyses ORDER BY created_at DESC")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return await fetch_all("SELECT * FROM analyses ORDER BY created_at DESC")
 
-@router.post("/run")
-async def run_correlation(data: Dict[str, Any]):
+def _run_correlation(ctx: JobContext) -> Dict:
     """
-    Run the full multi-factor correlation analysis on a session and save the result.
+    The full multi-factor correlation analysis for one session, saved to
+    analyses. Runs as a "correlation" job on the job queue's workers and
+    stops between stages once the job is cancelled.
     """
-    session_id = data.get("session_id")
-    if not session_id:
-        raise HTTPException(status_code=400, detail="session_id is required")
-
     conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Check if analysis already exists for this session to avoid duplicates (optional, but good for demo)
-    # cursor.execute("SELECT * FROM analyses WHERE session_id = ?", (session_id,))
-    # existing = cursor.fetchone()
-    # if existing:
-    #     return dict(existing)
-    
-    # 1. Fetch Session Packets
-    cursor.execute("SELECT * FROM packets WHERE session_id = ? ORDER BY timestamp", (session_id,))
-    packet_rows = cursor.fetchall()
-    packets = [dict(row) for row in packet_rows]
-    
-    if not packets:
+    try:
+        return _correlate_session(ctx, conn)
+    finally:
         conn.close()
-        raise HTTPException(status_code=404, detail="No packets found for this session")
 
-    # 2. Fetch Active Tor Nodes
+def _correlate_session(ctx: JobContext, conn) -> Dict:
+    session_id = ctx.payload["session_id"]
+    analyst_notes = ctx.payload.get("analyst_notes", "")
+    cursor = conn.cursor()
+    
+    # 1. Fetch Active Tor Nodes
+    ctx.progress(stage="loading")
     cursor.execute("SELECT * FROM tor_nodes")
     node_rows = cursor.fetchall()
     nodes = [dict(row) for row in node_rows]
     
+    # 2. Reuse cached results while the packet set and relay set are unchanged
+    fingerprint = session_fingerprint(conn, session_id)
+    correlation_fingerprint = f"{fingerprint}:{_nodes_fingerprint(nodes)}"
+    result = analysis_cache.get(session_id, "correlation", correlation_fingerprint)
+    ai_result = analysis_cache.get(session_id, "insights", fingerprint)
+    
+    packets = None
+    if result is None or ai_result is None:
+        packets = load_columns(conn, session_id)
+        if packets is None:
+            raise PermanentJobError("No packets found for this session")
+    
     # 3. Run Correlation Engine
-    engine = CorrelationEngine()
-    result = engine.run_analysis(packets, nodes)
+    if result is None:
+        ctx.progress(stage="correlating")
+        engine = CorrelationEngine()
+        result = engine.run_analysis(packets, nodes, load_cell_summary(conn, session_id))
+        analysis_cache.put(session_id, "correlation", correlation_fingerprint, result)
+    result = dict(result)
     
     # 4. Run AI Analysis for Narrative
+    ctx.progress(stage="narrative")
     ai_narrative = ""
     try:
         # We reuse the existing AI service to get the rich narrative
-        ai_result = ai_service.analyze_session(packets)
+        if ai_result is None:
+            ai_result = ai_service.analyze_session(packets)
+            analysis_cache.put(session_id, "insights", fingerprint, ai_result)
         if isinstance(ai_result, dict):
             ai_narrative = ai_result.get("narrative", "")
             # If standard key isn't there, check for alternate structure or just use str
@@ -115,6 +264,7 @@ async def run_correlation(data: Dict[str, Any]):
     exit_id = circuit.get('exit', {}).get('id') if circuit.get('exit') else None
 
     # 4. Save to Database
+    ctx.progress(stage="saving")
     try:
         cursor.execute('''
             INSERT INTO analyses (
@@ -135,17 +285,149 @@ async def run_correlation(data: Dict[str, Any]):
             full_justification,
             entry_id, middle_id, exit_id,
             result.get('probable_origin', 'Unknown'),
-            data.get('analyst_notes', ''),
+            analyst_notes,
             result.get('evidence_hash', f"SHA256-{session_id}") 
         ))
         conn.commit()
+        event_bus.publish("analysis.completed", _analysis_event(cursor.lastrowid, result),
+                          session_id=session_id, case_id=case_id)
     except Exception as e:
         print(f"Error saving analysis: {e}")
-    finally:
-        conn.close()
     
     # Return the full result including the new fields we just generated
     result['justification'] = full_justification
     result['ai_narrative'] = ai_narrative
     
     return result
+
+def _analysis_event(analysis_id: int, result: Dict) -> Dict:
+    return {
+        "analysis_id": analysis_id,
+        "timing_score": result.get('timing_score', 0),
+        "volume_score": result.get('volume_score', 0),
+        "pattern_score": result.get('pattern_score', 0),
+        "overall_confidence": result.get('overall_confidence', 0),
+        "probable_origin": result.get('probable_origin', 'Unknown')
+    }
+
+def _run_live_correlation(ctx: JobContext) -> Dict:
+    """
+    Scores a live capture feed window by window until it goes idle, reaches
+    max_duration or the job is cancelled. Every window event is published
+    as job progress ("latest") and pushed to event subscribers as
+    live.window the moment it is emitted.
+    """
+    payload = ctx.payload
+    correlator = CorrelationEngine(time_window=payload["time_window"]).online_correlator()
+    max_duration = payload.get("max_duration")
+    deadline = time.monotonic() + max_duration if max_duration else None
+    
+    try:
+        if payload["source"] == "socket":
+            read, close = connect_feed(payload["address"], ctx.check_cancelled, payload["idle_timeout"], deadline)
+        else:
+            read, close = follow_file(resolve_capture_path(payload["path"]), ctx.check_cancelled,
+                                      payload["idle_timeout"], deadline)
+    except (OSError, ValueError) as e:
+        raise PermanentJobError(f"Cannot open live feed: {e}")
+    
+    events = deque(maxlen=LIVE_EVENT_HISTORY)
+    try:
+        for event in correlator.run(PcapStreamReader(read).records()):
+            events.append(event)
+            ctx.publish("live.window", event)
+            ctx.progress(windows=correlator.windows_emitted, packets=correlator.total_packets, latest=event)
+    except PcapFormatError as e:
+        raise PermanentJobError(str(e))
+    finally:
+        close()
+    
+    return {
+        "windows": correlator.windows_emitted,
+        "packets": correlator.total_packets,
+        "events": list(events)
+    }
+
+job_queue.register("correlation", _run_correlation)
+job_queue.register("batch_correlation", batch_analysis.run)
+job_queue.register("live_correlation", _run_live_correlation)
+
+@router.post("/live", status_code=202)
+async def start_live_correlation(request: LiveCorrelationRequest):
+    """
+    Start sliding-window correlation over a live feed: a pcap file still
+    being written under LIVE_CAPTURE_DIR, or a loopback socket streaming
+    pcap. Scores for each time_window arrive as job progress on status_url;
+    cancel the job to stop watching. Each live job holds one job worker,
+    so at most MAX_LIVE_JOBS may be queued or running at once.
+    """
+    if request.time_window <= 0 or request.idle_timeout <= 0:
+        raise HTTPException(status_code=400, detail="time_window and idle_timeout must be positive")
+    
+    payload = {
+        "source": request.source,
+        "time_window": request.time_window,
+        "idle_timeout": request.idle_timeout,
+        "max_duration": request.max_duration
+    }
+    try:
+        if request.source == "file":
+            if not request.path:
+                raise ValueError("path is required for source=file")
+            if not os.path.isfile(resolve_capture_path(request.path)):
+                raise HTTPException(status_code=404, detail="Capture file not found")
+            payload["path"] = request.path
+        elif request.source == "socket":
+            if not request.address:
+                raise ValueError("address is required for source=socket")
+            parse_feed_address(request.address)
+            payload["address"] = request.address
+        else:
+            raise ValueError("source must be file or socket")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if MAX_LIVE_JOBS < 1:
+        raise HTTPException(status_code=409, detail="Live correlation needs JOB_WORKERS of at least 2")
+    async with _live_submit_lock:
+        active = await fetch_one(
+            "SELECT COUNT(*) AS n FROM jobs WHERE job_type = 'live_correlation' AND status IN ('queued', 'running')"
+        )
+        if active["n"] >= MAX_LIVE_JOBS:
+            raise HTTPException(
+                status_code=429,
+                detail=f"At most {MAX_LIVE_JOBS} live correlation jobs can run at once; cancel one first"
+            )
+        job = await job_queue.submit("live_correlation", payload, max_attempts=1)
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/api/jobs/{job['job_id']}"
+    }
+
+@router.post("/run")
+async def run_correlation(data: Dict[str, Any], wait: bool = True):
+    """
+    Run the full multi-factor correlation analysis on a session and save the result.
+    The analysis runs as a job; with wait=false the queued job is returned at once.
+    """
+    session_id = data.get("session_id")
+    if not session_id:
+        raise HTTPException(status_code=400, detail="session_id is required")
+
+    if not await fetch_one("SELECT 1 FROM packets WHERE session_id = ? LIMIT 1", (session_id,)):
+        raise HTTPException(status_code=404, detail="No packets found for this session")
+
+    job = await job_queue.submit("correlation", {
+        "session_id": session_id,
+        "analyst_notes": data.get('analyst_notes', '')
+    }, max_attempts=1)
+    if not wait:
+        return JSONResponse(status_code=202, content=job)
+    
+    job = await job_queue.wait(job["job_id"], timeout=REQUEST_WAIT_TIMEOUT)
+    if job["status"] not in FINISHED_STATUSES:
+        return JSONResponse(status_code=202, content=job)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=500, detail=job["error"] or "Correlation analysis failed")
+    return job["result"]
@@ -0,0 +1,127 @@
+import asyncio
+from typing import List, Optional
+
+from fastapi import APIRouter, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from backend.services.event_bus import Subscription, event_bus
+
+router = APIRouter(prefix="/api/events", tags=["Events"])
+
+# Idle streams get a keepalive this often so proxies keep them open
+HEARTBEAT_INTERVAL = 15.0
+# EventSource reconnect delay sent to clients
+RETRY_MS = 3000
+
+
+def _subscription(session_id: List[str], case_id: List[str], job_id: List[str], types: List[str]) -> Subscription:
+    return Subscription(session_ids=session_id, case_ids=case_id, job_ids=job_id, types=types)
+
+
+def _parse_event_id(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+async def _sse_stream(subscription: Subscription, last_event_id: Optional[int]):
+    # Registered only once the body is being sent, so a client gone before
+    # then never leaves a subscription behind
+    try:
+        event_bus.subscribe(subscription, last_event_id)
+        yield f"retry: {RETRY_MS}\n\n"
+        while True:
+            try:
+                event = await subscription.get(HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is None:
+                break
+            yield event.sse()
+    finally:
+        event_bus.unsubscribe(subscription)
+
+
+@router.get("/")
+async def stream_events(
+    session_id: List[str] = Query([]),
+    case_id: List[str] = Query([]),
+    job_id: List[str] = Query([]),
+    types: List[str] = Query([]),
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Server-Sent Events stream of job progress, new threat-intel matches and
+    saved analyses. Filters may repeat and are alternatives, e.g.
+    ?case_id=CASE-1A2B3C&session_id=PCAP-9F8E7D6C&types=analysis&types=threat_intel.
+    Reconnecting clients resume from Last-Event-ID while it is still in history.
+    """
+    return StreamingResponse(
+        _sse_stream(
+            _subscription(session_id, case_id, job_id, types),
+            _parse_event_id(last_event_id_header or last_event_id)
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.get("/stats")
+async def event_stats():
+    return event_bus.stats()
+
+
+@router.websocket("/ws")
+async def event_socket(
+    websocket: WebSocket,
+    session_id: List[str] = Query([]),
+    case_id: List[str] = Query([]),
+    job_id: List[str] = Query([]),
+    types: List[str] = Query([]),
+    last_event_id: Optional[str] = Query(None)
+):
+    """
+    The same stream over a WebSocket, one JSON event per text message. The
+    client's close is read alongside the sender, so an idle subscription is
+    dropped as soon as the client goes rather than at the next send.
+    """
+    await websocket.accept()
+    subscription = _subscription(session_id, case_id, job_id, types)
+    tasks = []
+    try:
+        event_bus.subscribe(subscription, _parse_event_id(last_event_id))
+        tasks = [
+            asyncio.ensure_future(_send_events(websocket, subscription)),
+            asyncio.ensure_future(_wait_for_close(websocket))
+        ]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        event_bus.unsubscribe(subscription)
+
+
+async def _send_events(websocket: WebSocket, subscription: Subscription):
+    while True:
+        try:
+            event = await subscription.get(HEARTBEAT_INTERVAL)
+        except asyncio.TimeoutError:
+            await websocket.send_text('{"type": "keepalive"}')
+            continue
+        if event is None:
+            await websocket.close()
+            return
+        await websocket.send_text(event.data)
+
+
+async def _wait_for_close(websocket: WebSocket):
+    """Discards client messages, which the stream doesn't use, until the client closes."""
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from backend.models.schemas import JobCreate
+from backend.services.job_queue import JOB_STATUSES, job_queue
+
+router = APIRouter(prefix="/api/jobs", tags=["Jobs"])
+
+@router.get("/")
+async def list_jobs(status: Optional[str] = None, job_type: Optional[str] = None, limit: int = 100):
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(JOB_STATUSES)}")
+    return await job_queue.list(status=status, job_type=job_type, limit=min(max(limit, 1), 1000))
+
+@router.get("/types")
+async def list_job_types():
+    return sorted(job_queue.handlers)
+
+@router.post("/", status_code=202)
+async def submit_job(request: JobCreate):
+    """
+    Queue any registered job type, e.g.
+    {"job_type": "correlation", "payload": {"session_id": "DEMO-1234ABCD"}}
+    """
+    try:
+        return await job_queue.submit(request.job_type, request.payload, max_attempts=request.max_attempts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = await job_queue.cancel(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,7 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+import codecs
+import json
+from backend.services.ioc_extractor import IOCExtractor
+from backend.services.job_queue import FINISHED_STATUSES, REQUEST_WAIT_TIMEOUT, JobContext, job_queue
 from backend.services.osint_engine import OSINTAnalyzer
+from backend.services.reputation_cache import reputation_cache
 
 router = APIRouter(prefix="/api/osint", tags=["osint"])
 osint_engine = OSINTAnalyzer()
@@ -9,23 +16,123 @@ osint_engine = OSINTAnalyzer()
 class AnalyzeRequest(BaseModel):
     indicator: str
 
+class BulkAnalyzeRequest(BaseModel):
+    indicators: List[str]
+
 class TextRequest(BaseModel):
     text: str
 
-@router.post("/analyze/indicator")
-async def analyze_indicator(request: AnalyzeRequest):
+# Largest indicator list accepted by /analyze/indicators
+MAX_BULK_INDICATORS = 1000
+# Bytes of an uploaded text file decoded and scanned at a time
+TEXT_CHUNK_SIZE = 1024 * 1024
+
+async def _analyze_indicator_job(ctx: JobContext):
+    indicator = ctx.payload["indicator"]
     try:
-        print(f"DEBUG: Analyzing indicator: {request.indicator}")
-        return osint_engine.analyze_indicator(request.indicator)
+        print(f"DEBUG: Analyzing indicator: {indicator}")
+        return await osint_engine.analyze_indicator(indicator)
     except Exception as e:
         import traceback
         error_msg = f"{str(e)}\n{traceback.format_exc()}"
         print(f"ERROR in analyze_indicator: {error_msg}")
-        raise HTTPException(status_code=500, detail=error_msg)
+        raise
+
+async def _analyze_indicators_job(ctx: JobContext):
+    indicators = ctx.payload["indicators"]
+    done = 0
+
+    def on_result(indicator, result):
+        nonlocal done
+        done += 1
+        ctx.progress(analyzed=done, total=len(indicators))
+
+    results = await osint_engine.analyze_indicators(indicators, on_result=on_result)
+    return {
+        "count": len(results),
+        "errors": sum(1 for r in results if "error" in r),
+        "results": results
+    }
+
+# Lookups are non-blocking and share the analyzer's HTTP clients, so they run on the server loop
+job_queue.register("osint", _analyze_indicator_job, on_event_loop=True)
+job_queue.register("osint_bulk", _analyze_indicators_job, on_event_loop=True)
+
+@router.post("/analyze/indicator")
+async def analyze_indicator(request: AnalyzeRequest, wait: bool = True):
+    # DNS, WHOIS and HTTP lookups run on the job workers; wait=false returns the queued job
+    job = await job_queue.submit("osint", {"indicator": request.indicator}, max_attempts=2)
+    if not wait:
+        return JSONResponse(status_code=202, content=job)
+    
+    job = await job_queue.wait(job["job_id"], timeout=REQUEST_WAIT_TIMEOUT)
+    if job["status"] not in FINISHED_STATUSES:
+        return JSONResponse(status_code=202, content=job)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=500, detail=job["error"] or "Indicator analysis failed")
+    return job["result"]
+
+@router.post("/analyze/indicators")
+async def analyze_indicators(request: BulkAnalyzeRequest, wait: bool = True):
+    """
+    Enrich up to MAX_BULK_INDICATORS indicators in parallel (IPs, domains,
+    URLs, onion addresses); duplicates are analyzed once.
+    """
+    if not request.indicators:
+        raise HTTPException(status_code=400, detail="No indicators provided")
+    if len(request.indicators) > MAX_BULK_INDICATORS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_INDICATORS} indicators per request")
+
+    job = await job_queue.submit("osint_bulk", {"indicators": request.indicators}, max_attempts=1)
+    if not wait:
+        return JSONResponse(status_code=202, content=job)
+
+    job = await job_queue.wait(job["job_id"], timeout=REQUEST_WAIT_TIMEOUT)
+    if job["status"] not in FINISHED_STATUSES:
+        return JSONResponse(status_code=202, content=job)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=500, detail=job["error"] or "Indicator analysis failed")
+    return job["result"]
+
+@router.get("/cache/stats")
+async def get_reputation_cache_stats():
+    # Hit/miss counters per provider plus table size; the count is a blocking read
+    return await run_in_threadpool(reputation_cache.stats)
 
 @router.post("/analyze/text")
 async def extract_from_text(request: TextRequest):
     try:
-        return osint_engine.extract_iocs(request.text)
+        return await run_in_threadpool(osint_engine.extract_iocs, request.text)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/analyze/text/stream")
+async def extract_from_upload(file: UploadFile = File(...)):
+    """
+    IOCs from an uploaded text file of any size (paste dumps, saved pages),
+    streamed back as NDJSON: an "iocs" line for each chunk that turned up
+    new indicators, with running counts, then a "summary" line.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    async def lines():
+        extractor = IOCExtractor()
+        read = 0
+        try:
+            while True:
+                chunk = await file.read(TEXT_CHUNK_SIZE)
+                if chunk:
+                    read += len(chunk)
+                    new = await run_in_threadpool(extractor.feed, decoder.decode(chunk))
+                else:
+                    extractor.feed(decoder.decode(b"", final=True))
+                    new = extractor.close()
+                if any(new.values()):
+                    yield json.dumps({"type": "iocs", **new, "bytes": read, "counts": extractor.counts()}) + "\n"
+                if not chunk:
+                    break
+        finally:
+            await file.close()
+        yield json.dumps({"type": "summary", "bytes": read, **extractor.counts()}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
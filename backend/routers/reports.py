@@ -1,28 +1,26 @@
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse
 from typing import List
 import os
-from backend.database import get_connection
+from backend.database import db_pool, fetch_all, fetch_one, get_connection
+from backend.services.job_queue import FINISHED_STATUSES, REQUEST_WAIT_TIMEOUT, PermanentJobError, job_queue
 from backend.services.report_generator import ForensicReportGenerator
 
 router = APIRouter(prefix="/api/reports", tags=["Forensic Reports"])
 
 @router.get("/")
 async def get_reports():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
+    return await fetch_all("""
         SELECT r.*, a.overall_confidence, a.status as analysis_status
         FROM reports r
         JOIN analyses a ON r.analysis_id = a.id
         ORDER BY r.created_at DESC
     """)
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
 
-@router.post("/generate/{case_id}")
-async def generate_report(case_id: str):
+def _generate_report(case_id: str) -> dict:
+    """
+    Renders the PDF for an analysis and records it. Runs as a "report" job.
+    """
     conn = get_connection()
     cursor = conn.cursor()
     
@@ -31,7 +29,7 @@ async def generate_report(case_id: str):
     
     if not analysis:
         conn.close()
-        raise HTTPException(status_code=404, detail="Analysis not found")
+        raise PermanentJobError("Analysis not found")
     
     analysis_dict = dict(analysis)
     
@@ -80,14 +78,30 @@ async def generate_report(case_id: str):
         "file_path": file_path
     }
 
+job_queue.register("report", lambda ctx: _generate_report(ctx.payload["case_id"]))
+
+@router.post("/generate/{case_id}")
+async def generate_report(case_id: str, wait: bool = True):
+    """
+    Generates the report as a job; with wait=false the queued job is returned at once.
+    """
+    if not await fetch_one("SELECT 1 FROM analyses WHERE case_id = ?", (case_id,)):
+        raise HTTPException(status_code=404, detail="Analysis not found")
+    
+    job = await job_queue.submit("report", {"case_id": case_id})
+    if not wait:
+        return JSONResponse(status_code=202, content=job)
+    
+    job = await job_queue.wait(job["job_id"], timeout=REQUEST_WAIT_TIMEOUT)
+    if job["status"] not in FINISHED_STATUSES:
+        return JSONResponse(status_code=202, content=job)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=500, detail=job["error"] or "Report generation failed")
+    return job["result"]
+
 @router.get("/download/{report_id}")
 async def download_report(report_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM reports WHERE id = ?", (report_id,))
-    report = cursor.fetchone()
-    conn.close()
+    report = await fetch_one("SELECT * FROM reports WHERE id = ?", (report_id,))
     
     if not report:
         raise HTTPException(status_code=404, detail="Report not found")
@@ -107,12 +121,7 @@ async def download_report(report_id: int):
 
 @router.get("/download-by-case/{case_id}")
 async def download_report_by_case(case_id: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM reports WHERE case_id = ? ORDER BY created_at DESC LIMIT 1", (case_id,))
-    report = cursor.fetchone()
-    conn.close()
+    report = await fetch_one("SELECT * FROM reports WHERE case_id = ? ORDER BY created_at DESC LIMIT 1", (case_id,))
     
     if not report:
         raise HTTPException(status_code=404, detail="No report found for this case")
@@ -132,22 +141,16 @@ async def download_report_by_case(case_id: str):
 
 @router.delete("/{report_id}")
 async def delete_report(report_id: int):
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT file_path FROM reports WHERE id = ?", (report_id,))
-    report = cursor.fetchone()
+    report = await fetch_one("SELECT file_path FROM reports WHERE id = ?", (report_id,))
     
     if not report:
-        conn.close()
         raise HTTPException(status_code=404, detail="Report not found")
     
     file_path = report['file_path']
     if os.path.exists(file_path):
         os.remove(file_path)
     
-    cursor.execute("DELETE FROM reports WHERE id = ?", (report_id,))
-    conn.commit()
-    conn.close()
+    async with db_pool.write() as conn:
+        await conn.execute("DELETE FROM reports WHERE id = ?", (report_id,))
     
     return {"message": f"Report {report_id} deleted"}
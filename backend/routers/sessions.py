@@ -1,44 +1,108 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from typing import AsyncIterator, List, Optional, Dict, Tuple
 from datetime import datetime
+import base64
+import hashlib
+import json
 import uuid
 import os
-from backend.database import get_connection
+import tempfile
+import aiosqlite
+import numpy as np
+from backend.database import (
+    db_pool, fetch_all, fetch_one, get_connection, insert_packets_async, packet_row, BulkWriter, PacketWriter,
+    build_packet_rollups, build_packet_rollups_async, DIRECTION_CODES, DIRECTION_NAMES, FLOW_COLUMNS, FLOW_FEATURE_COLUMNS,
+    ROLLUP_LEVELS_MS
+)
+from backend.services.cell_features import feature_row, unpack_bursts
+from backend.services.flow_table import flow_row
+from backend.services.column_store import SESSION_ID_PATTERN, ColumnStoreWriter, remove_session_columns, write_session_columns
+from backend.services.session_archive import (
+    ARCHIVE_FORMATS, archive_available, detect_format, export_session, iter_archive_rows, read_session_metadata
+)
 from backend.services.tor_simulator import generate_demo_traffic
 from backend.services.pcap_analyzer import PCAPAnalyzer
+from backend.services.job_queue import JobCancelled, JobContext, job_queue
+from backend.services.analysis_cache import analysis_cache
 
 router = APIRouter(prefix="/api/sessions", tags=["Traffic Sessions"])
 
 UPLOAD_DIR = "uploads"
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_PAGE_SIZE = 10000
+# Rows read per pool checkout while streaming; the reader is released between batches
+STREAM_BATCH_SIZE = 5000
+PACKET_COUNT_MODES = ("exact", "approximate", "none")
+MAX_TIMELINE_BUCKETS = 100000
+FLOW_SORT_COLUMNS = {"bytes": "bytes DESC", "packets": "packets DESC", "first_seen": "first_ts_us", "flow_id": "flow_id"}
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 @router.get("/")
 async def get_sessions():
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM traffic_sessions ORDER BY created_at DESC")
-    rows = cursor.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    return await fetch_all("SELECT * FROM traffic_sessions ORDER BY created_at DESC")
+
+def _encode_cursor(packet: Dict) -> str:
+    # Packets with unparseable timestamps have no ts_us; their key is ":<id>"
+    ts_us = "" if packet['ts_us'] is None else packet['ts_us']
+    return base64.urlsafe_b64encode(f"{ts_us}:{packet['id']}".encode()).decode()
+
+def _decode_cursor(cursor: str) -> Tuple[Optional[int], int]:
+    try:
+        ts_us, packet_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":")
+        return (int(ts_us) if ts_us else None), int(packet_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def _packet_page(conn: aiosqlite.Connection, session_id: str, after: Optional[Tuple[Optional[int], int]],
+                       limit: int, offset: int = 0) -> List[Dict]:
+    """
+    One page of packets in (ts_us, id) order. With `after` the page starts
+    past that key, which the (session_id, ts_us) index seeks to directly;
+    OFFSET is only kept for old clients. Packets without ts_us sort first
+    (SQLite orders NULLs low), so a key inside that run continues by id and
+    then on to every timestamped packet.
+    """
+    if after is not None and after[0] is None:
+        rows = await conn.execute_fetchall(
+            "SELECT * FROM packets WHERE session_id = ? AND (ts_us IS NOT NULL OR id > ?) ORDER BY ts_us, id LIMIT ?",
+            (session_id, after[1], limit)
+        )
+    elif after is not None:
+        rows = await conn.execute_fetchall(
+            "SELECT * FROM packets WHERE session_id = ? AND (ts_us, id) > (?, ?) ORDER BY ts_us, id LIMIT ?",
+            (session_id, after[0], after[1], limit)
+        )
+    else:
+        rows = await conn.execute_fetchall(
+            "SELECT * FROM packets WHERE session_id = ? ORDER BY ts_us, id LIMIT ? OFFSET ?",
+            (session_id, limit, offset)
+        )
+    return [dict(p) for p in rows]
 
 @router.get("/{session_id}")
-async def get_session(session_id: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM traffic_sessions WHERE session_id = ?", (session_id,))
-    row = cursor.fetchone()
+async def get_session(session_id: str, packet_limit: int = Query(1000, ge=0, le=MAX_PAGE_SIZE)):
+    """
+    Session metadata with its first `packet_limit` packets. Fetch the rest
+    from /packets with `next_cursor`, or all at once from /packets/stream.
+    """
+    async with db_pool.read() as conn:
+        async with conn.execute("SELECT * FROM traffic_sessions WHERE session_id = ?", (session_id,)) as cursor:
+            row = await cursor.fetchone()
+        
+        if not row:
+            raise HTTPException(status_code=404, detail="Session not found")
+        
+        session = dict(row)
+        
+        packets = await _packet_page(conn, session_id, None, packet_limit + 1)
     
-    if not row:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Session not found")
-    
-    session = dict(row)
-    
-    cursor.execute("SELECT * FROM packets WHERE session_id = ? ORDER BY timestamp", (session_id,))
-    packets = [dict(p) for p in cursor.fetchall()]
-    session['packets'] = packets
-    
-    conn.close()
+    has_more = len(packets) > packet_limit
+    session['packets'] = packets[:packet_limit]
+    session['packets_truncated'] = has_more
+    session['next_cursor'] = _encode_cursor(session['packets'][-1]) if has_more and packet_limit else None
     return session
 
 @router.post("/generate-demo")
@@ -48,34 +112,18 @@ async def generate_demo_session(packet_count: int = 100):
     
     packets = generate_demo_traffic(session_id, packet_count)
     
-    conn = get_connection()
-    cursor = conn.cursor()
-    
     start_time = packets[0]['timestamp'] if packets else datetime.now().isoformat()
     end_time = packets[-1]['timestamp'] if packets else datetime.now().isoformat()
     total_bytes = sum(p['size'] for p in packets)
+    column_store_path = await run_in_threadpool(write_session_columns, session_id, packets)
     
-    cursor.execute('''
-        INSERT INTO traffic_sessions (session_id, name, description, start_time, end_time, packet_count, total_bytes)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (session_id, session_name, "Auto-generated demo traffic session", start_time, end_time, len(packets), total_bytes))
-    
-    for packet in packets:
-        cursor.execute('''
-            INSERT INTO packets (session_id, timestamp, src_ip, dst_ip, protocol, size, direction)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            packet['session_id'],
-            packet['timestamp'],
-            packet['src_ip'],
-            packet['dst_ip'],
-            packet['protocol'],
-            packet['size'],
-            packet['direction']
-        ))
-    
-    conn.commit()
-    conn.close()
+    async with db_pool.write() as conn:
+        await conn.execute('''
+            INSERT INTO traffic_sessions (session_id, name, description, start_time, end_time, packet_count, total_bytes, column_store_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (session_id, session_name, "Auto-generated demo traffic session", start_time, end_time, len(packets), total_bytes, column_store_path))
+        await insert_packets_async(conn, packets)
+        await build_packet_rollups_async(conn, session_id)
     
     return {
         "message": "Demo session created",
@@ -83,98 +131,539 @@ async def generate_demo_session(packet_count: int = 100):
         "packet_count": len(packets)
     }
 
-@router.post("/upload-pcap")
-async def upload_pcap(file: UploadFile = File(...)):
-    if not file.filename.endswith(('.pcap', '.pcapng', '.cap')):
-        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a PCAP file.")
+def _ingest_pcap_job(ctx: JobContext) -> Dict:
+    """
+    Parses a spooled capture and streams it into the packets table.
+    Runs on the job queue's workers, never on the event loop.
+    """
+    file_path = ctx.payload["file_path"]
+    session_id = ctx.payload["session_id"]
     
-    session_id = f"PCAP-{uuid.uuid4().hex[:8].upper()}"
+    conn = get_connection()
+    cursor = conn.cursor()
     
-    file_path = os.path.join(UPLOAD_DIR, f"{session_id}_{file.filename}")
+    # A retried or restarted job starts from a clean slate
+    cursor.execute("DELETE FROM packets WHERE session_id = ?", (session_id,))
+    cursor.execute("DELETE FROM flows WHERE session_id = ?", (session_id,))
+    cursor.execute("DELETE FROM flow_features WHERE session_id = ?", (session_id,))
+    conn.commit()
     
-    content = await file.read()
-    with open(file_path, 'wb') as f:
-        f.write(content)
+    # Parsed batches go straight to the bulk writer and the session's column
+    # store, so the capture is never held in memory as a whole. Flows are
+    # written as the flow table closes them.
+    writer = PacketWriter(conn)
+    flow_writer = BulkWriter(conn, "flows", FLOW_COLUMNS)
+    feature_writer = BulkWriter(conn, "flow_features", FLOW_FEATURE_COLUMNS)
+    store = ColumnStoreWriter(session_id)
     
-    analyzer = PCAPAnalyzer()
-    result = analyzer.analyze_pcap(file_path, session_id)
+    def add_packets(packets):
+        rows = [packet_row(p) for p in packets]
+        writer.add_many(rows)
+        store.add_rows(rows)
     
-    conn = get_connection()
-    cursor = conn.cursor()
+    def add_flows(flows):
+        flow_writer.add_many(flow_row(session_id, flow) for flow in flows)
+        features = (feature_row(session_id, flow) for flow in flows)
+        feature_writer.add_many(row for row in features if row is not None)
     
-    packets = result.get('packets', [])
-    start_time = packets[0]['timestamp'] if packets else datetime.now().isoformat()
-    end_time = packets[-1]['timestamp'] if packets else datetime.now().isoformat()
+    def progress(packets, total_bytes):
+        ctx.progress(packets_ingested=packets, bytes_ingested=total_bytes)
+    
+    analyzer = PCAPAnalyzer()
+    try:
+        result = analyzer.ingest_pcap(file_path, session_id, add_packets, progress=progress, write_flows=add_flows)
+        writer.close()
+        flow_writer.close()
+        feature_writer.close()
+        column_store_path = store.close()
+        build_packet_rollups(conn, session_id)
+    except Exception as e:
+        conn.rollback()
+        store.abort()
+        cursor.execute("DELETE FROM packets WHERE session_id = ?", (session_id,))
+        cursor.execute("DELETE FROM flows WHERE session_id = ?", (session_id,))
+        cursor.execute("DELETE FROM flow_features WHERE session_id = ?", (session_id,))
+        cursor.execute("DELETE FROM packet_rollups WHERE session_id = ?", (session_id,))
+        if ctx.is_last_attempt or isinstance(e, JobCancelled):
+            cursor.execute("DELETE FROM traffic_sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+        conn.close()
+        raise
+    
+    start_time = result.get('start_time') or datetime.now().isoformat()
+    end_time = result.get('end_time') or datetime.now().isoformat()
     
     cursor.execute('''
-        INSERT INTO traffic_sessions (session_id, name, description, start_time, end_time, packet_count, total_bytes)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        UPDATE traffic_sessions
+        SET description = ?, start_time = ?, end_time = ?, packet_count = ?, total_bytes = ?, column_store_path = ?
+        WHERE session_id = ?
     ''', (
-        session_id,
-        f"PCAP Upload: {file.filename}",
         result.get('analysis_notes', 'Uploaded PCAP file'),
         start_time,
         end_time,
         result.get('packet_count', 0),
-        result.get('total_bytes', 0)
+        result.get('total_bytes', 0),
+        column_store_path,
+        session_id
     ))
     
-    for packet in packets:
-        cursor.execute('''
-            INSERT INTO packets (session_id, timestamp, src_ip, dst_ip, protocol, size, direction)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            packet['session_id'],
-            packet['timestamp'],
-            packet['src_ip'],
-            packet['dst_ip'],
-            packet['protocol'],
-            packet['size'],
-            packet['direction']
-        ))
-    
     conn.commit()
     conn.close()
+    ctx.progress(packets_ingested=result.get('packet_count', 0), bytes_ingested=result.get('total_bytes', 0))
     
     return {
-        "message": "PCAP file processed",
         "session_id": session_id,
         "packet_count": result.get('packet_count', 0),
         "protocol_distribution": result.get('protocol_distribution', {}),
-        "burst_count": result.get('burst_count', 0)
+        "burst_count": result.get('burst_count', 0),
+        "flow_count": result.get('flow_count', 0)
     }
 
-@router.get("/{session_id}/packets")
-async def get_session_packets(session_id: str, limit: int = 500, offset: int = 0):
+job_queue.register("pcap_ingest", _ingest_pcap_job)
+
+async def _spool_upload(file: UploadFile, file_path: str) -> Tuple[int, str]:
+    """Spools an upload to disk chunk by chunk, hashing as it streams."""
+    sha256 = hashlib.sha256()
+    file_size = 0
+    with open(file_path, 'wb') as f:
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            sha256.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+            file_size += len(chunk)
+    await file.close()
+    return file_size, sha256.hexdigest()
+
+@router.post("/upload-pcap", status_code=202)
+async def upload_pcap(file: UploadFile = File(...)):
+    if not file.filename.endswith(('.pcap', '.pcapng', '.cap')):
+        raise HTTPException(status_code=400, detail="Invalid file type. Please upload a PCAP file.")
+    
+    session_id = f"PCAP-{uuid.uuid4().hex[:8].upper()}"
+    
+    file_path = os.path.join(UPLOAD_DIR, f"{session_id}_{os.path.basename(file.filename)}")
+    file_size, sha256 = await _spool_upload(file, file_path)
+    
+    now = datetime.now().isoformat()
+    async with db_pool.write() as conn:
+        await conn.execute('''
+            INSERT INTO traffic_sessions (session_id, name, description, start_time, end_time, packet_count, total_bytes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (session_id, f"PCAP Upload: {file.filename}", "PCAP ingest in progress", now, now, 0, 0))
+    
+    job = await job_queue.submit("pcap_ingest", {
+        "file_path": file_path,
+        "session_id": session_id,
+        "filename": file.filename,
+        "file_size": file_size,
+        "sha256": sha256
+    }, max_attempts=2)
+    
+    return {
+        "message": "PCAP upload accepted",
+        "job_id": job["job_id"],
+        "session_id": session_id,
+        "file_size": file_size,
+        "sha256": job["payload"]["sha256"],
+        "status_url": f"/api/sessions/upload-jobs/{job['job_id']}"
+    }
+
+def _import_session_job(ctx: JobContext) -> Dict:
+    """
+    Loads a Parquet or Arrow session archive into the placeholder session
+    created by /import, batch by batch, exactly like PCAP ingest.
+    """
+    file_path = ctx.payload["file_path"]
+    session_id = ctx.payload["session_id"]
+    
     conn = get_connection()
-    cursor = conn.cursor()
+    conn.execute("DELETE FROM packets WHERE session_id = ?", (session_id,))
+    # Archives carry packet flow ids but not the flow table itself
+    conn.execute("DELETE FROM flows WHERE session_id = ?", (session_id,))
+    conn.execute("DELETE FROM flow_features WHERE session_id = ?", (session_id,))
+    conn.commit()
+    
+    writer = PacketWriter(conn)
+    store = ColumnStoreWriter(session_id)
+    packet_count = total_bytes = 0
+    first_ts = last_ts = None
+    try:
+        for rows in iter_archive_rows(file_path, ctx.payload["format"], session_id):
+            writer.add_many(rows)
+            store.add_rows(rows)
+            packet_count += len(rows)
+            total_bytes += sum(row[5] for row in rows)
+            if first_ts is None:
+                first_ts = rows[0][1]
+            last_ts = rows[-1][1]
+            ctx.progress(packets_imported=packet_count, bytes_imported=total_bytes)
+        writer.close()
+        column_store_path = store.close()
+        build_packet_rollups(conn, session_id)
+        
+        session = ctx.payload.get("session", {})
+        conn.execute('''
+            UPDATE traffic_sessions
+            SET description = ?, start_time = ?, end_time = ?, packet_count = ?, total_bytes = ?, column_store_path = ?
+            WHERE session_id = ?
+        ''', (
+            session.get("description") or f"Imported from {ctx.payload['filename']}",
+            session.get("start_time") or first_ts or datetime.now().isoformat(),
+            session.get("end_time") or last_ts or datetime.now().isoformat(),
+            packet_count,
+            total_bytes,
+            column_store_path,
+            session_id
+        ))
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        store.abort()
+        conn.execute("DELETE FROM packets WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM packet_rollups WHERE session_id = ?", (session_id,))
+        if ctx.is_last_attempt or isinstance(e, JobCancelled):
+            conn.execute("DELETE FROM traffic_sessions WHERE session_id = ?", (session_id,))
+        conn.commit()
+        raise
+    finally:
+        conn.close()
+    
+    return {"session_id": session_id, "packet_count": packet_count, "total_bytes": total_bytes}
+
+job_queue.register("session_import", _import_session_job)
+
+def _require_archive_support():
+    if not archive_available():
+        raise HTTPException(status_code=501, detail="Session archives need pyarrow, which is not installed")
+
+@router.post("/import", status_code=202)
+async def import_session(file: UploadFile = File(...)):
+    """
+    Import a session exported by /{session_id}/export (Parquet or Arrow IPC).
+    The original session ID is kept unless it is malformed or already taken,
+    in which case the import gets a fresh one. Loading runs
+    as a "session_import" job; poll status_url.
+    """
+    _require_archive_support()
+    
+    spool_id = f"IMPORT-{uuid.uuid4().hex[:8].upper()}"
+    file_path = os.path.join(UPLOAD_DIR, f"{spool_id}_{os.path.basename(file.filename)}")
+    file_size, sha256 = await _spool_upload(file, file_path)
+    
+    fmt = await run_in_threadpool(detect_format, file_path)
+    if fmt is None:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail="Not a Parquet or Arrow IPC file")
+    try:
+        session = await run_in_threadpool(read_session_metadata, file_path, fmt)
+    except Exception as e:
+        os.remove(file_path)
+        raise HTTPException(status_code=400, detail=f"Unreadable archive: {e}")
+    
+    # The archive's metadata is untrusted: its ID names the column store directory
+    session_id = session.get("session_id")
+    if not isinstance(session_id, str) or not SESSION_ID_PATTERN.fullmatch(session_id):
+        session_id = spool_id
+    
+    now = datetime.now().isoformat()
+    async with db_pool.write() as conn:
+        # Checked under the write lock so concurrent imports of one archive can't both claim its ID
+        if await conn.execute_fetchall("SELECT 1 FROM traffic_sessions WHERE session_id = ?", (session_id,)):
+            session_id = spool_id
+        await conn.execute('''
+            INSERT INTO traffic_sessions (session_id, name, description, start_time, end_time, packet_count, total_bytes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (session_id, session.get("name") or f"Import: {file.filename}", "Session import in progress", now, now, 0, 0))
+    
+    job = await job_queue.submit("session_import", {
+        "file_path": file_path,
+        "format": fmt,
+        "session_id": session_id,
+        "session": session,
+        "filename": file.filename,
+        "file_size": file_size,
+        "sha256": sha256
+    }, max_attempts=2)
+    
+    return {
+        "message": "Session import accepted",
+        "job_id": job["job_id"],
+        "session_id": session_id,
+        "format": fmt,
+        "file_size": file_size,
+        "status_url": f"/api/jobs/{job['job_id']}"
+    }
+
+def _export_archive(session_id: str, path: str, fmt: str) -> Optional[int]:
+    conn = get_connection()
+    try:
+        return export_session(conn, session_id, path, fmt)
+    finally:
+        conn.close()
+
+@router.get("/{session_id}/export")
+async def export_session_archive(session_id: str, format: str = Query("parquet", description="parquet or arrow")):
+    """
+    Download the session and its packets as Parquet or an Arrow IPC file,
+    for notebooks or another instance's /import.
+    """
+    _require_archive_support()
+    if format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(ARCHIVE_FORMATS)}")
+    spec = ARCHIVE_FORMATS[format]
     
-    cursor.execute("SELECT COUNT(*) as total FROM packets WHERE session_id = ?", (session_id,))
-    total = cursor.fetchone()['total']
+    fd, path = tempfile.mkstemp(suffix=spec["extension"], dir=UPLOAD_DIR)
+    os.close(fd)
+    try:
+        written = await run_in_threadpool(_export_archive, session_id, path, format)
+    except Exception:
+        os.remove(path)
+        raise
+    if written is None:
+        os.remove(path)
+        raise HTTPException(status_code=404, detail="Session not found")
     
-    cursor.execute(
-        "SELECT * FROM packets WHERE session_id = ? ORDER BY timestamp LIMIT ? OFFSET ?",
-        (session_id, limit, offset)
+    return FileResponse(
+        path,
+        media_type=spec["media_type"],
+        filename=f"{session_id}{spec['extension']}",
+        background=BackgroundTask(os.remove, path)
     )
-    packets = [dict(p) for p in cursor.fetchall()]
-    conn.close()
+
+@router.get("/upload-jobs/{job_id}")
+async def get_upload_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if not job or job["job_type"] != "pcap_ingest":
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    
+    # Flat shape kept from the in-memory upload tracker
+    status = {k: v for k, v in job.items() if k not in ("payload", "progress")}
+    status.update({k: job["payload"].get(k) for k in ("session_id", "filename", "file_size", "sha256")})
+    status["packets_ingested"] = job["progress"].get("packets_ingested", 0)
+    status["bytes_ingested"] = job["progress"].get("bytes_ingested", 0)
+    elapsed = job.get("elapsed_seconds")
+    if elapsed:
+        status["packets_per_second"] = round(status["packets_ingested"] / elapsed, 1)
+        status["bytes_per_second"] = round(status["bytes_ingested"] / elapsed, 1)
+    return status
+
+@router.get("/{session_id}/packets")
+async def get_session_packets(
+    session_id: str,
+    limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    offset: int = Query(0, ge=0, description="Deprecated; use cursor"),
+    count: str = Query("approximate", description="exact, approximate (stored packet_count) or none")
+):
+    if count not in PACKET_COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"count must be one of {', '.join(PACKET_COUNT_MODES)}")
+    after = _decode_cursor(cursor) if cursor else None
+    
+    async with db_pool.read() as conn:
+        total = None
+        if count == "exact":
+            async with conn.execute("SELECT COUNT(*) as total FROM packets WHERE session_id = ?", (session_id,)) as rows:
+                total = (await rows.fetchone())['total']
+        elif count == "approximate":
+            async with conn.execute("SELECT packet_count FROM traffic_sessions WHERE session_id = ?", (session_id,)) as rows:
+                row = await rows.fetchone()
+                total = row['packet_count'] if row else 0
+        
+        # One extra row tells whether another page follows
+        packets = await _packet_page(conn, session_id, after, limit + 1, offset)
     
+    has_more = len(packets) > limit
+    packets = packets[:limit]
     return {
         "total": total,
+        "count_mode": count,
         "limit": limit,
         "offset": offset,
+        "next_cursor": _encode_cursor(packets[-1]) if has_more else None,
         "packets": packets
     }
 
+@router.get("/{session_id}/flows")
+async def get_session_flows(
+    session_id: str,
+    limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    sort: str = Query("bytes", description="bytes, packets, first_seen or flow_id")
+):
+    """
+    The session's reassembled 5-tuple flows, largest first by default. TLS
+    flows include their Tor cell features; bursts are signed cell counts,
+    positive for outbound.
+    """
+    if sort not in FLOW_SORT_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(FLOW_SORT_COLUMNS)}")
+
+    async with db_pool.read() as conn:
+        async with conn.execute("SELECT packet_count FROM traffic_sessions WHERE session_id = ?", (session_id,)) as rows:
+            if await rows.fetchone() is None:
+                raise HTTPException(status_code=404, detail="Session not found")
+        async with conn.execute("SELECT COUNT(*) as total FROM flows WHERE session_id = ?", (session_id,)) as rows:
+            total = (await rows.fetchone())['total']
+        rows = await conn.execute_fetchall(f'''
+            SELECT f.*, x.records_out, x.records_in, x.cell_records_out, x.cell_records_in,
+                   x.cells_out, x.cells_in, x.bursts
+            FROM flows f LEFT JOIN flow_features x ON x.session_id = f.session_id AND x.flow_id = f.flow_id
+            WHERE f.session_id = ? ORDER BY f.{FLOW_SORT_COLUMNS[sort]}, f.flow_id LIMIT ? OFFSET ?
+        ''', (session_id, limit, offset))
+
+    flows = []
+    for row in rows:
+        flow = {column: row[column] for column in FLOW_COLUMNS}
+        flow["cell_features"] = None if row["records_out"] is None else {
+            "records_out": row["records_out"],
+            "records_in": row["records_in"],
+            "cell_records_out": row["cell_records_out"],
+            "cell_records_in": row["cell_records_in"],
+            "cells_out": row["cells_out"],
+            "cells_in": row["cells_in"],
+            "bursts": unpack_bursts(row["bursts"]),
+        }
+        flows.append(flow)
+    return {"total": total, "limit": limit, "offset": offset, "flows": flows}
+
+@router.get("/{session_id}/timeline")
+async def get_session_timeline(
+    session_id: str,
+    bucket_ms: int = Query(1000, ge=1, le=3600000, description="Bucket width, 1 ms to 1 h"),
+    start_us: Optional[int] = Query(None, description="Window start, epoch microseconds"),
+    end_us: Optional[int] = Query(None, description="Window end (exclusive), epoch microseconds")
+):
+    """
+    Packets and bytes per time bucket, split by direction and protocol, as
+    parallel columns indexed like start_us. Widths that are a multiple of a rollup level are summed from the
+    session's packet_rollups; other widths group the packets table. A window
+    is widened to whole buckets.
+    """
+    if not await fetch_one("SELECT 1 FROM traffic_sessions WHERE session_id = ?", (session_id,)):
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    bucket_us = bucket_ms * 1000
+    first = start_us // bucket_us if start_us is not None else None
+    last = -(-end_us // bucket_us) if end_us is not None else None
+    if first is not None and last is not None and last - first > MAX_TIMELINE_BUCKETS:
+        raise HTTPException(status_code=400, detail=f"Window spans more than {MAX_TIMELINE_BUCKETS} buckets")
+    
+    level = next((lv for lv in reversed(ROLLUP_LEVELS_MS) if lv <= bucket_ms and bucket_ms % lv == 0), None)
+    async with db_pool.read() as conn:
+        if first is None or last is None:
+            # Size an open window from the session's extent (an index lookup)
+            # before grouping anything
+            lo, hi = (await conn.execute_fetchall(
+                "SELECT MIN(ts_us), MAX(ts_us) FROM packets WHERE session_id = ? AND ts_us IS NOT NULL", (session_id,)
+            ))[0]
+            if lo is not None:
+                span_first = lo // bucket_us if first is None else max(first, lo // bucket_us)
+                span_last = hi // bucket_us + 1 if last is None else min(last, hi // bucket_us + 1)
+                if span_last - span_first > MAX_TIMELINE_BUCKETS:
+                    raise HTTPException(status_code=400, detail=f"Timeline spans more than {MAX_TIMELINE_BUCKETS} buckets; use a wider bucket or a window")
+        if level is not None and await conn.execute_fetchall(
+            "SELECT 1 FROM packet_rollups WHERE session_id = ? AND level_ms = ? LIMIT 1", (session_id, level)
+        ):
+            ratio = bucket_ms // level
+            query = '''
+                SELECT bucket / ? AS b, direction_code, protocol, SUM(packets), SUM(bytes)
+                FROM packet_rollups WHERE session_id = ? AND level_ms = ?
+            '''
+            params: List = [ratio, session_id, level]
+            if first is not None:
+                query += " AND bucket >= ?"
+                params.append(first * ratio)
+            if last is not None:
+                query += " AND bucket < ?"
+                params.append(last * ratio)
+            source = f"rollup:{level}ms"
+        else:
+            query = '''
+                SELECT ts_us / ? AS b, IFNULL(direction_code, ?), protocol, COUNT(*), SUM(size)
+                FROM packets WHERE session_id = ? AND ts_us IS NOT NULL
+            '''
+            params = [bucket_us, DIRECTION_CODES["unknown"], session_id]
+            if first is not None:
+                query += " AND ts_us >= ?"
+                params.append(first * bucket_us)
+            if last is not None:
+                query += " AND ts_us < ?"
+                params.append(last * bucket_us)
+            source = "packets"
+        rows = await conn.execute_fetchall(query + " GROUP BY 1, 2, 3 ORDER BY 1", params)
+    
+    if not rows:
+        return {"session_id": session_id, "bucket_ms": bucket_ms, "source": source, "start_us": [],
+                "packets": [], "bytes": [], "by_direction": {}, "by_protocol": {}}
+    
+    # Rows are (bucket, direction, protocol) groups; fold them into one dense
+    # column per series so the payload stays O(buckets).
+    b, direction_code, protocol, packets, size = zip(*rows)
+    starts, index = np.unique(np.array(b, dtype=np.int64), return_inverse=True)
+    packets = np.array(packets, dtype=np.int64)
+    size = np.array(size, dtype=np.int64)
+    
+    def series(mask=None) -> Dict[str, List[int]]:
+        return {
+            "packets": np.bincount(index, weights=packets if mask is None else packets * mask, minlength=len(starts)).astype(np.int64).tolist(),
+            "bytes": np.bincount(index, weights=size if mask is None else size * mask, minlength=len(starts)).astype(np.int64).tolist()
+        }
+    
+    directions = np.array(direction_code)
+    protocols = np.array(protocol, dtype=object)
+    totals = series()
+    # JSONResponse skips the per-element jsonable_encoder pass over these lists
+    return JSONResponse({
+        "session_id": session_id,
+        "bucket_ms": bucket_ms,
+        "source": source,
+        "start_us": (starts * bucket_us).tolist(),
+        "packets": totals["packets"],
+        "bytes": totals["bytes"],
+        "by_direction": {DIRECTION_NAMES.get(int(code), "unknown"): series(directions == code) for code in np.unique(directions)},
+        "by_protocol": {name: series(protocols == name) for name in sorted(set(protocol))}
+    })
+
+async def _stream_packets(session_id: str) -> AsyncIterator[bytes]:
+    after = None
+    while True:
+        async with db_pool.read() as conn:
+            packets = await _packet_page(conn, session_id, after, STREAM_BATCH_SIZE)
+        if not packets:
+            return
+        yield "".join(json.dumps(p) + "\n" for p in packets).encode()
+        if len(packets) < STREAM_BATCH_SIZE:
+            return
+        after = (packets[-1]['ts_us'], packets[-1]['id'])
+
+@router.get("/{session_id}/packets/stream")
+async def stream_session_packets(session_id: str):
+    """
+    Every packet of the session as newline-delimited JSON, in (ts_us, id)
+    order, read and sent in batches so memory use stays flat.
+    """
+    if not await fetch_one("SELECT 1 FROM traffic_sessions WHERE session_id = ?", (session_id,)):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return StreamingResponse(
+        _stream_packets(session_id),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{session_id}_packets.ndjson"'}
+    )
+
 @router.delete("/{session_id}")
 async def delete_session(session_id: str):
-    conn = get_connection()
-    cursor = conn.cursor()
+    if not SESSION_ID_PATTERN.fullmatch(session_id):
+        raise HTTPException(status_code=400, detail="Invalid session ID")
+    async with db_pool.write() as conn:
+        await conn.execute("DELETE FROM packets WHERE session_id = ?", (session_id,))
+        await conn.execute("DELETE FROM packet_rollups WHERE session_id = ?", (session_id,))
+        await conn.execute("DELETE FROM flows WHERE session_id = ?", (session_id,))
+        await conn.execute("DELETE FROM flow_features WHERE session_id = ?", (session_id,))
+        await conn.execute("DELETE FROM traffic_sessions WHERE session_id = ?", (session_id,))
+    await run_in_threadpool(remove_session_columns, session_id)
     
-    cursor.execute("DELETE FROM packets WHERE session_id = ?", (session_id,))
-    cursor.execute("DELETE FROM traffic_sessions WHERE session_id = ?", (session_id,))
-    
-    conn.commit()
-    conn.close()
+    analysis_cache.invalidate(session_id)
     
     return {"message": f"Session {session_id} deleted"}
@@ -1,34 +1,25 @@
 from fastapi import APIRouter
-from backend.database import get_connection
+from backend.database import db_pool, read_stats_counters
+from backend.services.stats_cache import stats_cache
 
 router = APIRouter(prefix="/api/stats", tags=["System Statistics"])
 
 @router.get("")
 async def get_system_stats():
-    conn = get_connection()
-    cursor = conn.cursor()
+    cached = stats_cache.get("system")
+    if cached is not None:
+        return cached
     
-    # Total Nodes
-    cursor.execute("SELECT COUNT(*) FROM tor_nodes")
-    total_nodes = cursor.fetchone()[0]
+    # Row counts come from the trigger-maintained stats_counters table
+    async with db_pool.read() as conn:
+        counters = await read_stats_counters(conn)
     
-    # Total Sessions
-    cursor.execute("SELECT COUNT(*) FROM traffic_sessions")
-    total_sessions = cursor.fetchone()[0]
-    
-    # Total Analyses
-    cursor.execute("SELECT COUNT(*) FROM analyses")
-    total_analyses = cursor.fetchone()[0]
-    
-    # Completed Analyses
-    cursor.execute("SELECT COUNT(*) FROM analyses WHERE status = 'completed'")
-    completed_analyses = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    return {
-        "total_nodes": total_nodes,
-        "total_sessions": total_sessions,
-        "total_analyses": total_analyses,
-        "completed_analyses": completed_analyses
+    tables = counters.get("table", {})
+    stats = {
+        "total_nodes": tables.get("tor_nodes", 0),
+        "total_sessions": tables.get("traffic_sessions", 0),
+        "total_analyses": tables.get("analyses", 0),
+        "completed_analyses": counters.get("analysis_status", {}).get("completed", 0)
     }
+    stats_cache.put("system", stats)
+    return stats
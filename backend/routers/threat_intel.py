@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from typing import List, Dict, Any
-from backend.database import get_connection
+from fastapi import APIRouter, Depends, HTTPException
+from typing import List, Dict, Any, Optional
+from backend.database import db_pool, fetch_all, get_connection
 from backend.models.schemas import ThreatIntel as ThreatIntelSchema
-from backend.services.osint_scanner import OSINTScanner
+from backend.services.event_bus import event_bus
+from backend.services.job_queue import JobContext, job_queue
+from backend.services.osint_scanner import OSINTScanner, ScannerService, scanner_service
+import asyncio
 import json
+import os
+import re
 import sqlite3
 
 router = APIRouter(prefix="/api/threat-intel", tags=["Threat Intelligence"])
@@ -15,9 +20,59 @@ def get_db():
     finally:
         conn.close()
 
-async def background_scan(case_id: str, indicators: List[str]):
+def get_scanner_service() -> ScannerService:
+    if not scanner_service.running:
+        raise HTTPException(status_code=503, detail="Scanner service is not running")
+    return scanner_service
+
+# Indicators looked up at once; provider token buckets set the actual pace
+SCAN_CONCURRENCY = int(os.getenv("OSINT_SCAN_CONCURRENCY", "16"))
+# Matches are written in one transaction per this many results
+SCAN_WRITE_BATCH = 50
+
+INSERT_MATCH_SQL = '''
+    INSERT INTO threat_intel (case_id, indicator, type, category, confidence, source, severity, raw_data)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+IPV4_PATTERN = re.compile(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$")
+
+async def _scan_indicator(scanner: OSINTScanner, indicator: str) -> Dict[str, Any]:
+    print(f"DEBUG: Processing indicator: {indicator}")
+    try:
+        # Determine type
+        if len(indicator) > 30:
+            # Likely a Hash
+            result = await scanner.scan_hash(indicator)
+        else:
+            # Default to IP/Domain/Text (Demo Mode handles all strings)
+            # We don't enforce strict IP regex so "google.com" or "test" also works
+            result = await scanner.scan_ip(indicator)
+
+            # Adjust type if it doesn't look like an IP
+            if result and not IPV4_PATTERN.match(indicator):
+                result["type"] = "Domain/Text"
+    except Exception as e:
+        result = {"error": f"Scan failed: {e}"}
+
+    # Handle error case
+    if result and "error" in result:
+        result["indicator"] = indicator
+        result["type"] = "Unknown"
+        result["category"] = "Error"
+        result["confidence"] = 0
+        result["source"] = "System"
+        result["severity"] = "High"
+        result["raw_data"] = {"error": result["error"]}
+    return result
+
+async def background_scan(case_id: str, indicators: List[str], scanner: Optional[OSINTScanner] = None,
+                          ctx: Optional[JobContext] = None) -> Dict[str, int]:
     """
-    Background task to scan indicators and save to DB.
+    Scans a case's indicators SCAN_CONCURRENCY at a time and saves the
+    matches in batches. Lookups against live providers are paced by the
+    shared per-provider token buckets in osint_scanner. Without a scanner
+    (scripts) a private one is created and closed afterwards.
     """
     try:
         with open("backend_debug.log", "a") as f:
@@ -25,46 +80,22 @@ async def background_scan(case_id: str, indicators: List[str]):
     except:
         pass
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Instantiate scanner locally to ensure correct event loop binding
-    scanner = OSINTScanner()
-    
-    try:
-        for indicator in indicators:
-            print(f"DEBUG: Processing indicator: {indicator}")
-
-            result = {}
-            # Determine type
-            if len(indicator) > 30:
-                 # Likely a Hash
-                 result = await scanner.scan_hash(indicator)
-            else:
-                 # Default to IP/Domain/Text (Demo Mode handles all strings)
-                 # We don't enforce strict IP regex so "google.com" or "test" also works
-                 result = await scanner.scan_ip(indicator)
-                 
-                 # Adjust type if it doesn't look like an IP
-                 import re
-                 if not re.match(r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$", indicator):
-                     result["type"] = "Domain/Text"
-            
-            if result:
-                # Handle error case
-                if "error" in result:
-                    result["indicator"] = indicator
-                    result["type"] = "Unknown"
-                    result["category"] = "Error"
-                    result["confidence"] = 0
-                    result["source"] = "System"
-                    result["severity"] = "High"
-                    result["raw_data"] = {"error": result["error"]}
-
-                cursor.execute('''
-                    INSERT INTO threat_intel (case_id, indicator, type, category, confidence, source, severity, raw_data)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
+    own_scanner = scanner is None
+    if own_scanner:
+        scanner = OSINTScanner()
+    semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
+    counts = {"total": len(indicators), "scanned": 0, "stored": 0, "errors": 0}
+    pending: List[Dict[str, Any]] = []
+
+    async def flush():
+        if not pending:
+            return
+        batch = pending[:]
+        pending.clear()
+        stored = []
+        async with db_pool.write() as conn:
+            for result in batch:
+                cursor = await conn.execute(INSERT_MATCH_SQL, (
                     case_id,
                     result.get("indicator"),
                     result.get("type"),
@@ -74,19 +105,62 @@ async def background_scan(case_id: str, indicators: List[str]):
                     result.get("severity"),
                     json.dumps(result.get("raw_data"))
                 ))
-                conn.commit()
-    except Exception as e:
+                stored.append((cursor.lastrowid, result))
+        counts["stored"] += len(stored)
+        for match_id, result in stored:
+            event_bus.publish("threat_intel.match", {
+                "id": match_id,
+                "indicator": result.get("indicator"),
+                "type": result.get("type"),
+                "category": result.get("category"),
+                "confidence": result.get("confidence"),
+                "source": result.get("source"),
+                "severity": result.get("severity")
+            }, case_id=case_id)
+
+    async def scan(indicator: str):
+        async with semaphore:
+            result = await _scan_indicator(scanner, indicator)
+        counts["scanned"] += 1
+        if result:
+            if "error" in result:
+                counts["errors"] += 1
+            pending.append(result)
+            if len(pending) >= SCAN_WRITE_BATCH:
+                await flush()
+        if ctx is not None:
+            ctx.progress(**counts)
+
+    tasks = [asyncio.ensure_future(scan(indicator)) for indicator in indicators]
+    try:
+        await asyncio.gather(*tasks)
+        await flush()
+    except BaseException as e:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await flush()
         try:
             with open("backend_debug.log", "a") as f:
                 f.write(f"ERROR: Background scan failed: {e}\n")
         except:
             pass
+        raise
     finally:
-        await scanner.close()
-        conn.close()
+        if own_scanner:
+            await scanner.close()
+    return counts
+
+async def _threat_scan_job(ctx: JobContext):
+    # Runs on the server loop, which owns the shared scanner's pooled client
+    counts = await background_scan(ctx.payload["case_id"], ctx.payload["indicators"], scanner_service.scanner, ctx)
+    return {"case_id": ctx.payload["case_id"], "count": len(ctx.payload["indicators"]), **counts}
+
+job_queue.register("threat_scan", _threat_scan_job, on_event_loop=True)
 
 @router.post("/scan/{case_id}")
-async def trigger_scan(case_id: str, background_tasks: BackgroundTasks, payload: Dict[str, List[str]]):
+async def trigger_scan(case_id: str, payload: Dict[str, List[str]],
+                       service: ScannerService = Depends(get_scanner_service)):
     """
     Triggers an OSINT scan for a list of indicators in a case.
     Payload: {"indicators": ["1.1.1.1", "bad_hash"]}
@@ -95,16 +169,17 @@ async def trigger_scan(case_id: str, background_tasks: BackgroundTasks, payload:
     if not indicators:
         raise HTTPException(status_code=400, detail="No indicators provided")
     
-    background_tasks.add_task(background_scan, case_id, indicators)
-    return {"status": "Scan initiated", "count": len(indicators)}
+    job = await job_queue.submit("threat_scan", {"case_id": case_id, "indicators": indicators}, max_attempts=1)
+    return {"status": "Scan initiated", "count": len(indicators), "job_id": job["job_id"]}
+
+@router.get("/scanner/stats")
+async def scanner_stats(service: ScannerService = Depends(get_scanner_service)):
+    """Connection pool settings and reuse of the shared scanner's client."""
+    return service.stats()
 
 @router.get("/matches/{case_id}", response_model=List[ThreatIntelSchema])
-def get_matches(case_id: str):
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM threat_intel WHERE case_id = ?", (case_id,))
-    rows = cursor.fetchall()
+async def get_matches(case_id: str):
+    rows = await fetch_all("SELECT * FROM threat_intel WHERE case_id = ?", (case_id,))
     
     results = []
     for row in rows:
@@ -120,5 +195,4 @@ def get_matches(case_id: str):
             raw_data=row["raw_data"]
         ))
     
-    conn.close()
     return results
@@ -4,6 +4,8 @@ import pandas as pd
 import numpy as np
 from typing import List, Dict, Any
 
+from backend.services.packet_columns import PacketColumns, PacketSet, as_columns
+
 class SecurityAnalystAI:
     """
     A Hybrid AI Engine:
@@ -23,10 +25,13 @@ class SecurityAnalystAI:
             except Exception as e:
                 print(f"Failed to initialize OpenAI: {e}")
 
-    def analyze_session(self, packets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def analyze_session(self, packets: PacketSet) -> Dict[str, Any]:
         """
         Runs the full analysis pipeline: Statistical + LLM (if available).
+        Accepts packet dicts or a PacketColumns loaded straight from the database.
         """
+        packets = as_columns(packets)
+        
         # 1. Run Statistical Analysis (Deterministic)
         stats_insights = self._run_statistical_analysis(packets)
         
@@ -45,51 +50,45 @@ class SecurityAnalystAI:
             "source": "Statistical Only"
         }
 
-    def _run_statistical_analysis(self, packets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _run_statistical_analysis(self, packets: PacketColumns) -> List[Dict[str, Any]]:
         insights = []
-        if not packets:
+        if not len(packets):
             return insights
 
-        df = pd.DataFrame(packets)
+        timestamps = packets.to_local_datetimes()
+        sizes = packets.size if packets.ts_valid is None else packets.size[packets.ts_valid]
         
         # 1. Burst Detection (Potential Data Exfiltration)
-        if 'timestamp' in df.columns and 'size' in df.columns:
-            try:
-                df['timestamp_dt'] = pd.to_datetime(df['timestamp'])
-                temp_df = df.set_index('timestamp_dt').sort_index()
+        try:
+            temp_series = pd.Series(sizes, index=timestamps).sort_index()
+            
+            resampled = temp_series.resample('1s').sum()
+            if not resampled.empty:
+                mean_bytes = resampled.mean()
+                std_bytes = resampled.std()
                 
-                resampled = temp_df['size'].resample('1s').sum()
-                if not resampled.empty:
-                    mean_bytes = resampled.mean()
-                    std_bytes = resampled.std()
-                    
-                    # Flag seconds where volume consists of > 3 sigma (Z-Score > 3)
-                    # changing limit to 2 sigma for demo sensitivity
-                    threshold = mean_bytes + (2.5 * std_bytes)
-                    anomalies = resampled[resampled > threshold]
-                    
-                    if not anomalies.empty:
-                        # Take top 3 anomalies
-                        for timestamp, volume in anomalies.nlargest(3).items():
-                            insights.append({
-                                "title": "High Volume Data Burst",
-                                "type": "danger",
-                                "confidence": 0.85 + (min((volume - mean_bytes) / (std_bytes + 1e-9), 10) / 100), 
-                                "description": f"Abnormal data spike detected at {timestamp.strftime('%H:%M:%S')}. Volume ({volume/1024:.1f} KB) is significantly higher than average.",
-                                "recommendation": "Check for large file uploads or encrypted archive transfers."
-                            })
-            except Exception as e:
-                print(f"Error in burst detection: {e}")
+                # Flag seconds where volume consists of > 3 sigma (Z-Score > 3)
+                # changing limit to 2 sigma for demo sensitivity
+                threshold = mean_bytes + (2.5 * std_bytes)
+                anomalies = resampled[resampled > threshold]
+                
+                if not anomalies.empty:
+                    # Take top 3 anomalies
+                    for timestamp, volume in anomalies.nlargest(3).items():
+                        insights.append({
+                            "title": "High Volume Data Burst",
+                            "type": "danger",
+                            "confidence": 0.85 + (min((volume - mean_bytes) / (std_bytes + 1e-9), 10) / 100), 
+                            "description": f"Abnormal data spike detected at {timestamp.strftime('%H:%M:%S')}. Volume ({volume/1024:.1f} KB) is significantly higher than average.",
+                            "recommendation": "Check for large file uploads or encrypted archive transfers."
+                        })
+        except Exception as e:
+            print(f"Error in burst detection: {e}")
 
         # 2. Beaconing Detection (C2 Communication)
-        if len(df) > 50 and 'timestamp' in df.columns:
+        if len(packets) > 50:
             try:
-                # Re-ensure timestamp is datetime
-                if df['timestamp'].dtype == 'object':
-                     df['timestamp'] = pd.to_datetime(df['timestamp'])
-                     
-                df = df.sort_values('timestamp')
-                iat = df['timestamp'].diff().dt.total_seconds().dropna()
+                iat = pd.Series(np.diff(np.sort(packets.valid_timestamps())) / 1_000_000)
                 
                 if not iat.empty:
                     iat_std = iat.std()
@@ -109,7 +108,7 @@ class SecurityAnalystAI:
         
         return insights
 
-    def _generate_llm_narrative(self, packets: List[Dict[str, Any]], insights: List[Dict[str, Any]]) -> str:
+    def _generate_llm_narrative(self, packets: PacketColumns, insights: List[Dict[str, Any]]) -> str:
         """
         Generates a professional forensic report using:
         1. OpenAI GPT-4o (if available and quota exists)
@@ -117,9 +116,9 @@ class SecurityAnalystAI:
         """
         try:
             # Prepare context
-            total_traffic = sum(p.get('size', 0) for p in packets)
-            unique_ips = len(set(p.get('src_ip') for p in packets))
-            protocols = list(set(p.get('protocol') for p in packets))
+            total_traffic = int(packets.size.sum())
+            unique_ips = packets.distinct_count(packets.src_ip)
+            protocols = list(packets.protocol_counts())
             
             # Try OpenAI first
             if self.client:
@@ -186,7 +185,7 @@ In the context of Darkweb/TOR investigations, these specific anomalies are indic
 - **Data Bursts:** Large outbound transfers through TOR are often indicative of stolen credential exfiltration or ransomware key negotiation.
 
 #### **Recommended Next Steps:**
-1. **Isolate the Source:** Immediate network isolation of the identified source IP (`{packets[0].get('src_ip') if packets else 'Unknown'}`) to prevent further activity.
+1. **Isolate the Source:** Immediate network isolation of the identified source IP (`{packets.first_src_ip() or 'Unknown'}`) to prevent further activity.
 2. **Memory Forensics:** Perform volatile memory dump analysis on the endpoints to identify the specific process process generating this traffic.
 3. **Cross-Correlation:** Correlate these timestamps with firewall logs to identify the true destination IP before it entered the TOR entry node.
 """
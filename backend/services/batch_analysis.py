@@ -0,0 +1,178 @@
+import os
+import time
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from backend.database import get_connection
+from backend.services.cell_features import load_cell_summary
+from backend.services.column_store import load_columns
+from backend.services.event_bus import event_bus
+from backend.services.job_queue import JobContext
+
+# Completed results are written to `analyses` in one transaction per this many sessions
+RESULT_FLUSH_SIZE = 100
+# Per-session errors kept in live progress; the final result has them all
+MAX_REPORTED_ERRORS = 100
+
+UPSERT_ANALYSIS_SQL = '''
+    INSERT INTO analyses (
+        case_id, session_id, status,
+        timing_score, volume_score, pattern_score, overall_confidence,
+        justification, entry_node_id, middle_node_id, exit_node_id,
+        probable_origin, evidence_hash, completed_at
+    )
+    VALUES (?, ?, 'completed', ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(case_id) DO UPDATE SET
+        status = excluded.status,
+        timing_score = excluded.timing_score,
+        volume_score = excluded.volume_score,
+        pattern_score = excluded.pattern_score,
+        overall_confidence = excluded.overall_confidence,
+        justification = excluded.justification,
+        entry_node_id = excluded.entry_node_id,
+        middle_node_id = excluded.middle_node_id,
+        exit_node_id = excluded.exit_node_id,
+        probable_origin = excluded.probable_origin,
+        evidence_hash = excluded.evidence_hash,
+        completed_at = excluded.completed_at
+'''
+
+
+def _correlate_session(session_id: str, nodes: List[Dict]) -> Tuple[str, Optional[Dict], Optional[str]]:
+    """
+    Process-pool entry point: loads one session over the worker's own
+    connection and runs the correlation engine on it.
+    """
+    from backend.services.correlation_engine import CorrelationEngine
+
+    try:
+        conn = get_connection()
+        try:
+            packets = load_columns(conn, session_id)
+            cell_features = load_cell_summary(conn, session_id)
+        finally:
+            conn.close()
+        if packets is None:
+            return session_id, None, "No packets found for this session"
+        return session_id, CorrelationEngine().run_analysis(packets, nodes, cell_features), None
+    except Exception as e:
+        return session_id, None, str(e)
+
+
+def _analysis_row(session_id: str, result: Dict) -> Tuple:
+    circuit = result.get('circuit', {})
+    return (
+        f"CASE-{session_id[-6:]}",
+        session_id,
+        result.get('timing_score', 0),
+        result.get('volume_score', 0),
+        result.get('pattern_score', 0),
+        result.get('overall_confidence', 0),
+        result.get('justification', ''),
+        circuit.get('entry', {}).get('id') if circuit.get('entry') else None,
+        circuit.get('middle', {}).get('id') if circuit.get('middle') else None,
+        circuit.get('exit', {}).get('id') if circuit.get('exit') else None,
+        result.get('probable_origin', 'Unknown'),
+        result.get('evidence_hash', f"SHA256-{session_id}")
+    )
+
+
+class BatchAnalysisRunner:
+    """
+    Fans CorrelationEngine.run_analysis out over a process pool sized to the
+    machine's cores. A batch runs as a "batch_correlation" job: the job
+    worker collects results as they complete, upserts them into `analyses`
+    in bulk and reports progress through the job.
+    """
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Created on first use so importing the app starts no workers. Spawned
+        # rather than forked: the server process already runs threads.
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def run(self, ctx: JobContext) -> Dict:
+        session_ids = ctx.payload["session_ids"]
+        conn = get_connection()
+        nodes = [dict(row) for row in conn.execute("SELECT * FROM tor_nodes").fetchall()]
+
+        counts = {"total": len(session_ids), "completed": 0, "failed": 0, "written": 0, "workers": self.max_workers}
+        errors: Dict[str, str] = {}
+        pending_rows = []
+        futures = []
+        started = time.monotonic()
+
+        def report():
+            done = counts["completed"] + counts["failed"]
+            elapsed = time.monotonic() - started
+            ctx.progress(
+                progress=round(done / counts["total"], 4) if counts["total"] else 1.0,
+                sessions_per_second=round(done / elapsed, 2) if elapsed > 0 else 0.0,
+                errors=dict(list(errors.items())[:MAX_REPORTED_ERRORS]),
+                **counts
+            )
+
+        try:
+            pool = self._get_pool()
+            futures = [pool.submit(_correlate_session, session_id, nodes) for session_id in session_ids]
+            for future in as_completed(futures):
+                session_id, result, error = future.result()
+                if error is not None:
+                    counts["failed"] += 1
+                    errors[session_id] = error
+                else:
+                    counts["completed"] += 1
+                    pending_rows.append(_analysis_row(session_id, result))
+                if len(pending_rows) >= RESULT_FLUSH_SIZE:
+                    counts["written"] += self._write(conn, pending_rows)
+                    pending_rows = []
+                report()
+            counts["written"] += self._write(conn, pending_rows)
+            report()
+        except BrokenProcessPool:
+            # A worker died; drop the pool so the next batch starts a fresh one
+            with self._lock:
+                self._pool = None
+            raise
+        finally:
+            for future in futures:
+                future.cancel()
+            conn.close()
+
+        return dict(counts, errors=errors)
+
+    def _write(self, conn, rows: List[Tuple]) -> int:
+        if not rows:
+            return 0
+        conn.executemany(UPSERT_ANALYSIS_SQL, rows)
+        conn.commit()
+        for row in rows:
+            case_id, session_id, timing, volume, pattern, confidence = row[:6]
+            event_bus.publish("analysis.completed", {
+                "timing_score": timing,
+                "volume_score": volume,
+                "pattern_score": pattern,
+                "overall_confidence": confidence,
+                "probable_origin": row[10]
+            }, session_id=session_id, case_id=case_id)
+        return len(rows)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+batch_analysis = BatchAnalysisRunner()
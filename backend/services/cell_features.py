@@ -0,0 +1,223 @@
+import sqlite3
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Tor link protocol v4+ fixed-size cell
+CELL_SIZE = 514
+# On-the-wire TLS record overhead around the cells: 5-byte header plus
+# explicit nonce and tag for TLS 1.2 AES-GCM (514 + 29 = 543), the inner
+# content type and tag for TLS 1.3, and the tag alone for TLS 1.2 ChaCha20
+TLS_RECORD_OVERHEADS = (29, 22, 21)
+TLS_HEADER_SIZE = 5
+TLS_APPLICATION_DATA = 23
+# Largest legal TLSCiphertext length; anything above means we lost the record boundary
+TLS_MAX_RECORD_LENGTH = 2 ** 14 + 2048
+# Bursts kept per flow, each a signed int16 cell count (positive = outbound)
+MAX_BURSTS = 64
+
+
+# Cells carried by an application-data record, indexed by its wire size
+_CELLS_BY_SIZE = bytearray(TLS_MAX_RECORD_LENGTH + TLS_HEADER_SIZE + 1)
+for _overhead in reversed(TLS_RECORD_OVERHEADS):
+    for _cells in range(1, (len(_CELLS_BY_SIZE) - _overhead - 1) // CELL_SIZE + 1):
+        _CELLS_BY_SIZE[_cells * CELL_SIZE + _overhead] = _cells
+
+
+def cells_in_record(wire_size: int) -> int:
+    """Number of Tor cells a TLS application-data record of this size carries, or 0."""
+    return _CELLS_BY_SIZE[wire_size] if 0 <= wire_size < len(_CELLS_BY_SIZE) else 0
+
+
+_NO_RECORDS: List[int] = []
+
+
+class _RecordTracker:
+    """
+    Follows TLS record boundaries through one direction of a TCP stream
+    using only the 5-byte record headers, so no payload is buffered. Segments
+    are assumed to arrive in order; a header that fails validation (loss,
+    retransmission, reordering) drops the tracker out of sync until a
+    segment starts with a valid header again.
+    """
+    __slots__ = ("remaining", "partial", "synced")
+
+    def __init__(self):
+        self.remaining = 0
+        self.partial = b""
+        self.synced = False
+
+    def records(self, buf, offset: int, length: int, uncaptured: int) -> List[int]:
+        """Wire sizes of the application-data records whose headers start in this segment."""
+        if self.synced:
+            if self.remaining >= length + uncaptured:
+                # Mid-record segment, the common case for bulk transfers
+                self.remaining -= length + uncaptured
+                return _NO_RECORDS
+        elif length < TLS_HEADER_SIZE or not _valid_header(buf, offset):
+            return _NO_RECORDS
+        else:
+            self.synced = True
+            self.remaining = 0
+            self.partial = b""
+
+        sizes = []
+
+        end = offset + length
+        pos = offset
+        while True:
+            if self.remaining:
+                skip = min(self.remaining, end - pos)
+                self.remaining -= skip
+                pos += skip
+                if self.remaining:
+                    break
+            if pos >= end:
+                break
+            if self.partial or end - pos < TLS_HEADER_SIZE:
+                header = self.partial + bytes(buf[pos:pos + TLS_HEADER_SIZE - len(self.partial)])
+                pos += len(header) - len(self.partial)
+                if len(header) < TLS_HEADER_SIZE:
+                    self.partial = header
+                    break
+                self.partial = b""
+                head, start = header, 0
+            else:
+                head, start = buf, pos
+                pos += TLS_HEADER_SIZE
+            if not _valid_header(head, start):
+                self.synced = False
+                return sizes
+            record_length = (head[start + 3] << 8) | head[start + 4]
+            if head[start] == TLS_APPLICATION_DATA:
+                sizes.append(record_length + TLS_HEADER_SIZE)
+            self.remaining = record_length
+
+        if uncaptured:
+            # Snaplen-truncated segment: the rest must fall inside the current record
+            if self.partial or uncaptured > self.remaining:
+                self.synced = False
+            else:
+                self.remaining -= uncaptured
+        return sizes
+
+
+def _valid_header(buf, pos: int) -> bool:
+    return (20 <= buf[pos] <= 23 and buf[pos + 1] == 3
+            and ((buf[pos + 3] << 8) | buf[pos + 4]) <= TLS_MAX_RECORD_LENGTH)
+
+
+class CellFeatures:
+    """
+    Per-flow Tor cell features derived from TLS record sizes during ingest:
+    application-data records per direction, how many of them are a whole
+    number of 514-byte cells (543 bytes on the wire for one cell under TLS
+    1.2 GCM), the cell counts, and the sequence of same-direction cell
+    bursts. burst_count counts every burst; only the first MAX_BURSTS are
+    kept in bursts.
+    """
+    __slots__ = (
+        "records_out", "records_in", "cell_records_out", "cell_records_in",
+        "cells_out", "cells_in", "bursts", "burst_count",
+        "_burst_outbound", "_outbound", "_inbound"
+    )
+
+    def __init__(self):
+        self.records_out = self.records_in = 0
+        self.cell_records_out = self.cell_records_in = 0
+        self.cells_out = self.cells_in = 0
+        self.bursts: List[int] = []
+        self.burst_count = 0
+        self._burst_outbound = False
+        self._outbound = self._inbound = None
+
+    def add(self, outbound: bool, buf, payload_offset: int, payload_len: int, uncaptured: int = 0):
+        if outbound:
+            tracker = self._outbound or self._new_tracker(True)
+        else:
+            tracker = self._inbound or self._new_tracker(False)
+        sizes = tracker.records(buf, payload_offset, payload_len, uncaptured)
+        if not sizes:
+            return
+        cells = 0
+        cell_records = 0
+        for size in sizes:
+            n = _CELLS_BY_SIZE[size]
+            if n:
+                cells += n
+                cell_records += 1
+        if outbound:
+            self.records_out += len(sizes)
+            self.cell_records_out += cell_records
+            self.cells_out += cells
+        else:
+            self.records_in += len(sizes)
+            self.cell_records_in += cell_records
+            self.cells_in += cells
+            cells = -cells
+        if cells:
+            if self.burst_count and self._burst_outbound == outbound:
+                if self.burst_count <= MAX_BURSTS:
+                    self.bursts[-1] += cells
+            else:
+                self.burst_count += 1
+                self._burst_outbound = outbound
+                if self.burst_count <= MAX_BURSTS:
+                    self.bursts.append(cells)
+
+    def _new_tracker(self, outbound: bool) -> _RecordTracker:
+        tracker = _RecordTracker()
+        if outbound:
+            self._outbound = tracker
+        else:
+            self._inbound = tracker
+        return tracker
+
+    @property
+    def records(self) -> int:
+        return self.records_out + self.records_in
+
+    def packed_bursts(self) -> bytes:
+        return np.clip(self.bursts, -32767, 32767).astype("<i2").tobytes()
+
+
+def feature_row(session_id: str, flow) -> Optional[tuple]:
+    """The flow's cell features as a database.FLOW_FEATURE_COLUMNS row, or None if it carried no TLS records."""
+    features = flow.cells
+    if features is None or not features.records:
+        return None
+    return (
+        session_id, flow.flow_id,
+        features.records_out, features.records_in,
+        features.cell_records_out, features.cell_records_in,
+        features.cells_out, features.cells_in,
+        features.burst_count, features.packed_bursts()
+    )
+
+
+def unpack_bursts(blob: Optional[bytes]) -> List[int]:
+    return np.frombuffer(blob, dtype="<i2").tolist() if blob else []
+
+
+def load_cell_summary(conn: sqlite3.Connection, session_id: str) -> Optional[Dict]:
+    """
+    Session-wide totals of the precomputed flow features, for the pattern
+    scorer. None when the session has none (demo traffic, imports, captures
+    ingested before features existed), so callers fall back to packet scans.
+    """
+    row = conn.execute('''
+        SELECT COUNT(*), SUM(records_out + records_in), SUM(cell_records_out + cell_records_in),
+               SUM(cells_out + cells_in),
+               SUM(CASE WHEN 2 * (cell_records_out + cell_records_in) >= records_out + records_in THEN 1 ELSE 0 END)
+        FROM flow_features WHERE session_id = ?
+    ''', (session_id,)).fetchone()
+    flows, records, cell_records, cells, cell_flows = row
+    if not flows or not records:
+        return None
+    return {
+        "tls_flows": flows,
+        "tls_records": records,
+        "cell_records": cell_records,
+        "cells": cells,
+        "cell_aligned_flows": cell_flows,
+    }
@@ -0,0 +1,182 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from backend.database import load_packet_columns, packet_row
+from backend.services.packet_columns import PacketColumns
+
+COLUMN_STORE_DIR = os.getenv("COLUMN_STORE_DIR", "column_store")
+COLUMN_STORE_VERSION = 1
+# Session IDs name directories under the store; anything else is refused
+SESSION_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]+")
+
+# One raw little-endian file per column. Sizes are uint32 rather than uint16
+# because captures taken with segmentation offload record frames over 64 KiB.
+COLUMN_DTYPES = {
+    "ts_us": "<i8",
+    "size": "<u4",
+    "direction": "u1",
+    "protocol": "<u2",
+    "src_ip": "<u4",
+    "dst_ip": "<u4",
+}
+
+
+def _session_dir(session_id: str, root: str) -> str:
+    """A session's directory under root; raises ValueError for IDs that could escape it."""
+    if not isinstance(session_id, str) or not SESSION_ID_PATTERN.fullmatch(session_id):
+        raise ValueError(f"Invalid session ID: {session_id!r}")
+    path = os.path.join(root, session_id)
+    base = os.path.realpath(root)
+    resolved = os.path.realpath(path)
+    if resolved == base or os.path.commonpath([base, resolved]) != base:
+        raise ValueError(f"Session directory escapes the column store: {session_id!r}")
+    return path
+
+
+class ColumnStoreWriter:
+    """
+    Writes one session's packets as per-column binary files plus a meta.json
+    holding the protocol and IP dictionaries. Rows are appended as they are
+    ingested; close() restores (ts_us, insertion) order if the capture was
+    out of order, matching the order the packets table is read in.
+    """
+    def __init__(self, session_id: str, root: str = COLUMN_STORE_DIR):
+        self.path = _session_dir(session_id, root)
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path)
+        self.count = 0
+        self._files = {name: open(self._file(name), "wb") for name in COLUMN_DTYPES}
+        self._protocols: Dict[str, int] = {}
+        self._ips: Dict[str, int] = {}
+        self._invalid_ts: List[int] = []
+        self._last_ts: Optional[int] = None
+        self._ordered = True
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def add_packets(self, packets: Iterable[Dict]):
+        self.add_rows([packet_row(p) for p in packets])
+
+    def add_rows(self, rows: Sequence[tuple]):
+        """Appends rows already shaped by database.packet_row."""
+        if not rows:
+            return
+        _, _, src_ip, dst_ip, protocol, size, _, ts_us, direction, _, _ = zip(*rows)
+
+        ts = np.fromiter((t if t is not None else 0 for t in ts_us), dtype=np.int64, count=len(rows))
+        self._invalid_ts.extend(self.count + i for i, t in enumerate(ts_us) if t is None)
+        if self._ordered:
+            checked = ts if self._last_ts is None else np.concatenate(([self._last_ts], ts))
+            self._ordered = not (np.diff(checked) < 0).any()
+        self._last_ts = int(ts[-1])
+
+        protocols, ips = self._protocols, self._ips
+        columns = {
+            "ts_us": ts,
+            "size": np.array(size, dtype=np.uint32),
+            "direction": np.array(direction, dtype=np.uint8),
+            "protocol": np.fromiter((protocols.setdefault(p, len(protocols)) for p in protocol), dtype=np.uint16, count=len(rows)),
+            "src_ip": np.fromiter((ips.setdefault(ip, len(ips)) for ip in src_ip), dtype=np.uint32, count=len(rows)),
+            "dst_ip": np.fromiter((ips.setdefault(ip, len(ips)) for ip in dst_ip), dtype=np.uint32, count=len(rows)),
+        }
+        for name, values in columns.items():
+            values.astype(COLUMN_DTYPES[name], copy=False).tofile(self._files[name])
+        self.count += len(rows)
+
+    def close(self) -> str:
+        for f in self._files.values():
+            f.close()
+
+        ts_valid = None
+        if self._invalid_ts:
+            ts_valid = np.ones(self.count, dtype=np.uint8)
+            ts_valid[self._invalid_ts] = 0
+
+        if not self._ordered:
+            # Unreadable timestamps are stored as 0, so they sort first like NULLs do
+            order = np.argsort(np.fromfile(self._file("ts_us"), dtype=COLUMN_DTYPES["ts_us"]), kind="stable")
+            for name, dtype in COLUMN_DTYPES.items():
+                np.fromfile(self._file(name), dtype=dtype)[order].tofile(self._file(name))
+            if ts_valid is not None:
+                ts_valid = ts_valid[order]
+        if ts_valid is not None:
+            ts_valid.tofile(self._file("ts_valid"))
+
+        meta = {
+            "version": COLUMN_STORE_VERSION,
+            "count": self.count,
+            "dtypes": COLUMN_DTYPES,
+            "has_invalid_ts": ts_valid is not None,
+            "protocol_names": list(self._protocols),
+            "ip_names": list(self._ips),
+        }
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        return self.path
+
+    def abort(self):
+        for f in self._files.values():
+            f.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def write_session_columns(session_id: str, packets: List[Dict], root: str = COLUMN_STORE_DIR) -> str:
+    writer = ColumnStoreWriter(session_id, root)
+    try:
+        writer.add_packets(packets)
+        return writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+
+def open_columns(path: str) -> Optional[PacketColumns]:
+    """
+    Memory-maps a session's column files. The arrays are read-only views of
+    the files, so nothing is copied until a scorer touches the pages.
+    Returns None for an empty session.
+    """
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != COLUMN_STORE_VERSION:
+        raise ValueError(f"Unsupported column store version {meta.get('version')}")
+    count = meta["count"]
+    if count == 0:
+        return None
+
+    def column(name: str, dtype: str) -> np.ndarray:
+        return np.memmap(os.path.join(path, f"{name}.bin"), dtype=dtype, mode="r", shape=(count,))
+
+    columns = {name: column(name, dtype) for name, dtype in meta["dtypes"].items()}
+    return PacketColumns(
+        protocol_names=meta["protocol_names"],
+        ip_names=meta["ip_names"],
+        ts_valid=column("ts_valid", "u1").view(bool) if meta["has_invalid_ts"] else None,
+        **columns
+    )
+
+
+def load_columns(conn: sqlite3.Connection, session_id: str) -> Optional[PacketColumns]:
+    """
+    A session's packets as PacketColumns: memory-mapped from its column
+    store when it has one, otherwise read from the packets table.
+    """
+    row = conn.execute("SELECT column_store_path FROM traffic_sessions WHERE session_id = ?", (session_id,)).fetchone()
+    path = row[0] if row else None
+    if path and os.path.exists(os.path.join(path, "meta.json")):
+        try:
+            return open_columns(path)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Column store for {session_id} unreadable, falling back to SQLite: {e}")
+    return load_packet_columns(conn, session_id)
+
+
+def remove_session_columns(session_id: str, root: str = COLUMN_STORE_DIR):
+    shutil.rmtree(_session_dir(session_id, root), ignore_errors=True)
@@ -5,130 +5,160 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Tuple, Optional
 import json
 
+from backend.services.packet_columns import PacketSet, as_columns, DIRECTION_INBOUND, DIRECTION_OUTBOUND
+
+# Weights of the timing, volume and pattern scores in the overall confidence
+SCORE_WEIGHTS = (0.35, 0.30, 0.35)
+
+# The scoring formulas, shared by the stored-session scorers below and the
+# sliding-window OnlineCorrelator, which feeds them running statistics.
+
+def timing_score(cv: float, burst_ratio: float, packet_count: int) -> float:
+    return min(100, max(0, (
+        (1 - min(cv, 2) / 2) * 40 +
+        burst_ratio * 30 +
+        min(packet_count / 100, 1) * 30
+    )))
+
+def volume_score(inbound_bytes: int, outbound_bytes: int, packet_count: int, avg_packet_size: float) -> float:
+    ratio = traffic_ratio(inbound_bytes, outbound_bytes)
+    size_score = 1 - min(abs(avg_packet_size - 1000) / 1500, 1)
+    bandwidth_consistency = min(packet_count * avg_packet_size / 100000, 1)
+    return min(100, max(0, (
+        ratio * 35 +
+        size_score * 35 +
+        bandwidth_consistency * 30
+    )))
+
+def traffic_ratio(inbound_bytes: int, outbound_bytes: int) -> float:
+    larger = max(inbound_bytes, outbound_bytes)
+    return min(inbound_bytes, outbound_bytes) / larger if larger > 0 else 0
+
+def pattern_score(protocol_count: int, tls_ratio: float, tcp_ratio: float,
+                  endpoint_count: int, size_uniformity: float) -> float:
+    return min(100, max(0, (
+        tls_ratio * 25 +
+        tcp_ratio * 15 +
+        protocol_count / 5 * 20 +
+        min(endpoint_count / 10, 1) * 20 +
+        size_uniformity * 20
+    )))
+
+def overall_confidence(timing: float, volume: float, pattern: float) -> float:
+    return timing * SCORE_WEIGHTS[0] + volume * SCORE_WEIGHTS[1] + pattern * SCORE_WEIGHTS[2]
+
 class CorrelationEngine:
     def __init__(self, time_window: float = 5.0):
+        # Sliding window, in seconds, of online_correlator()
         self.time_window = time_window
     
-    def calculate_timing_correlation(self, packets: List[Dict], nodes: List[Dict]) -> Tuple[float, str]:
-        if not packets or not nodes:
+    def online_correlator(self, **kwargs) -> "OnlineCorrelator":
+        """A streaming correlator scoring the last `time_window` seconds of a live feed."""
+        from backend.services.online_correlator import OnlineCorrelator
+        return OnlineCorrelator(time_window=self.time_window, **kwargs)
+    
+    def calculate_timing_correlation(self, packets: PacketSet, nodes: List[Dict]) -> Tuple[float, str]:
+        if not len(packets) or not nodes:
             return 0.0, "Insufficient data for timing correlation analysis."
         
-        packet_times = []
-        for p in packets:
-            if isinstance(p.get('timestamp'), str):
-                try:
-                    packet_times.append(datetime.fromisoformat(p['timestamp'].replace('Z', '+00:00')))
-                except:
-                    continue
-            else:
-                packet_times.append(p['timestamp'])
+        columns = as_columns(packets)
+        packet_times = columns.valid_timestamps()
         
         if len(packet_times) < 2:
             return 0.0, "Insufficient packet timing data."
         
-        inter_arrival_times = []
-        for i in range(1, len(packet_times)):
-            delta = (packet_times[i] - packet_times[i-1]).total_seconds()
-            inter_arrival_times.append(delta)
-        
-        if not inter_arrival_times:
-            return 0.0, "Could not calculate inter-arrival times."
+        inter_arrival_times = np.diff(packet_times) / 1_000_000
         
         mean_iat = np.mean(inter_arrival_times)
         std_iat = np.std(inter_arrival_times)
         cv = std_iat / mean_iat if mean_iat > 0 else 0
         
-        burst_count = sum(1 for iat in inter_arrival_times if iat < 0.1)
+        burst_count = int(np.count_nonzero(inter_arrival_times < 0.1))
         burst_ratio = burst_count / len(inter_arrival_times)
         
-        timing_score = min(100, max(0, (
-            (1 - min(cv, 2) / 2) * 40 +
-            burst_ratio * 30 +
-            min(len(packets) / 100, 1) * 30
-        )))
+        score = timing_score(cv, burst_ratio, len(columns))
         
         justification = (
-            f"Timing analysis examined {len(packets)} packets. "
+            f"Timing analysis examined {len(columns)} packets. "
             f"Mean inter-arrival time: {mean_iat:.3f}s (CV: {cv:.2f}). "
             f"Burst ratio: {burst_ratio:.1%} of packets arrived in rapid succession. "
-            f"Pattern consistency suggests {'strong' if timing_score > 60 else 'moderate' if timing_score > 30 else 'weak'} "
+            f"Pattern consistency suggests {'strong' if score > 60 else 'moderate' if score > 30 else 'weak'} "
             f"temporal correlation with TOR relay activity."
         )
         
-        return timing_score, justification
+        return score, justification
     
-    def calculate_volume_correlation(self, packets: List[Dict], nodes: List[Dict]) -> Tuple[float, str]:
-        if not packets:
+    def calculate_volume_correlation(self, packets: PacketSet, nodes: List[Dict]) -> Tuple[float, str]:
+        if not len(packets):
             return 0.0, "No packet data available for volume analysis."
         
-        total_bytes = sum(p.get('size', 0) for p in packets)
-        inbound_bytes = sum(p.get('size', 0) for p in packets if p.get('direction') == 'inbound')
-        outbound_bytes = sum(p.get('size', 0) for p in packets if p.get('direction') == 'outbound')
-        
-        ratio = min(inbound_bytes, outbound_bytes) / max(inbound_bytes, outbound_bytes) if max(inbound_bytes, outbound_bytes) > 0 else 0
-        
-        avg_packet_size = total_bytes / len(packets) if packets else 0
+        columns = as_columns(packets)
+        sizes = columns.size
         
-        tor_typical_range = (500, 2000)
-        size_score = 1 - min(abs(avg_packet_size - 1000) / 1500, 1)
+        total_bytes = int(sizes.sum())
+        inbound_bytes = int(sizes[columns.direction == DIRECTION_INBOUND].sum())
+        outbound_bytes = int(sizes[columns.direction == DIRECTION_OUTBOUND].sum())
         
-        bandwidth_consistency = min(len(packets) * avg_packet_size / 100000, 1)
-        
-        volume_score = min(100, max(0, (
-            ratio * 35 +
-            size_score * 35 +
-            bandwidth_consistency * 30
-        )))
+        ratio = traffic_ratio(inbound_bytes, outbound_bytes)
+        avg_packet_size = total_bytes / len(columns)
+        score = volume_score(inbound_bytes, outbound_bytes, len(columns), avg_packet_size)
         
         justification = (
-            f"Volume analysis processed {total_bytes:,} bytes across {len(packets)} packets. "
+            f"Volume analysis processed {total_bytes:,} bytes across {len(columns)} packets. "
             f"Traffic ratio (in/out): {ratio:.2f}. Average packet size: {avg_packet_size:.0f} bytes. "
-            f"Volume patterns {'align well with' if volume_score > 60 else 'partially match' if volume_score > 30 else 'show limited alignment with'} "
+            f"Volume patterns {'align well with' if score > 60 else 'partially match' if score > 30 else 'show limited alignment with'} "
             f"expected TOR relay traffic characteristics."
         )
         
-        return volume_score, justification
+        return score, justification
     
-    def calculate_pattern_similarity(self, packets: List[Dict], nodes: List[Dict]) -> Tuple[float, str]:
-        if not packets or len(packets) < 10:
+    def calculate_pattern_similarity(self, packets: PacketSet, nodes: List[Dict],
+                                     cell_features: Optional[Dict] = None) -> Tuple[float, str]:
+        """
+        With `cell_features` (cell_features.load_cell_summary) the size term
+        is the share of TLS records framed as whole Tor cells, precomputed at
+        ingest; otherwise it falls back to packet-size uniformity.
+        """
+        if len(packets) < 10:
             return 0.0, "Insufficient packet data for pattern analysis."
         
-        protocols = {}
-        for p in packets:
-            proto = p.get('protocol', 'UNKNOWN')
-            protocols[proto] = protocols.get(proto, 0) + 1
+        columns = as_columns(packets)
+        protocols = columns.protocol_counts()
         
-        total_packets = len(packets)
-        protocol_diversity = len(protocols) / 5
+        total_packets = len(columns)
         
         tls_ratio = protocols.get('TLS', 0) / total_packets
         tcp_ratio = protocols.get('TCP', 0) / total_packets
         
-        unique_src = len(set(p.get('src_ip') for p in packets))
-        unique_dst = len(set(p.get('dst_ip') for p in packets))
+        unique_src = columns.distinct_count(columns.src_ip)
+        unique_dst = columns.distinct_count(columns.dst_ip)
         ip_diversity = min((unique_src + unique_dst) / 10, 1)
         
-        sizes = [p.get('size', 0) for p in packets]
-        size_std = np.std(sizes) if sizes else 0
-        size_uniformity = 1 - min(size_std / 2000, 1)
-        
-        pattern_score = min(100, max(0, (
-            tls_ratio * 25 +
-            tcp_ratio * 15 +
-            protocol_diversity * 20 +
-            ip_diversity * 20 +
-            size_uniformity * 20
-        )))
+        if cell_features:
+            size_uniformity = cell_features["cell_records"] / cell_features["tls_records"]
+            size_note = (
+                f"{cell_features['cell_records']:,} of {cell_features['tls_records']:,} TLS records "
+                f"({size_uniformity:.1%}) carry whole 514-byte cells "
+                f"({cell_features['cell_aligned_flows']} of {cell_features['tls_flows']} TLS flows mostly cell-framed). "
+            )
+        else:
+            size_std = np.std(columns.size)
+            size_uniformity = 1 - min(size_std / 2000, 1)
+            # Pre-feature sessions keep their original justification text
+            size_note = ""
+        
+        score = pattern_score(len(protocols), tls_ratio, tcp_ratio, unique_src + unique_dst, size_uniformity)
         
         justification = (
             f"Pattern analysis identified {len(protocols)} protocols across traffic. "
             f"TLS traffic: {tls_ratio:.1%}, TCP traffic: {tcp_ratio:.1%}. "
             f"IP diversity score: {ip_diversity:.2f} (unique endpoints: {unique_src + unique_dst}). "
-            f"Traffic patterns {'strongly suggest' if pattern_score > 60 else 'moderately indicate' if pattern_score > 30 else 'show limited evidence of'} "
+            f"{size_note}"
+            f"Traffic patterns {'strongly suggest' if score > 60 else 'moderately indicate' if score > 30 else 'show limited evidence of'} "
             f"TOR circuit behavior."
         )
         
-        return pattern_score, justification
+        return score, justification
     
     def select_probable_circuit(self, nodes: List[Dict]) -> Dict:
         guards = [n for n in nodes if n.get('node_type') == 'Guard']
@@ -182,12 +212,15 @@ class CorrelationEngine:
         data_str = json.dumps(data, sort_keys=True, default=str)
         return hashlib.sha256(data_str.encode()).hexdigest()
     
-    def run_analysis(self, packets: List[Dict], nodes: List[Dict]) -> Dict:
+    def run_analysis(self, packets: PacketSet, nodes: List[Dict], cell_features: Optional[Dict] = None) -> Dict:
+        # Convert once; every scorer then works on the same arrays
+        packets = as_columns(packets)
+        
         timing_score, timing_just = self.calculate_timing_correlation(packets, nodes)
         volume_score, volume_just = self.calculate_volume_correlation(packets, nodes)
-        pattern_score, pattern_just = self.calculate_pattern_similarity(packets, nodes)
+        pattern_score, pattern_just = self.calculate_pattern_similarity(packets, nodes, cell_features)
         
-        overall_confidence = (timing_score * 0.35 + volume_score * 0.30 + pattern_score * 0.35)
+        confidence = overall_confidence(timing_score, volume_score, pattern_score)
         
         circuit = self.select_probable_circuit(nodes)
         probable_origin = self.generate_probable_origin()
@@ -198,7 +231,7 @@ class CorrelationEngine:
             f"TIMING CORRELATION ({timing_score:.1f}%):\n{timing_just}\n\n"
             f"VOLUME CORRELATION ({volume_score:.1f}%):\n{volume_just}\n\n"
             f"PATTERN SIMILARITY ({pattern_score:.1f}%):\n{pattern_just}\n\n"
-            f"OVERALL CONFIDENCE: {overall_confidence:.1f}%\n\n"
+            f"OVERALL CONFIDENCE: {confidence:.1f}%\n\n"
             f"IMPORTANT DISCLAIMER: This analysis provides PROBABILISTIC correlation only. "
             f"Results should be interpreted as investigative leads requiring further verification. "
             f"This system does NOT claim to de-anonymize TOR traffic."
@@ -220,7 +253,7 @@ class CorrelationEngine:
             "timing_score": timing_score,
             "volume_score": volume_score,
             "pattern_score": pattern_score,
-            "overall_confidence": overall_confidence,
+            "overall_confidence": confidence,
             "justification": full_justification,
             "circuit": circuit,
             "probable_origin": probable_origin,
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Recent events kept for clients resuming with Last-Event-ID
+EVENT_HISTORY = int(os.getenv("EVENT_HISTORY", "1000"))
+# Events buffered per subscriber; a slow client loses its oldest ones
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+def _to_json(value: Any) -> str:
+    # NumPy scalars expose item(); anything else unknown is sent as text
+    return json.dumps(value, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+
+
+class Event:
+    """One published event, encoded once and shared by every subscriber."""
+    __slots__ = ("id", "type", "job_id", "session_id", "case_id", "data")
+
+    def __init__(self, event_id: int, event_type: str, job_id: Optional[str],
+                 session_id: Optional[str], case_id: Optional[str], data: str):
+        self.id = event_id
+        self.type = event_type
+        self.job_id = job_id
+        self.session_id = session_id
+        self.case_id = case_id
+        self.data = data
+
+    def sse(self) -> str:
+        # Sent as unnamed messages so EventSource.onmessage sees every type;
+        # the type is part of the JSON body
+        return f"id: {self.id}\ndata: {self.data}\n\n"
+
+
+class Subscription:
+    """
+    A client's filtered view of the bus. Scope filters are alternatives: an
+    event is delivered when it belongs to any of the given sessions, cases or
+    jobs (or always, when none are given). `types` matches event types by
+    prefix, so "job" selects job.queued, job.progress and job.finished.
+    """
+    def __init__(self, session_ids: Iterable[str] = (), case_ids: Iterable[str] = (),
+                 job_ids: Iterable[str] = (), types: Iterable[str] = (),
+                 queue_size: int = SUBSCRIBER_QUEUE_SIZE):
+        self.session_ids = set(session_ids)
+        self.case_ids = set(case_ids)
+        self.job_ids = set(job_ids)
+        self.types = tuple(types)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+
+    def matches(self, event: Event) -> bool:
+        if self.types and not any(event.type == t or event.type.startswith(t + ".") for t in self.types):
+            return False
+        if not (self.session_ids or self.case_ids or self.job_ids):
+            return True
+        return (event.session_id in self.session_ids
+                or event.case_id in self.case_ids
+                or event.job_id in self.job_ids)
+
+    def deliver(self, event: Optional[Event]):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[Event]:
+        """The next event; raises asyncio.TimeoutError when none arrives in time and returns None once the bus closes."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class EventBus:
+    """
+    In-process fan-out of server events (job progress, stored threat-intel
+    matches, saved analyses) to streaming clients, so the frontend does not
+    have to poll the SQLite-backed endpoints.
+
+    publish() is safe from any thread: job workers hand their events to the
+    server's event loop, which numbers them, keeps a short history for
+    reconnecting clients and copies them into each matching subscriber's
+    bounded queue. Before attach() is called (scripts, process-pool
+    workers) publishing is a no-op.
+    """
+    def __init__(self, history: int = EVENT_HISTORY):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: List[Subscription] = []
+        self._history: deque = deque(maxlen=history)
+        self._next_id = 1
+        self.published = 0
+
+    def attach(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self._loop = loop or asyncio.get_running_loop()
+
+    def close(self):
+        """Ends every open stream; called on shutdown from the event loop."""
+        self._loop = None
+        for subscription in self._subscribers:
+            subscription.deliver(None)
+        self._subscribers = []
+
+    def publish(self, event_type: str, data: Optional[Dict] = None, job_id: Optional[str] = None,
+                session_id: Optional[str] = None, case_id: Optional[str] = None):
+        loop = self._loop
+        if loop is None:
+            return
+        args = (event_type, job_id, session_id, case_id, data or {})
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dispatch(*args)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._dispatch, *args)
+            except RuntimeError:
+                # The server loop closed while a worker was still finishing
+                pass
+
+    def _dispatch(self, event_type: str, job_id: Optional[str], session_id: Optional[str],
+                  case_id: Optional[str], data: Dict):
+        event_id = self._next_id
+        self._next_id += 1
+        self.published += 1
+        event = Event(event_id, event_type, job_id, session_id, case_id, _to_json({
+            "id": event_id,
+            "type": event_type,
+            "job_id": job_id,
+            "session_id": session_id,
+            "case_id": case_id,
+            "timestamp": datetime.now().isoformat(),
+            "data": data
+        }))
+        self._history.append(event)
+        for subscription in self._subscribers:
+            if subscription.matches(event):
+                subscription.deliver(event)
+
+    def subscribe(self, subscription: Subscription, last_event_id: Optional[int] = None) -> Subscription:
+        """Registers the subscription, first queueing any missed history newer than last_event_id."""
+        if last_event_id is not None:
+            for event in self._history:
+                if event.id > last_event_id and subscription.matches(event):
+                    subscription.deliver(event)
+        self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self._subscribers:
+            self._subscribers.remove(subscription)
+
+    def stats(self) -> Dict:
+        return {
+            "attached": self._loop is not None,
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "last_event_id": self._next_id - 1,
+            "history": len(self._history),
+            "dropped": sum(s.dropped for s in self._subscribers)
+        }
+
+event_bus = EventBus()
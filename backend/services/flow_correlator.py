@@ -0,0 +1,282 @@
+import heapq
+import numpy as np
+from typing import Dict, List, Tuple
+
+from backend.services.packet_columns import PacketColumns
+
+# A flow is (timestamps in epoch microseconds, sizes in bytes)
+Flow = Tuple[np.ndarray, np.ndarray]
+
+
+def _fft_length(n: int) -> int:
+    """Smallest 5-smooth integer >= n; these sizes are fast for NumPy's pocketfft."""
+    best = 1 << max(0, (n - 1).bit_length())
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            candidate = p35
+            while candidate < n:
+                candidate *= 2
+            best = min(best, candidate)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def flows_from_columns(columns: PacketColumns, min_packets: int = 5) -> Dict[str, Flow]:
+    """
+    Splits a packet set into bidirectional endpoint-pair flows. Flows with
+    fewer than `min_packets` packets are dropped as too short to correlate.
+    """
+    if not len(columns):
+        return {}
+
+    n_ips = max(len(columns.ip_names), 1)
+    low = np.minimum(columns.src_ip, columns.dst_ip).astype(np.int64)
+    high = np.maximum(columns.src_ip, columns.dst_ip).astype(np.int64)
+    pair = low * n_ips + high
+
+    ts = columns.ts_us
+    size = columns.size
+    if columns.ts_valid is not None:
+        pair, ts, size = pair[columns.ts_valid], ts[columns.ts_valid], size[columns.ts_valid]
+
+    order = np.argsort(pair, kind='stable')
+    pair, ts, size = pair[order], ts[order], size[order]
+    keys, starts, counts = np.unique(pair, return_index=True, return_counts=True)
+
+    flows = {}
+    for key, start, count in zip(keys, starts, counts):
+        if count < min_packets:
+            continue
+        a, b = divmod(int(key), n_ips)
+        name = f"{columns.ip_names[a]} <-> {columns.ip_names[b]}"
+        flow_ts = ts[start:start + count]
+        flow_size = size[start:start + count]
+        if (np.diff(flow_ts) < 0).any():
+            by_time = np.argsort(flow_ts, kind='stable')
+            flow_ts, flow_size = flow_ts[by_time], flow_size[by_time]
+        flows[name] = (flow_ts, flow_size)
+    return flows
+
+
+class _BinnedFlows:
+    """
+    Sparse binned series for a set of flows on a shared grid: the non-empty
+    bins of each flow plus the per-flow sums needed to turn raw lagged dot
+    products into Pearson correlations without densifying the series.
+    """
+    def __init__(self, flows: List[Flow], start_us: int, bin_us: int, n_bins: int,
+                 max_lag: int, use_bytes: bool):
+        flow_idx, bins, weights = [], [], []
+        self.total = np.zeros(len(flows))
+        self.mean = np.zeros(len(flows))
+        self.norm = np.zeros(len(flows))
+        # head[i, k] / tail[i, k]: sum of the first / last k bins of flow i
+        self.head = np.zeros((len(flows), max_lag + 1))
+        self.tail = np.zeros((len(flows), max_lag + 1))
+        lags = np.arange(max_lag + 1)
+
+        for i, (ts, size) in enumerate(flows):
+            flow_bins, inverse = np.unique((ts - start_us) // bin_us, return_inverse=True)
+            w = np.bincount(inverse, weights=size if use_bytes else None).astype(np.float64)
+
+            total = w.sum()
+            self.total[i] = total
+            self.mean[i] = total / n_bins
+            variance = (w * w).sum() - n_bins * self.mean[i] ** 2
+            # A series that is constant over the whole window cannot correlate
+            self.norm[i] = np.sqrt(variance) if variance > 1e-9 * max(total * total, 1.0) else 0.0
+
+            cumulative = np.concatenate([[0.0], np.cumsum(w)])
+            self.head[i] = cumulative[np.searchsorted(flow_bins, lags)]
+            self.tail[i] = total - cumulative[np.searchsorted(flow_bins, n_bins - lags)]
+
+            flow_idx.append(np.full(len(flow_bins), i, dtype=np.int64))
+            bins.append(flow_bins)
+            weights.append(w)
+
+        self.flow_idx = np.concatenate(flow_idx)
+        self.bins = np.concatenate(bins)
+        self.weights = np.concatenate(weights)
+
+    def tiles(self, tile_width: int, n_tiles: int, margin: int = 0):
+        """
+        Assigns non-empty bins to tiles. With a margin, tile t spans bins
+        [t * tile_width - margin, (t + 1) * tile_width + margin), so a bin near
+        a boundary also lands in the neighbouring tile. Returns (tile, flow,
+        column, weight) arrays sorted by tile.
+        """
+        tile = (self.bins + margin) // tile_width
+        flow, weight, bins = self.flow_idx, self.weights, self.bins
+        if margin:
+            lower = (self.bins - margin) // tile_width
+            spill = lower != tile
+            tile = np.concatenate([tile, lower[spill]])
+            flow = np.concatenate([flow, flow[spill]])
+            weight = np.concatenate([weight, weight[spill]])
+            bins = np.concatenate([bins, bins[spill]])
+
+        keep = (tile >= 0) & (tile < n_tiles)
+        tile, flow, weight, bins = tile[keep], flow[keep], weight[keep], bins[keep]
+        order = np.lexsort((flow, tile))
+        tile, flow, weight, bins = tile[order], flow[order], weight[order], bins[order]
+        return tile, flow, bins - tile * tile_width + margin, weight
+
+
+class FlowCorrelator:
+    """
+    Matches entry-side (ingress) flows against exit-side (egress) flows.
+
+    Every flow is binned onto a shared time grid (bytes or packets per bin)
+    and each ingress/egress pair is scored by the peak Pearson correlation of
+    the two series over lags within +/- max_lag, which tolerates the latency
+    a circuit adds between its two ends.
+
+    The capture window is cut into tiles a few times wider than the lag
+    window. Within a tile only the flows active there are transformed, and
+    the lagged dot products of all active pairs come from one batched real
+    FFT product. Pairs that never overlap in time cost nothing, so a window
+    of thousands of short-lived flows scales with actual overlap rather than
+    N x M x window length. Mean and norm corrections are applied per pair
+    from per-flow sums, so scores equal those of the dense zero-mean
+    cross-correlation over the whole window.
+    """
+    def __init__(self, bin_width: float = 0.1, max_lag: float = 2.0,
+                 metric: str = "bytes", memory_budget: int = 16_000_000):
+        if metric not in ("bytes", "packets"):
+            raise ValueError("metric must be 'bytes' or 'packets'")
+        if bin_width <= 0:
+            raise ValueError("bin_width must be positive")
+        if max_lag < 0:
+            raise ValueError("max_lag must not be negative")
+        self.bin_us = max(1, int(round(bin_width * 1_000_000)))
+        self.max_lag_bins = int(round(max_lag * 1_000_000 / self.bin_us))
+        self.metric = metric
+        # Upper bound on float64 elements held by any one batch
+        self.memory_budget = memory_budget
+
+    def correlate(self, ingress: Dict[str, Flow], egress: Dict[str, Flow],
+                  top_k: int = 20, exclude_identical: bool = False) -> Dict:
+        if not ingress or not egress:
+            return {"pairs": [], "ingress_flows": len(ingress), "egress_flows": len(egress), "bins": 0}
+
+        ingress_keys = list(ingress)
+        egress_keys = list(egress)
+        all_flows = list(ingress.values()) + list(egress.values())
+
+        start_us = min(int(ts[0]) for ts, _ in all_flows)
+        end_us = max(int(ts[-1]) for ts, _ in all_flows)
+        n_bins = (end_us - start_us) // self.bin_us + 1
+        lag = min(self.max_lag_bins, n_bins - 1)
+        n_lags = 2 * lag + 1
+
+        use_bytes = self.metric == "bytes"
+        x = _BinnedFlows(list(ingress.values()), start_us, self.bin_us, n_bins, lag, use_bytes)
+        y = _BinnedFlows(list(egress.values()), start_us, self.bin_us, n_bins, lag, use_bytes)
+
+        # Egress tiles carry `lag` extra bins on each side; the FFT length
+        # covers tile_width + 2 * lag so no product wraps around.
+        fft_len = _fft_length(max(512, 8 * n_lags))
+        tile_width = fft_len - 2 * lag
+        n_tiles = (n_bins + tile_width - 1) // tile_width
+
+        x_tile, x_flow, x_col, x_weight = x.tiles(tile_width, n_tiles)
+        y_tile, y_flow, y_col, y_weight = y.tiles(tile_width, n_tiles, margin=lag)
+        x_bounds = np.searchsorted(x_tile, np.arange(n_tiles + 1))
+        y_bounds = np.searchsorted(y_tile, np.arange(n_tiles + 1))
+
+        # d > 0 means the egress flow trails the ingress flow by d bins.
+        # Per lag: bins both series cover, and each series' sum over them.
+        d = np.arange(-lag, lag + 1)
+        overlap = n_bins - np.abs(d)
+        x_sum = x.total[:, None] - np.where(d > 0, x.tail[:, np.clip(d, 0, None)], x.head[:, np.clip(-d, 0, None)])
+        y_sum = y.total[:, None] - np.where(d > 0, y.head[:, np.clip(d, 0, None)], y.tail[:, np.clip(-d, 0, None)])
+
+        twin = None
+        if exclude_identical:
+            egress_index = {key: j for j, key in enumerate(egress_keys)}
+            twin = np.array([egress_index.get(key, -1) for key in ingress_keys])
+
+        n_egress = len(egress_keys)
+        block = max(1, self.memory_budget // (n_egress * n_lags))
+        best_heap: List[Tuple[float, int, int, int]] = []
+
+        for i0 in range(0, len(ingress_keys), block):
+            i1 = min(i0 + block, len(ingress_keys))
+            acc = np.zeros((i1 - i0, n_egress, n_lags))
+
+            for t in range(n_tiles):
+                if y_bounds[t] == y_bounds[t + 1]:
+                    continue
+                xs = slice(x_bounds[t], x_bounds[t + 1])
+                in_block = (x_flow[xs] >= i0) & (x_flow[xs] < i1)
+                if not in_block.any():
+                    continue
+                rows, row_inverse = np.unique(x_flow[xs][in_block], return_inverse=True)
+                x_dense = np.zeros((len(rows), fft_len))
+                x_dense[row_inverse, x_col[xs][in_block]] = x_weight[xs][in_block]
+
+                ys = slice(y_bounds[t], y_bounds[t + 1])
+                cols, col_inverse = np.unique(y_flow[ys], return_inverse=True)
+                y_dense = np.zeros((len(cols), fft_len))
+                y_dense[col_inverse, y_col[ys]] = y_weight[ys]
+
+                x_spec = np.conj(np.fft.rfft(x_dense, axis=1))
+                y_spec = np.fft.rfft(y_dense, axis=1)
+
+                chunk = max(1, self.memory_budget // (len(cols) * fft_len))
+                for r0 in range(0, len(rows), chunk):
+                    r1 = min(r0 + chunk, len(rows))
+                    cross = np.fft.irfft(x_spec[r0:r1, None, :] * y_spec[None, :, :], n=fft_len, axis=2)
+                    acc[np.ix_(rows[r0:r1] - i0, cols)] += cross[:, :, :n_lags]
+
+            # Raw lagged dot products -> correlation of the zero-mean series
+            mx, my = x.mean[i0:i1, None, None], y.mean[None, :, None]
+            acc -= mx * y_sum[None, :, :]
+            acc -= my * x_sum[i0:i1, None, :]
+            acc += overlap * mx * my
+            denom = (x.norm[i0:i1, None] * y.norm[None, :])[:, :, None]
+            np.divide(acc, denom, out=acc, where=denom > 0)
+            acc[denom[:, :, 0] == 0] = 0
+
+            peak_pos = acc.argmax(axis=2)
+            peak = np.take_along_axis(acc, peak_pos[:, :, None], axis=2)[:, :, 0]
+            if twin is not None:
+                has_twin = np.nonzero(twin[i0:i1] >= 0)[0]
+                peak[has_twin, twin[i0:i1][has_twin]] = -np.inf
+
+            flat = peak.ravel()
+            k = min(top_k, flat.size)
+            for idx in np.argpartition(flat, -k)[-k:]:
+                score = float(flat[idx])
+                if not np.isfinite(score):
+                    continue
+                bi, j = divmod(int(idx), n_egress)
+                entry = (score, i0 + bi, j, int(d[peak_pos[bi, j]]))
+                if len(best_heap) < top_k:
+                    heapq.heappush(best_heap, entry)
+                elif entry > best_heap[0]:
+                    heapq.heapreplace(best_heap, entry)
+
+        pairs = []
+        for score, i, j, lag_bins in sorted(best_heap, reverse=True):
+            pairs.append({
+                "ingress_flow": ingress_keys[i],
+                "egress_flow": egress_keys[j],
+                "score": round(score, 4),
+                "lag_seconds": lag_bins * self.bin_us / 1_000_000,
+                "ingress_packets": int(len(ingress[ingress_keys[i]][0])),
+                "egress_packets": int(len(egress[egress_keys[j]][0]))
+            })
+
+        return {
+            "pairs": pairs,
+            "ingress_flows": len(ingress_keys),
+            "egress_flows": len(egress_keys),
+            "bins": int(n_bins),
+            "bin_width": self.bin_us / 1_000_000,
+            "max_lag": lag * self.bin_us / 1_000_000,
+            "metric": self.metric
+        }
@@ -0,0 +1,206 @@
+import ipaddress
+import os
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+from backend.services.pcap_reader import mask_address, MASKED_IP
+
+IP_PROTOCOL_NAMES = {1: "ICMP", 6: "TCP", 17: "UDP", 58: "ICMPV6"}
+
+# Flows idle this long (capture time) are closed and handed back for writing
+DEFAULT_IDLE_TIMEOUT_S = 120.0
+# Upper bound on concurrently tracked flows; the least recently active is evicted beyond it
+DEFAULT_MAX_FLOWS = int(os.getenv("FLOW_TABLE_MAX_FLOWS", "250000"))
+# Idle sweeps run at most once per this much capture time
+SWEEP_INTERVAL_US = 1_000_000
+# Per-address locality lookups are memoized; the memo is reset once it reaches this size
+LOCALITY_CACHE_SIZE = 65536
+
+
+def _parse_networks(spec: str) -> List:
+    return [ipaddress.ip_network(part.strip(), strict=False) for part in spec.split(",") if part.strip()]
+
+# Comma-separated CIDRs of the monitored side, e.g. "10.1.0.0/16,2001:db8::/32"
+OBSERVER_NETWORKS = _parse_networks(os.getenv("OBSERVER_NETWORKS", ""))
+
+
+def _as_ip(addr):
+    try:
+        return ipaddress.ip_address(addr)
+    except ValueError:
+        return None
+
+
+class Flow:
+    """
+    Counters for one bidirectional 5-tuple flow. The "local" endpoint is the
+    observer's side: packets it sends are outbound, packets it receives are
+    inbound.
+    """
+    __slots__ = (
+        "flow_id", "ip_proto", "protocol", "local_addr", "local_port", "remote_addr", "remote_port",
+        "first_us", "last_us", "outbound_packets", "outbound_bytes", "inbound_packets", "inbound_bytes",
+        "cells"
+    )
+
+    def __init__(self, flow_id: int, ip_proto: int, protocol: str, local: Tuple, remote: Tuple, ts_us: int):
+        self.flow_id = flow_id
+        self.ip_proto = ip_proto
+        self.protocol = protocol
+        self.local_addr, self.local_port = local
+        self.remote_addr, self.remote_port = remote
+        self.first_us = self.last_us = ts_us
+        self.outbound_packets = self.outbound_bytes = 0
+        self.inbound_packets = self.inbound_bytes = 0
+        # CellFeatures, attached by the parser once the flow shows TLS records
+        self.cells = None
+
+    @property
+    def packets(self) -> int:
+        return self.outbound_packets + self.inbound_packets
+
+    @property
+    def bytes(self) -> int:
+        return self.outbound_bytes + self.inbound_bytes
+
+
+class FlowTable:
+    """
+    Streaming flow reassembly keyed by (ip_proto, endpoint, endpoint), with
+    the endpoints in canonical order so both directions share one entry.
+
+    Entries live in an OrderedDict kept in last-activity order, so idle
+    flows and, past `max_flows`, the least recently active ones are evicted
+    from the front in O(1) each. Evicted flows queue up until drain() hands
+    them to the caller for writing; memory stays bounded by `max_flows`
+    however long the capture. A 5-tuple seen again after eviction starts a
+    new flow, as in connection tracking.
+
+    The local side of a new flow is, in order of preference: the endpoint
+    inside `observer_networks`; the private (RFC 1918 / ULA / loopback /
+    link-local) endpoint when only one is private; the initiator, i.e. the
+    sender of the first packet, unless that packet came from a well-known
+    port to an ephemeral one (a capture that started mid-connection).
+    """
+    def __init__(self, max_flows: int = DEFAULT_MAX_FLOWS,
+                 idle_timeout_s: float = DEFAULT_IDLE_TIMEOUT_S,
+                 observer_networks: Optional[Sequence] = None):
+        self.max_flows = max_flows
+        self.idle_timeout_us = int(idle_timeout_s * 1_000_000)
+        self.observer_networks = OBSERVER_NETWORKS if observer_networks is None else list(observer_networks)
+        self.flows: "OrderedDict[Hashable, Flow]" = OrderedDict()
+        self.next_flow_id = 1
+        self.evicted = 0
+        self._closed: List[Flow] = []
+        self._next_sweep_us: Optional[int] = None
+        self._locality: Dict = {}
+
+    def __len__(self) -> int:
+        return len(self.flows)
+
+    def add(self, ts_us: int, ip_proto: int, src, src_port: int, dst, dst_port: int,
+            size: int, protocol: str = "") -> Tuple[Flow, str]:
+        """Accounts one packet; returns its flow and direction."""
+        src_end = (src, src_port)
+        dst_end = (dst, dst_port)
+        key = (ip_proto, src_end, dst_end) if src_end <= dst_end else (ip_proto, dst_end, src_end)
+
+        flow = self.flows.get(key)
+        if flow is None:
+            local, remote = self._orient(src_end, dst_end)
+            flow = Flow(self.next_flow_id, ip_proto, protocol, local, remote, ts_us)
+            self.next_flow_id += 1
+            self.flows[key] = flow
+            if len(self.flows) > self.max_flows:
+                self._close(self.flows.popitem(last=False)[1])
+        else:
+            self.flows.move_to_end(key)
+            if protocol != flow.protocol and protocol != IP_PROTOCOL_NAMES.get(ip_proto):
+                # Handshakes classify as plain TCP/UDP; keep the application label once one shows up
+                flow.protocol = protocol
+
+        if ts_us > flow.last_us:
+            flow.last_us = ts_us
+        if flow.local_addr == src and flow.local_port == src_port:
+            flow.outbound_packets += 1
+            flow.outbound_bytes += size
+            direction = "outbound"
+        else:
+            flow.inbound_packets += 1
+            flow.inbound_bytes += size
+            direction = "inbound"
+
+        if self._next_sweep_us is None:
+            self._next_sweep_us = ts_us + SWEEP_INTERVAL_US
+        elif ts_us >= self._next_sweep_us:
+            self.expire_idle(ts_us)
+            self._next_sweep_us = ts_us + SWEEP_INTERVAL_US
+        return flow, direction
+
+    def expire_idle(self, now_us: int):
+        cutoff = now_us - self.idle_timeout_us
+        flows = self.flows
+        while flows:
+            key = next(iter(flows))
+            if flows[key].last_us >= cutoff:
+                break
+            self._close(flows.pop(key))
+
+    def _close(self, flow: Flow):
+        self.evicted += 1
+        self._closed.append(flow)
+
+    def drain(self) -> List[Flow]:
+        """Flows closed since the last call."""
+        closed, self._closed = self._closed, []
+        return closed
+
+    def close_all(self) -> List[Flow]:
+        """Ends the capture: every remaining flow is closed and returned with any pending ones."""
+        closed = self.drain() + list(self.flows.values())
+        self.flows.clear()
+        return closed
+
+    def _locality_of(self, addr) -> int:
+        """2 inside observer_networks, 1 private, 0 public or unparseable."""
+        locality = self._locality.get(addr)
+        if locality is None:
+            ip = _as_ip(addr)
+            if ip is None:
+                locality = 0
+            elif any(ip in net for net in self.observer_networks if net.version == ip.version):
+                locality = 2
+            else:
+                locality = 1 if ip.is_private else 0
+            if len(self._locality) >= LOCALITY_CACHE_SIZE:
+                self._locality.clear()
+            self._locality[addr] = locality
+        return locality
+
+    def _orient(self, src_end: Tuple, dst_end: Tuple) -> Tuple[Tuple, Tuple]:
+        src_locality = self._locality_of(src_end[0])
+        dst_locality = self._locality_of(dst_end[0])
+        if src_locality != dst_locality:
+            return (src_end, dst_end) if src_locality > dst_locality else (dst_end, src_end)
+        if 0 < src_end[1] < 1024 <= dst_end[1]:
+            return dst_end, src_end
+        return src_end, dst_end
+
+
+def _mask(addr) -> str:
+    # Raw bytes from the native reader, dotted/colon text from pyshark
+    if isinstance(addr, bytes):
+        return mask_address(addr)
+    ip = _as_ip(addr)
+    return mask_address(ip.packed) if ip is not None else MASKED_IP
+
+
+def flow_row(session_id: str, flow: Flow) -> tuple:
+    """The flow as a database.FLOW_COLUMNS row, with addresses masked like packets."""
+    return (
+        session_id, flow.flow_id,
+        IP_PROTOCOL_NAMES.get(flow.ip_proto, str(flow.ip_proto)), flow.protocol,
+        _mask(flow.local_addr), flow.local_port, _mask(flow.remote_addr), flow.remote_port,
+        flow.first_us, flow.last_us, flow.packets, flow.bytes,
+        flow.outbound_packets, flow.outbound_bytes, flow.inbound_packets, flow.inbound_bytes
+    )
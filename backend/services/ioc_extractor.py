@@ -0,0 +1,114 @@
+import re
+from typing import Dict, List
+
+# One pass finds every kind; alternatives are tried in this order at each word start.
+# A dotted quad followed by another label (1.2.3.4.example.com, 256.1.1.1.com)
+# is left to the domain alternative so the whole host is kept.
+IOC_PATTERN = re.compile(
+    r"\b(?:"
+    r"(?P<onion>[a-z2-7]{16,56}\.onion)"
+    r"|(?P<ip>\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}(?!\.[a-zA-Z0-9]))"
+    r"|(?P<domain>(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,6})"
+    r")\b"
+)
+ONION_NAME = re.compile(r"[a-z2-7]{16,56}")
+# A chunk's trailing run without whitespace or punctuation waits for the
+# next chunk, up to this many characters
+MAX_CARRY = 4096
+
+
+def _valid_ipv4(value: str) -> bool:
+    return all(int(octet) <= 255 for octet in value.split("."))
+
+
+def _split_point(text: str) -> int:
+    """Index just past the last character no indicator can contain."""
+    i = len(text)
+    stop = max(0, i - MAX_CARRY)
+    while i > stop:
+        ch = text[i - 1]
+        if not (ch.isalnum() or ch in "._-"):
+            return i
+        i -= 1
+    return i
+
+
+class IOCExtractor:
+    """
+    Single-pass IP / domain / onion extraction over text of any size.
+
+    Indicators never contain whitespace or a dot-free token, so only
+    whitespace-separated tokens holding a dot are scanned, newline-joined so
+    \\b still sees a boundary at every token edge, with one combined
+    pattern. IPs are validated and all kinds deduplicated on the unique
+    values of each chunk rather than per match.
+
+    Text can be fed in chunks (uploads, streamed pages): feed() returns the
+    indicators first seen in that chunk and close() flushes the held-back
+    tail. Only the indicators seen so far are kept, never the text.
+    """
+    KINDS = ("ips", "domains", "onions")
+
+    def __init__(self):
+        # Dicts as insertion-ordered sets, so results keep the order indicators turned up in
+        self._seen: Dict[str, Dict[str, None]] = {kind: {} for kind in self.KINDS}
+        self._tail = ""
+        self.chars = 0
+
+    def feed(self, text: str) -> Dict[str, List[str]]:
+        self.chars += len(text)
+        text = self._tail + text
+        cut = _split_point(text)
+        self._tail = text[cut:]
+        return self._scan(text[:cut])
+
+    def close(self) -> Dict[str, List[str]]:
+        tail, self._tail = self._tail, ""
+        return self._scan(tail)
+
+    def _scan(self, text: str) -> Dict[str, List[str]]:
+        candidates = "\n".join([token for token in text.split() if "." in token])
+        ips: Dict[str, None] = {}
+        domains: Dict[str, None] = {}
+        onions: Dict[str, None] = {}
+        for onion, ip, domain in IOC_PATTERN.findall(candidates):
+            if onion:
+                onions[onion] = None
+            elif ip:
+                ips[ip] = None
+            else:
+                domains[domain] = None
+
+        found = {"ips": [ip for ip in ips if _valid_ipv4(ip)], "domains": [], "onions": list(onions)}
+        for domain in domains:
+            if not domain.endswith(".onion"):
+                found["domains"].append(domain)
+                continue
+            # Subdomains in front of an onion address make it a domain match
+            name = domain[:-len(".onion")].rsplit(".", 1)[-1]
+            if ONION_NAME.fullmatch(name):
+                found["onions"].append(name + ".onion")
+
+        new: Dict[str, List[str]] = {}
+        for kind, values in found.items():
+            seen = self._seen[kind]
+            new[kind] = [value for value in dict.fromkeys(values) if value not in seen]
+            seen.update(dict.fromkeys(new[kind]))
+        return new
+
+    def counts(self) -> Dict[str, int]:
+        counts = {kind: len(seen) for kind, seen in self._seen.items()}
+        counts["count"] = sum(counts.values())
+        return counts
+
+    def result(self) -> Dict:
+        result: Dict = {kind: list(seen) for kind, seen in self._seen.items()}
+        result["count"] = sum(len(seen) for seen in self._seen.values())
+        return result
+
+
+def extract_iocs(text: str) -> Dict:
+    extractor = IOCExtractor()
+    extractor.feed(text)
+    extractor.close()
+    return extractor.result()
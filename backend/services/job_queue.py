@@ -0,0 +1,372 @@
+import asyncio
+import concurrent.futures
+import inspect
+import json
+import os
+import time
+import uuid
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from backend.database import db_pool, fetch_all, fetch_one, get_connection
+from backend.services.event_bus import event_bus
+
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+# Idle workers re-check the table this often even without a wake-up
+POLL_INTERVAL = 1.0
+RETRY_BACKOFF_BASE = 2.0
+JOB_RETENTION_DAYS = 7
+# Progress events per job are pushed at most this often; the job row is unaffected
+PROGRESS_EVENT_INTERVAL = 0.25
+# Longest a request waits on its job before answering 202 with the job instead
+REQUEST_WAIT_TIMEOUT = float(os.getenv("JOB_WAIT_TIMEOUT", "120"))
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler once cancellation of its job was requested."""
+
+
+class PermanentJobError(Exception):
+    """A failure that retrying cannot fix; the job fails without further attempts."""
+
+
+def _to_json(value: Any) -> str:
+    # NumPy scalars expose item(); anything else unknown is stored as text
+    return json.dumps(value, default=lambda o: o.item() if hasattr(o, "item") else str(o))
+
+
+def _job_scope(payload: Dict) -> Dict[str, Optional[str]]:
+    """The session and case a job's events belong to, taken from its payload."""
+    session_id = payload.get("session_id")
+    case_id = payload.get("case_id")
+    return {
+        "session_id": session_id if isinstance(session_id, str) else None,
+        "case_id": case_id if isinstance(case_id, str) else None
+    }
+
+
+class JobContext:
+    """
+    Handed to job handlers: the decoded payload, attempt bookkeeping and a
+    progress() call that publishes progress and raises JobCancelled once the
+    job has been cancelled. Progress is also pushed to event stream
+    subscribers, throttled to PROGRESS_EVENT_INTERVAL.
+
+    Live progress is held in memory and written to the table when the job
+    finishes. A handler may be holding a long write transaction of its own
+    (PCAP ingest does), and a progress write on a second connection would
+    wait on that same lock.
+    """
+    def __init__(self, queue: "JobQueue", row: Dict):
+        self.queue = queue
+        self.job_id = row["job_id"]
+        self.job_type = row["job_type"]
+        self.payload = json.loads(row["payload"])
+        self.attempt = row["attempts"]
+        self.max_attempts = row["max_attempts"]
+        self.progress_fields: Dict = {}
+        self.scope = _job_scope(self.payload)
+        self._progress_published = 0.0
+        # Set while the handler runs on the server loop, so cancel() can interrupt it
+        self._future: Optional[concurrent.futures.Future] = None
+
+    @property
+    def is_last_attempt(self) -> bool:
+        return self.attempt >= self.max_attempts
+
+    def progress(self, **fields):
+        self.progress_fields.update(fields)
+        now = time.monotonic()
+        if now - self._progress_published >= PROGRESS_EVENT_INTERVAL:
+            self._progress_published = now
+            self.publish("job.progress", {"job_type": self.job_type, "progress": dict(self.progress_fields)})
+        self.check_cancelled()
+
+    def publish(self, event_type: str, data: Dict):
+        """Pushes an event scoped to this job and its session or case."""
+        event_bus.publish(event_type, data, job_id=self.job_id, **self.scope)
+
+    def check_cancelled(self):
+        if self.job_id in self.queue._cancel_flags:
+            raise JobCancelled()
+
+
+class JobQueue:
+    """
+    Persistent job queue backed by the `jobs` table with a local pool of
+    worker threads. Jobs are claimed atomically, retried with exponential
+    backoff, can be cancelled while queued or running, and jobs that were
+    running when the server stopped are re-queued on the next start.
+
+    Handlers are registered per job type and receive a JobContext; they may
+    be plain functions or coroutines. Coroutines run on a private event loop
+    in the worker thread, or with on_event_loop=True on the server's loop,
+    where they can share its long-lived clients; those must not block.
+    """
+    def __init__(self, workers: int = 4):
+        self.workers = workers
+        self.handlers: Dict[str, Callable] = {}
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wake = threading.Condition()
+        # Jobs running in this process: live context and pending cancellations
+        self._running: Dict[str, JobContext] = {}
+        self._cancel_flags = set()
+        self._loop_handlers = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register(self, job_type: str, handler: Callable[[JobContext], Any], on_event_loop: bool = False):
+        self.handlers[job_type] = handler
+        if on_event_loop:
+            self._loop_handlers.add(job_type)
+
+    def start(self):
+        if self._threads:
+            return
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Started outside the server (scripts): every coroutine gets its own loop
+            self._loop = None
+        conn = get_connection()
+        # Anything still marked running was interrupted by a restart
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE status = 'running' AND cancel_requested = 1",
+            (datetime.now().isoformat(),)
+        )
+        recovered = conn.execute(
+            "UPDATE jobs SET status = 'queued', run_after = 0 WHERE status = 'running'"
+        ).rowcount
+        cutoff = (datetime.now() - timedelta(days=JOB_RETENTION_DAYS)).isoformat()
+        conn.execute(
+            f"DELETE FROM jobs WHERE status IN {FINISHED_STATUSES} AND finished_at < ?", (cutoff,)
+        )
+        conn.commit()
+        conn.close()
+        if recovered:
+            print(f"Job queue: re-queued {recovered} interrupted job(s)")
+
+        self._stop.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # Public API, called from request handlers on the event loop
+
+    async def submit(self, job_type: str, payload: Dict, max_attempts: int = 3) -> Dict:
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job_id = f"JOB-{uuid.uuid4().hex[:12].upper()}"
+        async with db_pool.write() as conn:
+            await conn.execute('''
+                INSERT INTO jobs (job_id, job_type, status, payload, max_attempts, created_at)
+                VALUES (?, ?, 'queued', ?, ?, ?)
+            ''', (job_id, job_type, _to_json(payload), max_attempts, datetime.now().isoformat()))
+
+        with self._wake:
+            self._wake.notify()
+        event_bus.publish("job.queued", {"job_type": job_type}, job_id=job_id, **_job_scope(payload))
+        return await self.get(job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        async with db_pool.write() as conn:
+            cursor = await conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                (datetime.now().isoformat(), job_id)
+            )
+            dequeued = cursor.rowcount > 0
+            # A running job stops at its next progress() call; the persisted flag
+            # also keeps it from being re-queued if the server restarts first
+            await conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE job_id = ? AND status = 'running'", (job_id,))
+        # After the write, so a job claimed meanwhile either sees the flag in
+        # its row or is already in _running
+        ctx = self._running.get(job_id)
+        if ctx is not None:
+            self._cancel_flags.add(job_id)
+            if ctx._future is not None:
+                ctx._future.cancel()
+        job = await self.get(job_id)
+        if job and dequeued:
+            self._publish_finished(job_id, job["job_type"], job["payload"], "cancelled", "Cancelled")
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        row = await fetch_one("SELECT * FROM jobs WHERE job_id = ?", (job_id,))
+        return self._decode(row) if row else None
+
+    async def list(self, status: Optional[str] = None, job_type: Optional[str] = None, limit: int = 100) -> List[Dict]:
+        query = "SELECT * FROM jobs WHERE 1=1"
+        params: List[Any] = []
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if job_type:
+            query += " AND job_type = ?"
+            params.append(job_type)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+        return [self._decode(row) for row in await fetch_all(query, params)]
+
+    async def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict]:
+        """Polls until the job finishes or the timeout passes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        interval = 0.02
+        while True:
+            job = await self.get(job_id)
+            if job is None or job["status"] in FINISHED_STATUSES:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                return job
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 0.25)
+
+    def _decode(self, job: Dict) -> Dict:
+        job["payload"] = json.loads(job["payload"]) if job["payload"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+        live = self._running.get(job["job_id"])
+        if live is not None and job["status"] == "running":
+            job["progress"] = dict(live.progress_fields)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job.pop("run_after", None)
+        if job["started_at"]:
+            end = datetime.fromisoformat(job["finished_at"]) if job["finished_at"] else datetime.now()
+            job["elapsed_seconds"] = round((end - datetime.fromisoformat(job["started_at"])).total_seconds(), 3)
+        return job
+
+    # Worker side, on the queue's own threads
+
+    def _claim(self) -> Optional[Dict]:
+        conn = get_connection()
+        try:
+            row = conn.execute('''
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, started_at = ?,
+                    finished_at = NULL, progress = NULL
+                WHERE job_id = (
+                    SELECT job_id FROM jobs
+                    WHERE status = 'queued' AND cancel_requested = 0 AND run_after <= ?
+                    ORDER BY created_at LIMIT 1
+                ) AND status = 'queued'
+                RETURNING *
+            ''', (datetime.now().isoformat(), time.time())).fetchone()
+            conn.commit()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                row = self._claim()
+            except Exception as e:
+                print(f"Job queue: claim failed: {e}")
+                row = None
+            if row is None:
+                with self._wake:
+                    self._wake.wait(POLL_INTERVAL)
+                continue
+            self._execute(row)
+
+    def _execute(self, row: Dict):
+        ctx = JobContext(self, row)
+        handler = self.handlers.get(ctx.job_type)
+        self._running[ctx.job_id] = ctx
+        # Re-read rather than trust the claimed row: cancel() may have flagged
+        # the job between the claim and registering it in _running
+        if self._cancel_requested(ctx.job_id):
+            self._cancel_flags.add(ctx.job_id)
+        ctx.publish("job.started", {"job_type": ctx.job_type, "attempt": ctx.attempt})
+        try:
+            if handler is None:
+                raise PermanentJobError(f"No handler registered for job type '{ctx.job_type}'")
+            if inspect.iscoroutinefunction(handler):
+                if ctx.job_type in self._loop_handlers and self._loop is not None:
+                    ctx._future = asyncio.run_coroutine_threadsafe(handler(ctx), self._loop)
+                    result = ctx._future.result()
+                else:
+                    result = asyncio.run(handler(ctx))
+            else:
+                result = handler(ctx)
+            self._finish(ctx, "completed", result=result)
+        except (JobCancelled, concurrent.futures.CancelledError):
+            self._finish(ctx, "cancelled", error="Cancelled")
+        except PermanentJobError as e:
+            print(f"Job {ctx.job_id} ({ctx.job_type}) failed: {e}")
+            self._finish(ctx, "failed", error=str(e))
+        except Exception as e:
+            print(f"Job {ctx.job_id} ({ctx.job_type}) attempt {ctx.attempt} failed: {e}")
+            if ctx.is_last_attempt:
+                self._finish(ctx, "failed", error=str(e))
+            else:
+                self._retry(ctx, str(e))
+        finally:
+            self._running.pop(ctx.job_id, None)
+            self._cancel_flags.discard(ctx.job_id)
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        conn = get_connection()
+        try:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            return bool(row and row[0])
+        finally:
+            conn.close()
+
+    def _finish(self, ctx: JobContext, status: str, result: Any = None, error: Optional[str] = None):
+        conn = get_connection()
+        conn.execute('''
+            UPDATE jobs SET status = ?, result = ?, error = ?, progress = ?, finished_at = ?
+            WHERE job_id = ?
+        ''', (
+            status,
+            _to_json(result) if result is not None else None,
+            error,
+            _to_json(ctx.progress_fields) if ctx.progress_fields else None,
+            datetime.now().isoformat(),
+            ctx.job_id
+        ))
+        conn.commit()
+        conn.close()
+        self._publish_finished(ctx.job_id, ctx.job_type, ctx.payload, status, error, ctx.progress_fields)
+
+    def _publish_finished(self, job_id: str, job_type: str, payload: Dict, status: str,
+                          error: Optional[str], progress: Optional[Dict] = None):
+        # Results can be large; subscribers fetch them from /api/jobs/{job_id}
+        event_bus.publish("job.finished", {
+            "job_type": job_type,
+            "status": status,
+            "error": error,
+            "progress": progress or {}
+        }, job_id=job_id, **_job_scope(payload))
+
+    def _retry(self, ctx: JobContext, error: str):
+        delay = RETRY_BACKOFF_BASE ** ctx.attempt
+        conn = get_connection()
+        requeued = conn.execute('''
+            UPDATE jobs SET status = 'queued', error = ?, run_after = ?
+            WHERE job_id = ? AND cancel_requested = 0
+        ''', (error, time.time() + delay, ctx.job_id)).rowcount
+        conn.execute('''
+            UPDATE jobs SET status = 'cancelled', error = 'Cancelled', finished_at = ?
+            WHERE job_id = ? AND cancel_requested = 1
+        ''', (datetime.now().isoformat(), ctx.job_id))
+        conn.commit()
+        conn.close()
+        if requeued:
+            ctx.publish("job.retrying", {"job_type": ctx.job_type, "attempt": ctx.attempt, "error": error, "retry_in": delay})
+        else:
+            self._publish_finished(ctx.job_id, ctx.job_type, ctx.payload, "cancelled", "Cancelled", ctx.progress_fields)
+
+job_queue = JobQueue(workers=int(os.getenv("JOB_WORKERS", "4")))
@@ -0,0 +1,416 @@
+import heapq
+import ipaddress
+import os
+import socket
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from backend.services.cell_features import CellFeatures
+from backend.services.correlation_engine import (
+    overall_confidence, pattern_score, timing_score, traffic_ratio, volume_score
+)
+from backend.services.flow_table import FlowTable
+from backend.services.pcap_reader import classify_protocol, decode_packet, mask_address, MASKED_IP
+
+# Most recent packets remembered per flow; older ones leave the flow's window early
+FLOW_RING_SIZE = 256
+# Flows listed per window event, by bytes in the window
+TOP_FLOWS = 5
+# Inter-arrival gaps below this count as bursts, as in calculate_timing_correlation
+BURST_GAP_S = 0.1
+# Live feeds must be files under this directory
+LIVE_CAPTURE_DIR = os.getenv("LIVE_CAPTURE_DIR", "captures")
+FEED_POLL_INTERVAL_S = 0.5
+
+
+class _RunningStats:
+    """Welford mean and population variance that also supports removing samples."""
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def remove(self, x: float):
+        if self.n <= 1:
+            self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            return
+        self.n -= 1
+        delta = x - self.mean
+        self.mean -= delta / self.n
+        self.m2 = max(0.0, self.m2 - delta * (x - self.mean))
+
+    @property
+    def std(self) -> float:
+        return (self.m2 / self.n) ** 0.5 if self.n else 0.0
+
+
+class _FlowWindow:
+    """Ring buffer of one flow's recent (ts_us, size, outbound) with running byte totals."""
+    __slots__ = ("flow", "ring", "bytes_out", "bytes_in")
+
+    def __init__(self, flow):
+        self.flow = flow
+        self.ring = deque()
+        self.bytes_out = self.bytes_in = 0
+
+    def add(self, ts_us: int, size: int, outbound: bool, cutoff_us: int, ring_size: int):
+        self.ring.append((ts_us, size, outbound))
+        if outbound:
+            self.bytes_out += size
+        else:
+            self.bytes_in += size
+        self.expire(cutoff_us, ring_size)
+
+    def expire(self, cutoff_us: int, ring_size: int = FLOW_RING_SIZE):
+        ring = self.ring
+        while ring and (len(ring) > ring_size or ring[0][0] < cutoff_us):
+            _, size, outbound = ring.popleft()
+            if outbound:
+                self.bytes_out -= size
+            else:
+                self.bytes_in -= size
+
+    def summary(self) -> Dict:
+        flow = self.flow
+        return {
+            "flow_id": flow.flow_id,
+            "local": f"{_mask(flow.local_addr)}:{flow.local_port}",
+            "remote": f"{_mask(flow.remote_addr)}:{flow.remote_port}",
+            "protocol": flow.protocol,
+            "packets": len(self.ring),
+            "outbound_bytes": self.bytes_out,
+            "inbound_bytes": self.bytes_in,
+        }
+
+
+def _mask(addr) -> str:
+    return mask_address(addr) if isinstance(addr, bytes) else MASKED_IP
+
+
+class OnlineCorrelator:
+    """
+    Scores a live packet feed over a sliding window of the last
+    `time_window` seconds of capture time, with the same timing, volume and
+    pattern formulas CorrelationEngine applies to a stored session.
+
+    Every statistic the scores need (inter-arrival mean and deviation,
+    bursts, byte totals per direction, protocol and endpoint counts, packet
+    size deviation, TLS records carrying whole Tor cells) is kept as a
+    running value: a packet is added in O(1) and removed in O(1) when it
+    leaves the window, so each packet costs O(1) amortized however long the
+    feed runs. Flows come from a FlowTable and keep a ring of their last
+    FLOW_RING_SIZE packets, so memory is bounded by the window, the flow
+    table and the rings.
+
+    Scores are emitted as one event per elapsed window (tumbling over the
+    sliding state); windows without traffic produce no event.
+    """
+    def __init__(self, time_window: float = 5.0, flows: Optional[FlowTable] = None,
+                 flow_ring_size: int = FLOW_RING_SIZE):
+        if time_window <= 0:
+            raise ValueError("time_window must be positive")
+        self.window_us = int(time_window * 1_000_000)
+        self.flows = flows if flows is not None else FlowTable()
+        self.flow_ring_size = flow_ring_size
+        self.total_packets = 0
+        self.windows_emitted = 0
+
+        # [ts_us, size, outbound, protocol, src, dst, iat_s, tls_records, cell_records]
+        self._entries = deque()
+        self._last_ts: Optional[int] = None
+        self._next_emit: Optional[int] = None
+        self._iat = _RunningStats()
+        self._sizes = _RunningStats()
+        self._bursts = 0
+        self._bytes_out = self._bytes_in = 0
+        self._protocols: Dict[str, int] = {}
+        self._sources: Dict = {}
+        self._destinations: Dict = {}
+        self._tls_records = self._cell_records = 0
+        self._flow_windows: Dict[int, _FlowWindow] = {}
+
+    def add_frame(self, ts_us: int, wire_len: int, frame, caplen: int, linktype: int) -> Optional[Dict]:
+        """Decodes one captured frame and adds it; returns the window event it completed, if any."""
+        decoded = decode_packet(frame, 0, caplen, linktype)
+        if decoded is None:
+            return self.add(ts_us, wire_len, None, "ETH", MASKED_IP, MASKED_IP)
+        _version, src, dst, ip_proto, src_port, dst_port, payload_offset, payload_len = decoded
+        protocol = classify_protocol(frame, ip_proto, src_port, dst_port, payload_offset, payload_len)
+        flow, direction = self.flows.add(ts_us, ip_proto, src, src_port, dst, dst_port, wire_len, protocol)
+        outbound = direction == "outbound"
+
+        tls_records = cell_records = 0
+        if flow.cells is not None or protocol == "TLS":
+            if flow.cells is None:
+                flow.cells = CellFeatures()
+            cells = flow.cells
+            records_before = cells.records
+            cell_records_before = cells.cell_records_out + cells.cell_records_in
+            cells.add(outbound, frame, payload_offset, payload_len, wire_len - caplen)
+            tls_records = cells.records - records_before
+            cell_records = cells.cell_records_out + cells.cell_records_in - cell_records_before
+
+        event = self.add(ts_us, wire_len, outbound, protocol, mask_address(src), mask_address(dst),
+                         tls_records, cell_records)
+
+        window = self._flow_windows.get(flow.flow_id)
+        if window is None:
+            window = self._flow_windows[flow.flow_id] = _FlowWindow(flow)
+        window.add(ts_us, wire_len, outbound, ts_us - self.window_us, self.flow_ring_size)
+        for closed in self.flows.drain():
+            self._flow_windows.pop(closed.flow_id, None)
+        return event
+
+    def add(self, ts_us: int, size: int, outbound: Optional[bool], protocol: str, src: str, dst: str,
+            tls_records: int = 0, cell_records: int = 0) -> Optional[Dict]:
+        """Adds one packet; `outbound` is None when the direction is unknown."""
+        event = None
+        if self._next_emit is None:
+            self._next_emit = ts_us + self.window_us
+        elif ts_us >= self._next_emit:
+            event = self._emit(self._next_emit)
+            # Skip windows the feed was silent for
+            self._next_emit += ((ts_us - self._next_emit) // self.window_us + 1) * self.window_us
+
+        self._expire(ts_us - self.window_us)
+
+        iat = None
+        if self._last_ts is not None and self._entries:
+            iat = max(0, ts_us - self._last_ts) / 1_000_000
+            self._iat.add(iat)
+            if iat < BURST_GAP_S:
+                self._bursts += 1
+        self._last_ts = ts_us
+
+        self._entries.append([ts_us, size, outbound, protocol, src, dst, iat, tls_records, cell_records])
+        self._sizes.add(size)
+        if outbound:
+            self._bytes_out += size
+        elif outbound is not None:
+            self._bytes_in += size
+        self._protocols[protocol] = self._protocols.get(protocol, 0) + 1
+        self._sources[src] = self._sources.get(src, 0) + 1
+        self._destinations[dst] = self._destinations.get(dst, 0) + 1
+        self._tls_records += tls_records
+        self._cell_records += cell_records
+        self.total_packets += 1
+        return event
+
+    def _expire(self, cutoff_us: int):
+        entries = self._entries
+        while entries and entries[0][0] < cutoff_us:
+            _, size, outbound, protocol, src, dst, _iat, tls_records, cell_records = entries.popleft()
+            self._sizes.remove(size)
+            if outbound:
+                self._bytes_out -= size
+            elif outbound is not None:
+                self._bytes_in -= size
+            _decrement(self._protocols, protocol)
+            _decrement(self._sources, src)
+            _decrement(self._destinations, dst)
+            self._tls_records -= tls_records
+            self._cell_records -= cell_records
+            if entries:
+                # The new head's gap was to the packet just removed
+                head = entries[0]
+                if head[6] is not None:
+                    self._iat.remove(head[6])
+                    if head[6] < BURST_GAP_S:
+                        self._bursts -= 1
+                    head[6] = None
+
+    def scores(self) -> Dict:
+        """Timing, volume and pattern scores of the packets currently in the window."""
+        n = len(self._entries)
+        timing = volume = pattern = 0.0
+        if n >= 2 and self._iat.n:
+            mean_iat = self._iat.mean
+            cv = self._iat.std / mean_iat if mean_iat > 0 else 0
+            timing = timing_score(cv, self._bursts / self._iat.n, n)
+        if n:
+            volume = volume_score(self._bytes_in, self._bytes_out, n, self._sizes.mean)
+        if n >= 10:
+            if self._tls_records:
+                size_uniformity = self._cell_records / self._tls_records
+            else:
+                size_uniformity = 1 - min(self._sizes.std / 2000, 1)
+            pattern = pattern_score(
+                len(self._protocols),
+                self._protocols.get('TLS', 0) / n,
+                self._protocols.get('TCP', 0) / n,
+                len(self._sources) + len(self._destinations),
+                size_uniformity
+            )
+        return {
+            "timing_score": timing,
+            "volume_score": volume,
+            "pattern_score": pattern,
+            "overall_confidence": overall_confidence(timing, volume, pattern),
+        }
+
+    def _emit(self, end_us: int) -> Dict:
+        self._expire(end_us - self.window_us)
+        cutoff = end_us - self.window_us
+        active = []
+        idle = []
+        for flow_id, window in self._flow_windows.items():
+            window.expire(cutoff, self.flow_ring_size)
+            if window.ring:
+                active.append(window)
+            else:
+                idle.append(flow_id)
+        # Flows quiet for a whole window leave the scan; their next packet starts a new ring
+        for flow_id in idle:
+            del self._flow_windows[flow_id]
+        top = heapq.nlargest(TOP_FLOWS, active, key=lambda w: w.bytes_out + w.bytes_in)
+
+        self.windows_emitted += 1
+        return {
+            "window": self.windows_emitted,
+            "window_start_us": end_us - self.window_us,
+            "window_end_us": end_us,
+            "packets": len(self._entries),
+            "bytes": self._bytes_out + self._bytes_in,
+            "outbound_bytes": self._bytes_out,
+            "inbound_bytes": self._bytes_in,
+            "traffic_ratio": traffic_ratio(self._bytes_in, self._bytes_out),
+            "protocols": dict(self._protocols),
+            "tls_records": self._tls_records,
+            "cell_records": self._cell_records,
+            "active_flows": len(active),
+            "top_flows": [window.summary() for window in top],
+            "total_packets": self.total_packets,
+            **self.scores(),
+        }
+
+    def finish(self) -> Optional[Dict]:
+        """Event for the final, partial window once the feed has ended."""
+        if self._last_ts is None or not self._entries:
+            return None
+        event = self._emit(self._last_ts)
+        event["final"] = True
+        return event
+
+    def run(self, records: Iterable[Tuple[int, int, bytes, int, int]]) -> Iterator[Dict]:
+        """Consumes PcapStreamReader records, yielding window events as they complete."""
+        for ts_us, wire_len, frame, caplen, linktype in records:
+            event = self.add_frame(ts_us, wire_len, frame, caplen, linktype)
+            if event is not None:
+                yield event
+        event = self.finish()
+        if event is not None:
+            yield event
+
+
+def _decrement(counts: Dict, key):
+    remaining = counts[key] - 1
+    if remaining:
+        counts[key] = remaining
+    else:
+        del counts[key]
+
+
+def resolve_capture_path(path: str) -> str:
+    """A live capture file inside LIVE_CAPTURE_DIR; raises ValueError for anything else."""
+    root = os.path.realpath(LIVE_CAPTURE_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Live capture files must be under {LIVE_CAPTURE_DIR}")
+    return resolved
+
+
+def parse_feed_address(address: str) -> Tuple[int, object]:
+    """
+    (family, address) for a local feed socket: "unix:/path" or
+    "host:port" with a loopback host, so a feed can never reach out to
+    another machine.
+    """
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, sep, port = address.rpartition(":")
+    host = host.strip("[]")
+    if not sep or not port.isdigit():
+        raise ValueError("Feed address must be host:port or unix:/path")
+    if host != "localhost":
+        try:
+            loopback = ipaddress.ip_address(host).is_loopback
+        except ValueError:
+            loopback = False
+        if not loopback:
+            raise ValueError("Feed sockets must be on the loopback interface")
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return family, (host, int(port))
+
+
+def follow_file(path: str, heartbeat: Optional[Callable[[], None]] = None,
+                idle_timeout: float = 30.0, deadline: Optional[float] = None,
+                poll_interval: float = FEED_POLL_INTERVAL_S):
+    """
+    A read(n) over a capture file that is still growing, like `tail -f`:
+    at the current end it polls for more data, calling `heartbeat` (which
+    may raise to stop) between polls, and reports end of stream after
+    `idle_timeout` seconds without growth or once time.monotonic() passes
+    `deadline`. Returns (read, close).
+    """
+    f = open(path, "rb")
+
+    def read(n: int) -> bytes:
+        idle_since = None
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return b""
+            data = f.read(n)
+            if data:
+                return data
+            now = time.monotonic()
+            if idle_since is None:
+                idle_since = now
+            elif now - idle_since >= idle_timeout:
+                return b""
+            if heartbeat:
+                heartbeat()
+            time.sleep(poll_interval)
+
+    return read, f.close
+
+
+def connect_feed(address: str, heartbeat: Optional[Callable[[], None]] = None,
+                 idle_timeout: float = 30.0, deadline: Optional[float] = None,
+                 poll_interval: float = FEED_POLL_INTERVAL_S):
+    """
+    A read(n) over a local socket streaming pcap (e.g. `tcpdump -U -w - |
+    nc -l 127.0.0.1 9999`), with the same heartbeat, idle and deadline
+    semantics as follow_file. Returns (read, close).
+    """
+    family, target = parse_feed_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.settimeout(poll_interval)
+        sock.connect(target)
+    except OSError:
+        sock.close()
+        raise
+
+    def read(n: int) -> bytes:
+        idle_since = time.monotonic()
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return b""
+            try:
+                return sock.recv(n)
+            except socket.timeout:
+                if time.monotonic() - idle_since >= idle_timeout:
+                    return b""
+                if heartbeat:
+                    heartbeat()
+
+    return read, sock.close
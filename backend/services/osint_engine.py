@@ -1,126 +1,206 @@
-import whois
-import dns.resolver
-import socket
+import asyncio
+import os
 import re
-import requests
-from typing import Dict, Any, List
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional
+
+import dns.asyncresolver
+import dns.resolver
+import httpx
+import whois
+
+from backend.services.ioc_extractor import IOCExtractor, extract_iocs
+from backend.services.reputation_cache import reputation_cache
+
+# Tor SOCKS proxy; socks5h resolves names (and .onion) on the proxy side.
+# Needs httpx's SOCKS support (the `tor` extra, socksio).
+TOR_PROXY_HOST = "127.0.0.1"
+TOR_PROXY_PORT = 9050
+TOR_PROXY = f"socks5h://{TOR_PROXY_HOST}:{TOR_PROXY_PORT}"
+
+DNS_RECORD_TYPES = ('A', 'MX', 'TXT', 'NS')
+DNS_TIMEOUT = 2.0
+SCRAPE_TIMEOUT = 15.0
+# WHOIS clients are blocking; lookups run on a pool of this many threads
+WHOIS_WORKERS = 8
+# Indicators analyzed at once by analyze_indicators
+BULK_CONCURRENCY = int(os.getenv("OSINT_BULK_CONCURRENCY", "32"))
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20)
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+_whois_executor = ThreadPoolExecutor(max_workers=WHOIS_WORKERS, thread_name_prefix="whois")
+
+
+def _ip_whois_summary(w) -> Dict[str, Any]:
+    return {
+        "registrar": w.registrar,
+        "org": w.org,
+        "country": w.country,
+        "emails": w.emails
+    }
+
+
+def _domain_whois_summary(w) -> Dict[str, Any]:
+    return {
+        "registrar": w.registrar,
+        "creation_date": str(w.creation_date),
+        "expiration_date": str(w.expiration_date),
+        "emails": w.emails
+    }
 
-import urllib3
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 class OSINTAnalyzer:
+    """
+    Indicator enrichment (DNS, reverse DNS, WHOIS, page scraping) that never
+    blocks the event loop: all DNS record types are resolved concurrently
+    through dnspython's async resolver, WHOIS runs on a small thread pool,
+    and pages are fetched with pooled httpx clients, one direct and one
+    through the Tor SOCKS proxy.
+
+    The clients are created on first use and belong to the loop that
+    created them, so the analyzer is driven from the server's loop (its
+    jobs are registered with on_event_loop=True) and closed on shutdown.
+    """
     def __init__(self):
-        self.resolver = dns.resolver.Resolver()
-        self.resolver.lifetime = 2.0  # Timeout for DNS
-        self.resolver.timeout = 2.0
-        
-        # Configure Proxies for Tor (if available)
-        # Assumes Tor is running on localhost:9050
-        self.proxies = {
-            'http': 'socks5h://127.0.0.1:9050',
-            'https': 'socks5h://127.0.0.1:9050'
-        }
+        self.resolver = dns.asyncresolver.Resolver()
+        self.resolver.lifetime = DNS_TIMEOUT
+        self.resolver.timeout = DNS_TIMEOUT
         self.tor_available = self._check_tor()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._tor_client: Optional[httpx.AsyncClient] = None
 
     def _check_tor(self):
         """Simple check to see if Tor port is open"""
-        import socket
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            result = sock.connect_ex(('127.0.0.1', 9050))
+            result = sock.connect_ex((TOR_PROXY_HOST, TOR_PROXY_PORT))
             sock.close()
             return result == 0
         except:
             return False
 
-    def analyze_indicator(self, indicator: str) -> Dict[str, Any]:
+    def _http_client(self, tor: bool) -> httpx.AsyncClient:
+        if tor:
+            if self._tor_client is None:
+                self._tor_client = self._new_client(proxy=TOR_PROXY)
+            return self._tor_client
+        if self._client is None:
+            self._client = self._new_client()
+        return self._client
+
+    def _new_client(self, proxy: Optional[str] = None) -> httpx.AsyncClient:
+        # Scraped sites often have broken certificates, as the blocking version tolerated
+        return httpx.AsyncClient(
+            proxy=proxy,
+            verify=False,
+            timeout=SCRAPE_TIMEOUT,
+            follow_redirects=True,
+            limits=HTTP_LIMITS,
+            headers={'User-Agent': USER_AGENT}
+        )
+
+    async def close(self):
+        for client in (self._client, self._tor_client):
+            if client is not None:
+                await client.aclose()
+        self._client = self._tor_client = None
+
+    async def analyze_indicator(self, indicator: str) -> Dict[str, Any]:
         """
         Determines if input is IP, Domain, or URL and runs appropriate analysis.
         """
         try:
             indicator = indicator.strip()
-            
+
             # Simple Regex for classification
             ip_pattern = r"^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$"
             onion_pattern = r"[a-z2-7]{16,56}\.onion"
-            
+
             if re.match(ip_pattern, indicator):
-                return self.analyze_ip(indicator)
+                return await self.analyze_ip(indicator)
             elif re.search(onion_pattern, indicator):
                  # It's an onion address
                  if not indicator.startswith("http"):
                      indicator = "http://" + indicator
-                 return self.analyze_url(indicator, is_onion=True)
+                 return await self.analyze_url(indicator, is_onion=True)
             elif indicator.startswith("http"):
-                 return self.analyze_url(indicator)
+                 return await self.analyze_url(indicator)
             elif "." in indicator:
-                return self.analyze_domain(indicator)
+                return await self.analyze_domain(indicator)
             else:
                 return {"error": "Unknown indicator format"}
         except Exception as e:
             return {"error": f"Internal Analysis Error: {str(e)}"}
 
-    def analyze_url(self, url: str, is_onion: bool = False) -> Dict[str, Any]:
+    async def analyze_indicators(self, indicators: List[str], concurrency: int = BULK_CONCURRENCY,
+                                 on_result: Optional[Callable[[str, Dict], None]] = None) -> List[Dict[str, Any]]:
+        """
+        Analyzes many indicators, `concurrency` at a time; duplicates are
+        looked up once. Results come back in first-seen order and on_result
+        is called as each one finishes.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def analyze(indicator: str) -> Dict[str, Any]:
+            async with semaphore:
+                result = await self.analyze_indicator(indicator)
+            if on_result is not None:
+                on_result(indicator, result)
+            return result
+
+        unique = list(dict.fromkeys(i.strip() for i in indicators if i.strip()))
+        return list(await asyncio.gather(*(analyze(indicator) for indicator in unique)))
+
+    async def analyze_url(self, url: str, is_onion: bool = False) -> Dict[str, Any]:
         result = {
             "type": "Onion URL" if is_onion else "URL",
             "indicator": url,
             "scraped_data": None,
             "status": "pending"
         }
-        
+
         try:
-            # Use proxies if onion or if user prefers (forcing for onion)
-            proxies = self.proxies if (is_onion or self.tor_available) else None
+            # Use the proxy if onion or if Tor is running (forcing for onion)
             if is_onion and not self.tor_available:
-                return {"error": "Tor proxy (127.0.0.1:9050) not detected. Cannot scrape .onion URL."}
-
-            headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
-            # Disable verify=False to prevent SSL errors on bad sites
-            resp = requests.get(url, proxies=proxies, headers=headers, timeout=15, verify=False)
-            
-            result["status"] = resp.status_code
-            result["headers"] = dict(resp.headers)
-            
-            # Extract IOCs from body
-            iocs = self.extract_iocs(resp.text)
-            result["scraped_data"] = iocs
-            
+                return {"error": f"Tor proxy ({TOR_PROXY_HOST}:{TOR_PROXY_PORT}) not detected. Cannot scrape .onion URL."}
+
+            client = self._http_client(tor=is_onion or self.tor_available)
+            async with client.stream("GET", url) as resp:
+                result["status"] = resp.status_code
+                result["headers"] = dict(resp.headers)
+
+                # Extract IOCs from the body as it arrives; large pages are never held whole
+                extractor = IOCExtractor()
+                async for text in resp.aiter_text():
+                    extractor.feed(text)
+                extractor.close()
+            result["scraped_data"] = extractor.result()
+
         except Exception as e:
             result["error"] = str(e)
-            
+
         return result
 
-    def analyze_ip(self, ip: str) -> Dict[str, Any]:
+    async def analyze_ip(self, ip: str) -> Dict[str, Any]:
         result = {
             "type": "IP",
             "indicator": ip,
             "whois": {},
             "reverse_dns": None,
-            "geolocation": "Unknown" 
+            "geolocation": "Unknown"
         }
-        
-        # 1. Reverse DNS
-        try:
-            rev_name = socket.gethostbyaddr(ip)
-            result["reverse_dns"] = rev_name[0]
-        except:
-            result["reverse_dns"] = "No PTR record"
-
-        # 2. WHOIS
-        try:
-            w = whois.whois(ip)
-            result["whois"] = {
-                "registrar": w.registrar,
-                "org": w.org,
-                "country": w.country,
-                "emails": w.emails
-            }
-        except Exception as e:
-            result["whois_error"] = str(e)
 
+        # Reverse DNS and WHOIS in parallel
+        reverse_dns, whois_result = await asyncio.gather(
+            self._reverse_dns(ip),
+            self._whois(ip, _ip_whois_summary)
+        )
+        result["reverse_dns"] = reverse_dns
+        result.update(whois_result)
         return result
 
-    def analyze_domain(self, domain: str, original_url: str = None) -> Dict[str, Any]:
+    async def analyze_domain(self, domain: str, original_url: str = None) -> Dict[str, Any]:
         result = {
             "type": "Domain",
             "indicator": domain,
@@ -128,51 +208,79 @@ class OSINTAnalyzer:
             "whois": {},
             "subdomains": []
         }
-        
+
         if original_url:
             result["original_url"] = original_url
 
-        # 1. DNS Records
-        record_types = ['A', 'MX', 'TXT', 'NS']
-        for r_type in record_types:
-            try:
-                answers = self.resolver.resolve(domain, r_type)
-                result["dns_records"][r_type] = [str(r) for r in answers]
-            except:
-                pass
+        dns_result, whois_result = await asyncio.gather(
+            self._dns_records(domain),
+            self._whois(domain, _domain_whois_summary)
+        )
+        result["dns_records"] = dns_result["records"]
+        if dns_result.get("error"):
+            result["dns_error"] = dns_result["error"]
+        result.update(whois_result)
+        return result
 
-        # 2. WHOIS
+    async def _reverse_dns(self, ip: str) -> str:
+        cached = await reputation_cache.get_async("ReverseDNS", ip)
+        if cached is not None:
+            return cached["name"]
         try:
-            w = whois.whois(domain)
-            result["whois"] = {
-                "registrar": w.registrar,
-                "creation_date": str(w.creation_date),
-                "expiration_date": str(w.expiration_date),
-                "emails": w.emails
-            }
+            answer = await self.resolver.resolve_address(ip)
+            name = str(answer[0]).rstrip(".")
+        except dns.resolver.NXDOMAIN:
+            await reputation_cache.put_async("ReverseDNS", ip, {"name": "No PTR record"}, negative=True)
+            return "No PTR record"
+        except Exception:
+            # Timeouts and server failures may be transient; not cached
+            return "No PTR record"
+        await reputation_cache.put_async("ReverseDNS", ip, {"name": name})
+        return name
+
+    async def _dns_records(self, domain: str) -> Dict[str, Any]:
+        cached = await reputation_cache.get_async("DNS", domain)
+        if cached is not None:
+            return cached
+
+        answers = await asyncio.gather(
+            *(self.resolver.resolve(domain, r_type) for r_type in DNS_RECORD_TYPES),
+            return_exceptions=True
+        )
+        if any(isinstance(answer, dns.resolver.NXDOMAIN) for answer in answers):
+            entry = {"records": {}, "error": "NXDOMAIN"}
+            await reputation_cache.put_async("DNS", domain, entry, negative=True)
+            return entry
+
+        records = {
+            r_type: [str(r) for r in answer]
+            for r_type, answer in zip(DNS_RECORD_TYPES, answers)
+            if not isinstance(answer, BaseException)
+        }
+        entry = {"records": records}
+        # Only a complete answer is cached: NoAnswer says a type has no records,
+        # while timeouts and SERVFAIL (NoNameservers) leave the next lookup to retry
+        if all(isinstance(answer, dns.resolver.NoAnswer) for answer in answers
+               if isinstance(answer, BaseException)):
+            await reputation_cache.put_async("DNS", domain, entry)
+        return entry
+
+    async def _whois(self, indicator: str, summarize: Callable) -> Dict[str, Any]:
+        cached = await reputation_cache.get_async("WHOIS", indicator)
+        if cached is not None:
+            return {"whois": cached}
+        try:
+            w = await asyncio.get_running_loop().run_in_executor(_whois_executor, whois.whois, indicator)
+            summary = summarize(w)
         except Exception as e:
-             result["whois_error"] = str(e)
-             
-        return result
+            return {"whois_error": str(e)}
+        # python-whois returns an empty record when the server was unreachable
+        if any(value not in (None, "None") for value in summary.values()):
+            await reputation_cache.put_async("WHOIS", indicator, summary)
+        return {"whois": summary}
 
     def extract_iocs(self, text: str) -> Dict[str, List[str]]:
         """
         Extracts potential IPs, Domains, and Onion addresses from raw text.
         """
-        ip_pattern = r'\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b'
-        domain_pattern = r'\b(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,6}\b'
-        onion_pattern = r'\b[a-z2-7]{16,56}\.onion\b'
-        
-        ips = list(set(re.findall(ip_pattern, text)))
-        domains = list(set(re.findall(domain_pattern, text)))
-        onions = list(set(re.findall(onion_pattern, text)))
-        
-        # Basic filter: Remove onions from domains list if regex overlapped
-        domains = [d for d in domains if not d.endswith('.onion')]
-        
-        return {
-            "ips": ips,
-            "domains": domains,
-            "onions": onions,
-            "count": len(ips) + len(domains) + len(onions)
-        }
+        return extract_iocs(text)
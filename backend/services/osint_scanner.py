@@ -1,17 +1,98 @@
 import httpx
+import importlib.util
+import ipaddress
 import os
 import asyncio
 from typing import Dict, Any, Optional
 
+from backend.services.rate_limiter import TokenBucket
+from backend.services.reputation_cache import reputation_cache
+
+# Provider quotas (requests per minute); the defaults match the free tiers
+ABUSEIPDB_RATE_PER_MINUTE = float(os.getenv("ABUSEIPDB_RATE_PER_MINUTE", "60"))
+VIRUSTOTAL_RATE_PER_MINUTE = float(os.getenv("VIRUSTOTAL_RATE_PER_MINUTE", "4"))
+# 429 handling: retries per request, backoff when no Retry-After is given,
+# and the longest wait worth taking before reporting the rate limit instead
+RATE_LIMIT_RETRIES = 3
+RETRY_BACKOFF_BASE = 2.0
+MAX_RETRY_DELAY = 60.0
+
+# Pool of the app-wide scanner's client (see ScannerService)
+SCANNER_MAX_CONNECTIONS = int(os.getenv("SCANNER_MAX_CONNECTIONS", "50"))
+SCANNER_MAX_KEEPALIVE = int(os.getenv("SCANNER_MAX_KEEPALIVE", "20"))
+SCANNER_KEEPALIVE_EXPIRY = float(os.getenv("SCANNER_KEEPALIVE_EXPIRY", "60"))
+# Requests in flight per provider host
+SCANNER_MAX_PER_HOST = int(os.getenv("SCANNER_MAX_PER_HOST", "8"))
+# HTTP/2 needs the h2 package (the `http2` extra); HTTP/1.1 keep-alive otherwise
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+# Shared by every scanner in the process so concurrent scans split one quota
+provider_limiters = {
+    "AbuseIPDB": TokenBucket(ABUSEIPDB_RATE_PER_MINUTE / 60.0, max(1.0, ABUSEIPDB_RATE_PER_MINUTE / 6)),
+    "VirusTotal": TokenBucket(VIRUSTOTAL_RATE_PER_MINUTE / 60.0, max(1.0, VIRUSTOTAL_RATE_PER_MINUTE)),
+}
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
 class OSINTScanner:
-    def __init__(self):
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, max_per_host: int = SCANNER_MAX_PER_HOST):
         self.abuseipdb_key = os.getenv("ABUSEIPDB_API_KEY")
         self.virustotal_key = os.getenv("VIRUSTOTAL_API_KEY")
         
-        self.client = httpx.AsyncClient(timeout=10.0)
+        # A scanner handed a client shares it and leaves closing it to the owner
+        self.client = client or httpx.AsyncClient(timeout=10.0)
+        self._owns_client = client is None
+        self.max_per_host = max_per_host
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+        self.requests = 0
+        self.new_connections = 0
+        self.http_versions: Dict[str, int] = {}
 
     async def close(self):
-        await self.client.aclose()
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def _trace(self, event_name: str, info: Dict):
+        # httpcore reports every new TCP connection; requests without one reused a pooled connection
+        if event_name == "connection.connect_tcp.complete":
+            self.new_connections += 1
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        slot = self._host_slots.get(host)
+        if slot is None:
+            slot = self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return slot
+
+    async def _get(self, provider: str, url: str, **kwargs) -> httpx.Response:
+        """
+        GET under the provider's token bucket. A 429 pauses the bucket for
+        Retry-After (or an exponential backoff) and retries; the last
+        response is returned once retries run out or the provider asks for
+        a longer wait than MAX_RETRY_DELAY.
+        """
+        limiter = provider_limiters[provider]
+        slot = self._host_slot(url)
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            await limiter.acquire()
+            async with slot:
+                response = await self.client.get(url, extensions={"trace": self._trace}, **kwargs)
+            self.requests += 1
+            version = response.extensions.get("http_version", b"").decode() or response.http_version
+            self.http_versions[version] = self.http_versions.get(version, 0) + 1
+            if response.status_code != 429 or attempt == RATE_LIMIT_RETRIES:
+                return response
+            delay = _retry_after(response) or RETRY_BACKOFF_BASE * 2 ** attempt
+            if delay > MAX_RETRY_DELAY:
+                return response
+            limiter.pause(delay)
+        return response
 
     async def scan_ip(self, ip: str) -> Dict[str, Any]:
         """
@@ -59,8 +140,66 @@ class OSINTScanner:
         # ------------------------------
 
         print(f"DEBUG: OSINTScanner.scan_ip called for {ip}")
-        
-        # ... (API Code) ...
+
+        try:
+            ipaddress.ip_address(ip)
+        except ValueError:
+            return {"error": "Not an IP address"}
+
+        cached = await reputation_cache.get_async("AbuseIPDB", ip)
+        if cached is not None:
+            return cached
+
+        url = "https://api.abuseipdb.com/api/v2/check"
+        headers = {
+            'Key': self.abuseipdb_key,
+            'Accept': 'application/json'
+        }
+
+        try:
+            response = await self._get("AbuseIPDB", url, headers=headers, params={"ipAddress": ip, "maxAgeInDays": 90})
+
+            if response.status_code == 429:
+                return {"error": "Rate Limit Exceeded (AbuseIPDB)"}
+
+            if response.status_code != 200:
+                return {"error": f"API Error {response.status_code}"}
+
+            data = response.json().get('data', {})
+            score = data.get('abuseConfidenceScore', 0) or 0
+            reports = data.get('totalReports', 0) or 0
+
+            if data.get('isTor'):
+                category = "Anonymizer"
+            elif score >= 75:
+                category = "Malicious Activity"
+            elif reports:
+                category = "Reported"
+            else:
+                category = "Clean"
+
+            result = {
+                "source": "AbuseIPDB",
+                "indicator": ip,
+                "type": "IP",
+                "confidence": score,
+                "severity": "High" if score >= 75 else "Medium" if score >= 25 else "Low",
+                "category": category,
+                "raw_data": {
+                    "countryCode": data.get('countryCode'),
+                    "usageType": data.get('usageType'),
+                    "isp": data.get('isp'),
+                    "domain": data.get('domain'),
+                    "totalReports": reports,
+                    "isTor": data.get('isTor', False),
+                    "lastReportedAt": data.get('lastReportedAt')
+                }
+            }
+            await reputation_cache.put_async("AbuseIPDB", ip, result)
+            return result
+
+        except Exception as e:
+            return {"error": f"Request Failed: {str(e)}"}
 
     async def scan_hash(self, file_hash: str) -> Dict[str, Any]:
         """
@@ -96,19 +235,23 @@ class OSINTScanner:
             return self._generate_mock_hash(file_hash)
         # ------------------------------
 
+        cached = await reputation_cache.get_async("VirusTotal", file_hash)
+        if cached is not None:
+            return cached
+
         url = f"https://www.virustotal.com/api/v3/files/{file_hash}"
         headers = {
             'x-apikey': self.virustotal_key
         }
 
         try:
-            response = await self.client.get(url, headers=headers)
+            response = await self._get("VirusTotal", url, headers=headers)
 
             if response.status_code == 429:
                 return {"error": "Rate Limit Exceeded (VirusTotal)"}
             
             if response.status_code == 404:
-                return {
+                result = {
                     "source": "VirusTotal",
                     "indicator": file_hash,
                     "type": "Hash",
@@ -117,6 +260,8 @@ class OSINTScanner:
                     "category": "Unknown/Clean",
                     "raw_data": {"message": "Hash not found in VT"}
                 }
+                await reputation_cache.put_async("VirusTotal", file_hash, result, negative=True)
+                return result
                 
             if response.status_code != 200:
                 return {"error": f"API Error {response.status_code}"}
@@ -131,7 +276,7 @@ class OSINTScanner:
             if total > 0:
                 score = int(((malicious + suspicious) / total) * 100)
 
-            return {
+            result = {
                 "source": "VirusTotal",
                 "indicator": file_hash,
                 "type": "Hash",
@@ -140,6 +285,8 @@ class OSINTScanner:
                 "category": "Malware" if malicious > 0 else "Clean",
                 "raw_data": stats
             }
+            await reputation_cache.put_async("VirusTotal", file_hash, result)
+            return result
 
         except Exception as e:
             return {"error": f"Request Failed: {str(e)}"}
@@ -189,3 +336,58 @@ class OSINTScanner:
             "category": category,
             "raw_data": {"malicious": int(confidence/2), "suspicious": int(confidence/10), "meaningful_name": "unknown_sample.exe"}
         }
+
+
+class ScannerService:
+    """
+    The app-wide OSINTScanner. Its client is opened on startup and closed on
+    shutdown, so scans reuse warm keep-alive connections (multiplexed over
+    HTTP/2 when h2 is installed) instead of paying for connection setup and
+    TLS handshakes on every scan. Routers reach it through a dependency;
+    scans using it run on the server's loop, which owns the client.
+    """
+    def __init__(self):
+        self.scanner: Optional[OSINTScanner] = None
+
+    async def start(self):
+        if self.scanner is not None:
+            return
+        client = httpx.AsyncClient(
+            timeout=10.0,
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=SCANNER_MAX_CONNECTIONS,
+                max_keepalive_connections=SCANNER_MAX_KEEPALIVE,
+                keepalive_expiry=SCANNER_KEEPALIVE_EXPIRY
+            )
+        )
+        self.scanner = OSINTScanner(client)
+
+    async def close(self):
+        scanner, self.scanner = self.scanner, None
+        if scanner is not None:
+            await scanner.client.aclose()
+
+    @property
+    def running(self) -> bool:
+        return self.scanner is not None
+
+    def stats(self) -> Dict[str, Any]:
+        scanner = self.scanner
+        requests = scanner.requests if scanner else 0
+        new_connections = scanner.new_connections if scanner else 0
+        reused = max(0, requests - new_connections)
+        return {
+            "running": scanner is not None,
+            "http2": HTTP2_AVAILABLE,
+            "max_connections": SCANNER_MAX_CONNECTIONS,
+            "max_keepalive_connections": SCANNER_MAX_KEEPALIVE,
+            "max_per_host": SCANNER_MAX_PER_HOST,
+            "requests": requests,
+            "new_connections": new_connections,
+            "reused_connections": reused,
+            "connection_reuse_ratio": round(reused / requests, 4) if requests else 0.0,
+            "http_versions": dict(scanner.http_versions) if scanner else {}
+        }
+
+scanner_service = ScannerService()
@@ -0,0 +1,179 @@
+import warnings
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from backend.database import DIRECTION_CODES, iso_to_epoch_us
+
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+DIRECTION_OUTBOUND = DIRECTION_CODES["outbound"]
+DIRECTION_INBOUND = DIRECTION_CODES["inbound"]
+DIRECTION_UNKNOWN = DIRECTION_CODES["unknown"]
+
+
+def _to_epoch_us(value) -> Optional[int]:
+    """Epoch microseconds; naive values are local time, as in the packets table."""
+    if isinstance(value, str):
+        return iso_to_epoch_us(value)
+    if isinstance(value, datetime):
+        return int(value.replace(microsecond=0).timestamp()) * 1_000_000 + value.microsecond
+    return None
+
+
+def _local_offset_us(wall_us: int) -> int:
+    """Difference between a naive wall-clock reading and its true epoch value."""
+    return wall_us - _to_epoch_us(EPOCH + timedelta(microseconds=int(wall_us)))
+
+
+def _timestamp_column(packets: List[Dict]) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(packets)
+    ts_valid = np.ones(n, dtype=bool)
+    
+    # Rows loaded from the database already carry integer timestamps
+    values = [p.get('ts_us') for p in packets]
+    if None not in values:
+        return np.array(values, dtype=np.int64), ts_valid
+    
+    # Naive ISO strings can be parsed by NumPy in C. Anything it would treat
+    # differently from datetime.fromisoformat (offsets warn, missing or bad
+    # values raise or become NaT) drops to the per-packet path below, as do
+    # sessions that straddle a UTC-offset change.
+    stamps = [p.get('timestamp') for p in packets]
+    if values.count(None) == n:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                parsed = np.array(stamps, dtype='datetime64[us]').astype(np.int64)
+            if not (parsed == np.iinfo(np.int64).min).any():
+                offset = _local_offset_us(parsed.min())
+                if _local_offset_us(parsed.max()) == offset:
+                    return parsed - offset, ts_valid
+        except (ValueError, TypeError, OverflowError, Warning):
+            pass
+    
+    ts_us = np.zeros(n, dtype=np.int64)
+    for i, (value, stamp) in enumerate(zip(values, stamps)):
+        if value is None:
+            value = _to_epoch_us(stamp)
+        if value is None:
+            ts_valid[i] = False
+        else:
+            ts_us[i] = value
+    return ts_us, ts_valid
+
+
+def factorize(values: Sequence, lookup: Optional[Dict] = None) -> Tuple[np.ndarray, List]:
+    """
+    Encodes values as int32 codes into a list of distinct values (first-seen
+    order). Pass the same `lookup` dict to keep codes stable across chunks.
+    """
+    if lookup is None:
+        lookup = {}
+    codes = np.fromiter(
+        (lookup.setdefault(v, len(lookup)) for v in values),
+        dtype=np.int32, count=len(values)
+    )
+    return codes, list(lookup)
+
+
+class PacketColumns:
+    """
+    Columnar view of a packet set: NumPy arrays for timestamps, sizes and
+    direction plus categorical codes for protocol and endpoints. Built once
+    per analysis so every scorer works on arrays instead of re-walking dicts.
+
+    `ts_valid` marks packets whose timestamp could be read; scorers that need
+    timing skip the others, exactly as the per-packet parser used to.
+    """
+    def __init__(self, ts_us: np.ndarray, size: np.ndarray, direction: np.ndarray,
+                 protocol: np.ndarray, protocol_names: List,
+                 src_ip: np.ndarray, dst_ip: np.ndarray, ip_names: List,
+                 ts_valid: Optional[np.ndarray] = None):
+        self.ts_us = ts_us
+        self.size = size
+        self.direction = direction
+        self.protocol = protocol
+        self.protocol_names = protocol_names
+        self.src_ip = src_ip
+        self.dst_ip = dst_ip
+        self.ip_names = ip_names
+        self.ts_valid = ts_valid
+
+    def __len__(self) -> int:
+        return len(self.size)
+
+    @classmethod
+    def from_packets(cls, packets: List[Dict]) -> "PacketColumns":
+        n = len(packets)
+
+        ts_us, ts_valid = _timestamp_column(packets)
+
+        size = np.fromiter((p.get('size', 0) for p in packets), dtype=np.int64, count=n)
+        direction = np.fromiter(
+            (DIRECTION_CODES.get(p.get('direction'), DIRECTION_UNKNOWN) for p in packets),
+            dtype=np.uint8, count=n
+        )
+        protocol, protocol_names = factorize([p.get('protocol', 'UNKNOWN') for p in packets])
+
+        # Source and destination share one dictionary so codes are comparable
+        ip_codes, ip_names = factorize(
+            [p.get('src_ip') for p in packets] + [p.get('dst_ip') for p in packets]
+        )
+
+        return cls(
+            ts_us=ts_us,
+            size=size,
+            direction=direction,
+            protocol=protocol,
+            protocol_names=protocol_names,
+            src_ip=ip_codes[:n],
+            dst_ip=ip_codes[n:],
+            ip_names=ip_names,
+            ts_valid=None if ts_valid.all() else ts_valid
+        )
+
+    def valid_timestamps(self) -> np.ndarray:
+        return self.ts_us if self.ts_valid is None else self.ts_us[self.ts_valid]
+
+    def protocol_counts(self) -> Dict:
+        counts = np.bincount(self.protocol, minlength=len(self.protocol_names))
+        return {name: int(count) for name, count in zip(self.protocol_names, counts) if count}
+
+    def distinct_count(self, codes: np.ndarray) -> int:
+        if len(codes) == 0:
+            return 0
+        return int(np.count_nonzero(np.bincount(codes, minlength=len(self.ip_names))))
+
+    def first_src_ip(self) -> Optional[str]:
+        return self.ip_names[self.src_ip[0]] if len(self) else None
+
+    def to_local_datetimes(self):
+        """Valid timestamps as naive local-time pandas datetimes, like the stored ISO strings."""
+        import pandas as pd
+        ts_us = self.valid_timestamps()
+        return pd.to_datetime(ts_us + _local_offsets_us(ts_us), unit='us')
+
+
+# Local-time offsets only change on quarter-hour boundaries (DST, zone rule changes)
+OFFSET_STEP_US = 900 * 1_000_000
+
+
+def _local_offsets_us(ts_us: np.ndarray) -> np.ndarray:
+    """The local UTC offset in effect at each timestamp, looked up once per quarter hour."""
+    steps, inverse = np.unique(ts_us // OFFSET_STEP_US, return_inverse=True)
+    offsets = np.array([
+        datetime.fromtimestamp(int(step) * (OFFSET_STEP_US // 1_000_000), timezone.utc).astimezone().utcoffset() // ONE_MICROSECOND
+        for step in steps
+    ], dtype=np.int64)
+    return offsets[inverse]
+
+
+PacketSet = Union[List[Dict], PacketColumns]
+
+
+def as_columns(packets: PacketSet) -> PacketColumns:
+    if isinstance(packets, PacketColumns):
+        return packets
+    return PacketColumns.from_packets(packets)
@@ -1,82 +1,269 @@
 import os
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Callable, Iterator, List, Dict, Optional
 import json
 
+from backend.services.cell_features import CellFeatures
+from backend.services.flow_table import Flow, FlowTable
+from backend.services.pcap_reader import (
+    PcapReader, PcapFormatError, decode_packet, classify_protocol, mask_address, MASKED_IP
+)
+
+DEFAULT_BATCH_SIZE = 5000
+
+class _BurstTracker:
+    """
+    Streaming equivalent of PCAPAnalyzer._detect_bursts: counts runs of at
+    least `min_packets` packets whose inter-arrival gap is below the threshold.
+    """
+    def __init__(self, threshold_ms: float = 100, min_packets: int = 3):
+        self.threshold_us = threshold_ms * 1000
+        self.min_packets = min_packets
+        self.last_ts = None
+        self.run_length = 0
+        self.count = 0
+
+    def add(self, ts_us: int):
+        if self.last_ts is not None and ts_us - self.last_ts < self.threshold_us:
+            self.run_length += 1
+        else:
+            if self.run_length >= self.min_packets:
+                self.count += 1
+            self.run_length = 1
+        self.last_ts = ts_us
+
+    def finish(self) -> int:
+        if self.run_length >= self.min_packets:
+            self.count += 1
+            self.run_length = 0
+        return self.count
+
 class PCAPAnalyzer:
     def __init__(self):
         self.supported_protocols = ['TCP', 'UDP', 'TLS', 'HTTP', 'HTTPS', 'DNS', 'ICMP']
     
     def analyze_pcap(self, file_path: str, session_id: str) -> Dict:
+        """
+        Parses the whole capture into memory. Prefer ingest_pcap for large
+        files, which streams batches to a writer instead of building a list.
+        """
+        packets = []
         try:
-            import pyshark
-            packets = []
-            protocol_counts = {}
-            total_bytes = 0
-            
-            try:
-                cap = pyshark.FileCapture(file_path, keep_packets=False)
+            summary = self.ingest_pcap(file_path, session_id, packets.extend)
+        except Exception as e:
+            return self._generate_simulated_analysis(session_id, str(e))
+        
+        if summary.get("simulated"):
+            return summary
+        
+        summary["packets"] = packets
+        return summary
+    
+    def ingest_pcap(self, file_path: str, session_id: str,
+                    write_batch: Callable[[List[Dict]], None],
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    progress: Optional[Callable[[int, int], None]] = None,
+                    write_flows: Optional[Callable[[List[Flow]], None]] = None) -> Dict:
+        """
+        Streams the capture in fixed-size batches, handing each batch to
+        `write_batch` as soon as it is parsed so memory stays flat regardless
+        of capture size. Flows closed by the flow table go to `write_flows`
+        after each batch, and the rest once the capture ends, carrying their
+        Tor cell features. Returns the session summary (no packet list).
+        """
+        protocol_counts = {}
+        total_bytes = 0
+        packet_count = 0
+        start_ts = None
+        end_ts = None
+        bursts = _BurstTracker()
+        flows = FlowTable()
+        
+        try:
+            for batch in self.stream_pcap(file_path, session_id, batch_size, flows):
+                for packet in batch:
+                    ts_us = packet['ts_us']
+                    bursts.add(ts_us)
+                    if start_ts is None or ts_us < start_ts:
+                        start_ts = ts_us
+                    if end_ts is None or ts_us > end_ts:
+                        end_ts = ts_us
+                    protocol = packet['protocol']
+                    protocol_counts[protocol] = protocol_counts.get(protocol, 0) + 1
+                    total_bytes += packet['size']
                 
-                for i, pkt in enumerate(cap):
-                    if i >= 1000:
-                        break
-                    
-                    try:
-                        timestamp = datetime.fromtimestamp(float(pkt.sniff_timestamp))
-                        
-                        protocol = pkt.highest_layer
-                        protocol_counts[protocol] = protocol_counts.get(protocol, 0) + 1
-                        
-                        size = int(pkt.length)
-                        total_bytes += size
-                        
-                        src_ip = "xxx.xxx.xxx.xxx"
-                        dst_ip = "xxx.xxx.xxx.xxx"
-                        
-                        if hasattr(pkt, 'ip'):
-                            src_parts = pkt.ip.src.split('.')
-                            dst_parts = pkt.ip.dst.split('.')
-                            src_ip = f"{src_parts[0]}.{src_parts[1]}.xxx.xxx"
-                            dst_ip = f"{dst_parts[0]}.{dst_parts[1]}.xxx.xxx"
-                        
-                        direction = "outbound" if i % 2 == 0 else "inbound"
-                        
-                        packet_data = {
-                            "session_id": session_id,
-                            "timestamp": timestamp.isoformat(),
-                            "src_ip": src_ip,
-                            "dst_ip": dst_ip,
-                            "protocol": protocol,
-                            "size": size,
-                            "direction": direction
-                        }
-                        packets.append(packet_data)
-                        
-                    except Exception:
-                        continue
+                write_batch(batch)
+                if write_flows:
+                    write_flows(flows.drain())
+                packet_count += len(batch)
+                if progress:
+                    progress(packet_count, total_bytes)
+        except ImportError:
+            if packet_count:
+                raise
+            reason = "pyshark not available"
+        except Exception as e:
+            if packet_count:
+                raise
+            reason = str(e)
+        else:
+            reason = None
+        
+        if reason is not None:
+            simulated = self._generate_simulated_analysis(session_id, reason)
+            write_batch(simulated["packets"])
+            if progress:
+                progress(simulated["packet_count"], simulated["total_bytes"])
+            simulated["simulated"] = True
+            simulated["start_time"] = simulated["packets"][0]["timestamp"] if simulated["packets"] else datetime.now().isoformat()
+            simulated["end_time"] = simulated["packets"][-1]["timestamp"] if simulated["packets"] else datetime.now().isoformat()
+            return simulated
+        
+        if write_flows:
+            write_flows(flows.close_all())
+        
+        return {
+            "success": True,
+            "session_id": session_id,
+            "packet_count": packet_count,
+            "total_bytes": total_bytes,
+            "protocol_distribution": protocol_counts,
+            "burst_count": bursts.finish(),
+            "flow_count": flows.next_flow_id - 1,
+            "start_time": self._format_ts(start_ts),
+            "end_time": self._format_ts(end_ts),
+            "analysis_notes": f"Analyzed {packet_count} packets from PCAP file"
+        }
+    
+    def stream_pcap(self, file_path: str, session_id: str,
+                    batch_size: int = DEFAULT_BATCH_SIZE,
+                    flows: Optional[FlowTable] = None) -> Iterator[List[Dict]]:
+        """
+        Yields packet dicts in batches. Uses the native memory-mapped reader
+        for pcap/pcapng and falls back to pyshark for other capture formats.
+        Each packet also carries 'ts_us', its integer epoch timestamp, and
+        'flow_id'; its direction is relative to the observer as decided by
+        the flow table. Non-IP frames have no flow and direction "unknown".
+        TLS flows get CellFeatures from their record headers as they pass.
+        """
+        if flows is None:
+            flows = FlowTable()
+        try:
+            reader = PcapReader(file_path)
+        except PcapFormatError:
+            yield from self._stream_pyshark(file_path, session_id, batch_size, flows)
+            return
+        
+        with reader:
+            buf = reader.buffer
+            format_ts = self._format_ts
+            add_flow = flows.add
+            batch = []
+            
+            for ts_us, wire_len, offset, caplen, linktype in reader.records():
+                decoded = decode_packet(buf, offset, caplen, linktype)
+                if decoded is None:
+                    src_ip = dst_ip = MASKED_IP
+                    protocol = "ETH"
+                    flow_id, direction = None, "unknown"
+                else:
+                    _version, src, dst, ip_proto, src_port, dst_port, payload_offset, payload_len = decoded
+                    src_ip = mask_address(src)
+                    dst_ip = mask_address(dst)
+                    protocol = classify_protocol(buf, ip_proto, src_port, dst_port, payload_offset, payload_len)
+                    flow, direction = add_flow(ts_us, ip_proto, src, src_port, dst, dst_port, wire_len, protocol)
+                    flow_id = flow.flow_id
+                    if flow.cells is not None or protocol == "TLS":
+                        if flow.cells is None:
+                            flow.cells = CellFeatures()
+                        flow.cells.add(direction == "outbound", buf, payload_offset, payload_len, wire_len - caplen)
                 
-                cap.close()
+                batch.append({
+                    "session_id": session_id,
+                    "timestamp": format_ts(ts_us),
+                    "src_ip": src_ip,
+                    "dst_ip": dst_ip,
+                    "protocol": protocol,
+                    "size": wire_len,
+                    "direction": direction,
+                    "ts_us": ts_us,
+                    "flow_id": flow_id
+                })
                 
-            except Exception as e:
-                return self._generate_simulated_analysis(session_id, str(e))
-            
-            burst_windows = self._detect_bursts(packets)
-            
-            return {
-                "success": True,
-                "session_id": session_id,
-                "packet_count": len(packets),
-                "total_bytes": total_bytes,
-                "protocol_distribution": protocol_counts,
-                "burst_count": len(burst_windows),
-                "packets": packets,
-                "analysis_notes": f"Analyzed {len(packets)} packets from PCAP file"
-            }
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
             
-        except ImportError:
-            return self._generate_simulated_analysis(session_id, "pyshark not available")
-        except Exception as e:
-            return self._generate_simulated_analysis(session_id, str(e))
+            if batch:
+                yield batch
+    
+    def _stream_pyshark(self, file_path: str, session_id: str, batch_size: int,
+                        flows: FlowTable) -> Iterator[List[Dict]]:
+        import pyshark
+        
+        cap = pyshark.FileCapture(file_path, keep_packets=False)
+        batch = []
+        try:
+            for pkt in cap:
+                try:
+                    ts = float(pkt.sniff_timestamp)
+                    ts_us = int(round(ts * 1_000_000))
+                    size = int(pkt.length)
+                    
+                    src_ip = MASKED_IP
+                    dst_ip = MASKED_IP
+                    flow_id, direction = None, "unknown"
+                    
+                    if hasattr(pkt, 'ip'):
+                        src_parts = pkt.ip.src.split('.')
+                        dst_parts = pkt.ip.dst.split('.')
+                        src_ip = f"{src_parts[0]}.{src_parts[1]}.xxx.xxx"
+                        dst_ip = f"{dst_parts[0]}.{dst_parts[1]}.xxx.xxx"
+                        transport = getattr(pkt, 'tcp', None) or getattr(pkt, 'udp', None)
+                        src_port = int(transport.srcport) if transport else 0
+                        dst_port = int(transport.dstport) if transport else 0
+                        flow, direction = flows.add(
+                            ts_us, int(pkt.ip.proto), pkt.ip.src, src_port, pkt.ip.dst, dst_port,
+                            size, pkt.highest_layer
+                        )
+                        flow_id = flow.flow_id
+                    
+                    batch.append({
+                        "session_id": session_id,
+                        "timestamp": self._format_ts(ts_us),
+                        "src_ip": src_ip,
+                        "dst_ip": dst_ip,
+                        "protocol": pkt.highest_layer,
+                        "size": size,
+                        "direction": direction,
+                        "ts_us": ts_us,
+                        "flow_id": flow_id
+                    })
+                except Exception:
+                    continue
+                
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        finally:
+            cap.close()
+        
+        if batch:
+            yield batch
+    
+    _ts_cache_sec = None
+    _ts_cache_dt = None
+    
+    def _format_ts(self, ts_us: Optional[int]) -> Optional[str]:
+        # Consecutive packets usually share the same second, so the local-time
+        # conversion is cached and only the microseconds are replaced.
+        if ts_us is None:
+            return None
+        sec, usec = divmod(ts_us, 1_000_000)
+        if sec != self._ts_cache_sec:
+            self._ts_cache_sec = sec
+            self._ts_cache_dt = datetime.fromtimestamp(sec)
+        return self._ts_cache_dt.replace(microsecond=usec).isoformat()
     
     def _detect_bursts(self, packets: List[Dict], threshold_ms: float = 100) -> List[Dict]:
         if len(packets) < 2:
@@ -91,9 +278,12 @@ class PCAPAnalyzer:
                 continue
             
             try:
-                prev_time = datetime.fromisoformat(packets[i-1]['timestamp'])
-                curr_time = datetime.fromisoformat(packets[i]['timestamp'])
-                delta_ms = (curr_time - prev_time).total_seconds() * 1000
+                if packets[i].get('ts_us') is not None and packets[i-1].get('ts_us') is not None:
+                    delta_ms = (packets[i]['ts_us'] - packets[i-1]['ts_us']) / 1000
+                else:
+                    prev_time = datetime.fromisoformat(packets[i-1]['timestamp'])
+                    curr_time = datetime.fromisoformat(packets[i]['timestamp'])
+                    delta_ms = (curr_time - prev_time).total_seconds() * 1000
                 
                 if delta_ms < threshold_ms:
                     current_burst.append(packets[i])
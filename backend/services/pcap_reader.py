@@ -0,0 +1,363 @@
+import mmap
+import os
+import struct
+from typing import Iterator, Optional, Tuple
+
+# Classic libpcap magic numbers (microsecond and nanosecond resolution)
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+
+# pcapng block types
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_OPB = 0x00000002
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+# Link-layer types we know how to decode
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_ARP = 0x0806
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_VLAN = (0x8100, 0x88A8, 0x9100)
+
+IPV6_EXTENSION_HEADERS = (0, 43, 60)
+IPV6_FRAGMENT_HEADER = 44
+
+TLS_PORTS = frozenset((443, 8443, 9001, 9030, 9050, 9051))
+HTTP_PORTS = frozenset((80, 8000, 8080))
+DNS_PORT = 53
+
+MASKED_IP = "xxx.xxx.xxx.xxx"
+
+
+class PcapFormatError(ValueError):
+    """Raised when a file is neither a libpcap nor a pcapng capture."""
+
+
+class PcapReader:
+    """
+    Pure-Python pcap/pcapng reader that parses records directly from a
+    memory-mapped file. Records are yielded as (ts_us, wire_len, offset,
+    caplen, linktype) so callers can decode headers in place with
+    struct.unpack_from instead of copying every frame.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._file = open(file_path, 'rb')
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            if size < 24:
+                raise PcapFormatError("File too small to be a capture")
+            self.buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+
+        magic_le = struct.unpack_from('<I', self.buffer, 0)[0]
+        magic_be = struct.unpack_from('>I', self.buffer, 0)[0]
+
+        if magic_le == PCAPNG_SHB:
+            self.format = "pcapng"
+        elif magic_le in (PCAP_MAGIC_US, PCAP_MAGIC_NS) or magic_be in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self.format = "pcap"
+        else:
+            self.close()
+            raise PcapFormatError("Unrecognised capture magic number")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        self._file.close()
+
+    @property
+    def size(self) -> int:
+        return len(self.buffer) if self.buffer is not None else 0
+
+    def records(self) -> Iterator[Tuple[int, int, int, int, int]]:
+        if self.format == "pcap":
+            return self._pcap_records()
+        return self._pcapng_records()
+
+    def _pcap_records(self) -> Iterator[Tuple[int, int, int, int, int]]:
+        buf = self.buffer
+        magic = struct.unpack_from('<I', buf, 0)[0]
+        if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            endian = '<'
+        else:
+            endian = '>'
+            magic = struct.unpack_from('>I', buf, 0)[0]
+        nanos = magic == PCAP_MAGIC_NS
+
+        linktype = struct.unpack_from(endian + 'I', buf, 20)[0] & 0x0FFFFFFF
+        record_header = struct.Struct(endian + 'IIII')
+        unpack_header = record_header.unpack_from
+
+        offset = 24
+        end = len(buf)
+        while offset + 16 <= end:
+            ts_sec, ts_frac, caplen, wire_len = unpack_header(buf, offset)
+            offset += 16
+            if offset + caplen > end:
+                break  # Truncated final record
+            ts_us = ts_sec * 1_000_000 + (ts_frac // 1000 if nanos else ts_frac)
+            yield ts_us, wire_len, offset, caplen, linktype
+            offset += caplen
+
+    def _pcapng_records(self) -> Iterator[Tuple[int, int, int, int, int]]:
+        buf = self.buffer
+        end = len(buf)
+        offset = 0
+        endian = '<'
+        interfaces = []  # (linktype, ticks_per_second)
+
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(endian + 'I', buf, offset)[0]
+
+            if block_type == PCAPNG_SHB:
+                bom = struct.unpack_from('<I', buf, offset + 8)[0]
+                endian = '<' if bom == PCAPNG_BYTE_ORDER_MAGIC else '>'
+                interfaces = []
+
+            block_len = struct.unpack_from(endian + 'I', buf, offset + 4)[0]
+            if block_len < 12 or offset + block_len > end:
+                break
+
+            if block_type == PCAPNG_IDB:
+                linktype = struct.unpack_from(endian + 'H', buf, offset + 8)[0]
+                ticks = self._pcapng_tsresol(buf, offset + 16, offset + block_len - 4, endian)
+                interfaces.append((linktype, ticks))
+
+            elif block_type == PCAPNG_EPB or block_type == PCAPNG_OPB:
+                if block_type == PCAPNG_EPB:
+                    iface, ts_high, ts_low, caplen, wire_len = struct.unpack_from(endian + 'IIIII', buf, offset + 8)
+                else:
+                    iface, _drops, ts_high, ts_low, caplen, wire_len = struct.unpack_from(endian + 'HHIIII', buf, offset + 8)
+                data_offset = offset + 28
+                if iface < len(interfaces) and data_offset + caplen <= end:
+                    linktype, ticks = interfaces[iface]
+                    ts = (ts_high << 32) | ts_low
+                    ts_us = ts if ticks == 1_000_000 else ts * 1_000_000 // ticks
+                    yield ts_us, wire_len, data_offset, caplen, linktype
+
+            offset += block_len
+
+    @staticmethod
+    def _pcapng_tsresol(buf, offset: int, end: int, endian: str) -> int:
+        """Reads the if_tsresol option of an Interface Description Block."""
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(endian + 'HH', buf, offset)
+            if code == 0:
+                break
+            if code == 9 and length >= 1:
+                value = buf[offset + 4]
+                if value & 0x80:
+                    return 2 ** (value & 0x7F)
+                return 10 ** value
+            offset += 4 + ((length + 3) & ~3)
+        return 1_000_000
+
+
+class PcapStreamReader:
+    """
+    Incremental reader for a classic libpcap byte stream that is still being
+    written: a capture file tcpdump is appending to, or a socket fed by
+    `tcpdump -U -w -`. `read(n)` returns up to n bytes, blocking as needed,
+    and b"" once the stream has ended. Records are yielded as (ts_us,
+    wire_len, frame, caplen, linktype); each frame is its own bytes object,
+    so decode_packet is called with offset 0.
+    """
+
+    # Anything larger is a corrupt header rather than a frame
+    MAX_CAPLEN = 262144
+
+    def __init__(self, read):
+        self._read = read
+
+    def _read_exact(self, n: int) -> Optional[bytes]:
+        data = self._read(n)
+        while len(data) < n:
+            more = self._read(n - len(data))
+            if not more:
+                return None
+            data += more
+        return data
+
+    def records(self) -> Iterator[Tuple[int, int, bytes, int, int]]:
+        header = self._read_exact(24)
+        if header is None:
+            return
+        magic_le = struct.unpack_from('<I', header, 0)[0]
+        if magic_le in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            endian, magic = '<', magic_le
+        else:
+            endian, magic = '>', struct.unpack_from('>I', header, 0)[0]
+            if magic not in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                if magic_le == PCAPNG_SHB:
+                    raise PcapFormatError("Live feeds must be classic pcap (tcpdump -w), not pcapng")
+                raise PcapFormatError("Unrecognised capture magic number")
+        nanos = magic == PCAP_MAGIC_NS
+        linktype = struct.unpack_from(endian + 'I', header, 20)[0] & 0x0FFFFFFF
+        unpack_header = struct.Struct(endian + 'IIII').unpack
+
+        while True:
+            record_header = self._read_exact(16)
+            if record_header is None:
+                return
+            ts_sec, ts_frac, caplen, wire_len = unpack_header(record_header)
+            if caplen > self.MAX_CAPLEN:
+                raise PcapFormatError(f"Corrupt record header (caplen {caplen})")
+            frame = self._read_exact(caplen) if caplen else b""
+            if frame is None:
+                return
+            ts_us = ts_sec * 1_000_000 + (ts_frac // 1000 if nanos else ts_frac)
+            yield ts_us, wire_len, frame, caplen, linktype
+
+
+def decode_packet(buf, offset: int, caplen: int, linktype: int) -> Optional[Tuple]:
+    """
+    Decodes the network and transport headers of a frame in place.
+    Returns (ip_version, src_addr, dst_addr, ip_proto, src_port, dst_port,
+    payload_offset, payload_len) or None for non-IP frames. Addresses are
+    returned as raw bytes so callers decide how to render or mask them.
+    """
+    end = offset + caplen
+    ethertype = None
+
+    if linktype == LINKTYPE_ETHERNET:
+        if caplen < 14:
+            return None
+        ethertype = (buf[offset + 12] << 8) | buf[offset + 13]
+        offset += 14
+        while ethertype in ETHERTYPE_VLAN and offset + 4 <= end:
+            ethertype = (buf[offset + 2] << 8) | buf[offset + 3]
+            offset += 4
+    elif linktype == LINKTYPE_LINUX_SLL:
+        if caplen < 16:
+            return None
+        ethertype = (buf[offset + 14] << 8) | buf[offset + 15]
+        offset += 16
+    elif linktype == LINKTYPE_LINUX_SLL2:
+        if caplen < 20:
+            return None
+        ethertype = (buf[offset] << 8) | buf[offset + 1]
+        offset += 20
+    elif linktype == LINKTYPE_NULL:
+        if caplen < 4:
+            return None
+        family = struct.unpack_from('<I', buf, offset)[0]
+        if family > 0xFFFF:
+            family = struct.unpack_from('>I', buf, offset)[0]
+        ethertype = ETHERTYPE_IPV4 if family == 2 else ETHERTYPE_IPV6
+        offset += 4
+    elif linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6, 12, 14):
+        pass
+    else:
+        return None
+
+    if offset >= end:
+        return None
+
+    version = buf[offset] >> 4
+    if ethertype is not None and ethertype not in (ETHERTYPE_IPV4, ETHERTYPE_IPV6):
+        return None
+
+    if version == 4:
+        if offset + 20 > end:
+            return None
+        ihl = (buf[offset] & 0x0F) * 4
+        # Link-layer padding (short Ethernet frames) is not part of the
+        # datagram; a zero or short total length (TSO/LRO captures) is ignored
+        total_length = (buf[offset + 2] << 8) | buf[offset + 3]
+        if total_length >= ihl:
+            end = min(end, offset + total_length)
+        ip_proto = buf[offset + 9]
+        src = buf[offset + 12:offset + 16]
+        dst = buf[offset + 16:offset + 20]
+        fragment_offset = ((buf[offset + 6] & 0x1F) << 8) | buf[offset + 7]
+        l4 = offset + ihl
+        if fragment_offset:
+            return 4, src, dst, ip_proto, 0, 0, l4, 0
+    elif version == 6:
+        if offset + 40 > end:
+            return None
+        # Zero means a jumbogram or an offloaded capture: keep the captured length
+        payload_length = (buf[offset + 4] << 8) | buf[offset + 5]
+        if payload_length:
+            end = min(end, offset + 40 + payload_length)
+        ip_proto = buf[offset + 6]
+        src = buf[offset + 8:offset + 24]
+        dst = buf[offset + 24:offset + 40]
+        l4 = offset + 40
+        while ip_proto in IPV6_EXTENSION_HEADERS and l4 + 2 <= end:
+            ip_proto = buf[l4]
+            l4 += (buf[l4 + 1] + 1) * 8
+        if ip_proto == IPV6_FRAGMENT_HEADER and l4 + 8 <= end:
+            ip_proto = buf[l4]
+            l4 += 8
+    else:
+        return None
+
+    src_port = dst_port = 0
+    payload_offset = l4
+    if ip_proto == 6 and l4 + 20 <= end:
+        src_port = (buf[l4] << 8) | buf[l4 + 1]
+        dst_port = (buf[l4 + 2] << 8) | buf[l4 + 3]
+        payload_offset = l4 + (buf[l4 + 12] >> 4) * 4
+    elif ip_proto == 17 and l4 + 8 <= end:
+        src_port = (buf[l4] << 8) | buf[l4 + 1]
+        dst_port = (buf[l4 + 2] << 8) | buf[l4 + 3]
+        payload_offset = l4 + 8
+
+    payload_len = max(0, end - payload_offset)
+    return version, src, dst, ip_proto, src_port, dst_port, payload_offset, payload_len
+
+
+def classify_protocol(buf, ip_proto: int, src_port: int, dst_port: int,
+                      payload_offset: int, payload_len: int) -> str:
+    """
+    Approximates tshark's highest_layer from ports and the first payload bytes.
+    """
+    if ip_proto == 6:
+        if src_port == DNS_PORT or dst_port == DNS_PORT:
+            return "DNS"
+        if payload_len >= 3:
+            first = buf[payload_offset]
+            if 0x14 <= first <= 0x17 and buf[payload_offset + 1] == 0x03:
+                return "TLS"
+            if src_port in HTTP_PORTS or dst_port in HTTP_PORTS:
+                return "HTTP"
+        return "TCP"
+    if ip_proto == 17:
+        if src_port == DNS_PORT or dst_port == DNS_PORT:
+            return "DNS"
+        return "UDP"
+    if ip_proto == 1:
+        return "ICMP"
+    if ip_proto == 58:
+        return "ICMPV6"
+    return "IP"
+
+
+def mask_address(addr: bytes) -> str:
+    """Keeps the network prefix of an address, matching the /16 masking used elsewhere."""
+    if len(addr) == 4:
+        return f"{addr[0]}.{addr[1]}.xxx.xxx"
+    if len(addr) == 16:
+        return f"{(addr[0] << 8) | addr[1]:x}:{(addr[2] << 8) | addr[3]:x}:xxxx::"
+    return MASKED_IP
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket for an external provider's request quota. Callers reserve a
+    token and sleep until it is theirs, so waiters are served in order and
+    no asyncio primitive is involved: one bucket can be shared by scans
+    running on different job-worker event loops.
+    """
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """Takes a token and returns how long to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Holds back every later reservation for at least `seconds`, e.g. after a 429."""
+        with self._lock:
+            self._refill(time.monotonic())
+            # The next reservation then waits exactly `seconds`
+            self._tokens = min(self._tokens, 1) - seconds * self.rate
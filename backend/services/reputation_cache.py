@@ -0,0 +1,183 @@
+import asyncio
+import ipaddress
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from backend.database import get_connection
+
+# Seconds a lookup stays fresh, per provider; unknown providers use the default
+PROVIDER_TTLS = {
+    "AbuseIPDB": 6 * 3600,
+    "VirusTotal": 24 * 3600,
+    "WHOIS": 7 * 24 * 3600,
+    "DNS": 3600,
+    "ReverseDNS": 3600,
+}
+DEFAULT_TTL = 3600
+# Negative answers (404, NXDOMAIN) are kept for a shorter time
+NEGATIVE_TTL = int(os.getenv("REPUTATION_NEGATIVE_TTL", "3600"))
+# Entries held in the in-memory LRU in front of the table
+MEMORY_ENTRIES = int(os.getenv("REPUTATION_CACHE_ENTRIES", "4096"))
+# Cache writes give up rather than wait behind a long ingest transaction
+WRITE_BUSY_TIMEOUT_MS = 1000
+
+
+def normalize_indicator(indicator: str) -> str:
+    """Canonical cache key form: compressed IP addresses, lower-case names and hashes."""
+    value = indicator.strip()
+    try:
+        return ipaddress.ip_address(value).compressed
+    except ValueError:
+        return value.lower().rstrip(".")
+
+
+class ReputationCache:
+    """
+    Lookups against external providers (AbuseIPDB, VirusTotal, WHOIS, DNS)
+    shared across cases. Results live in the `reputation_cache` table keyed
+    by provider and normalized indicator, each with a provider TTL, and the
+    most recent ones in an in-memory LRU so repeated IOCs skip the database
+    too. Negative answers are cached with NEGATIVE_TTL. Only successful
+    lookups should be stored; rate limits and transport errors are not.
+
+    Values are stored as JSON and decoded on every hit, so callers get a
+    copy they are free to modify.
+    """
+    def __init__(self, max_entries: int = MEMORY_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, bool, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, provider: str, counter: str):
+        counters = self._counters.setdefault(provider, {
+            "memory_hits": 0, "db_hits": 0, "negative_hits": 0, "misses": 0, "expired": 0, "stores": 0
+        })
+        counters[counter] += 1
+
+    def _remember(self, key: Tuple[str, str], entry: Tuple[float, bool, str]):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, provider: str, indicator: str) -> Optional[Any]:
+        """The cached result, or None on a miss or an expired entry."""
+        key = (provider, normalize_indicator(indicator))
+        found, value = self._get_memory(key)
+        return value if found else self._get_stored(key)
+
+    async def get_async(self, provider: str, indicator: str) -> Optional[Any]:
+        """get() for coroutines on the server loop: memory hits inline, database reads on a thread."""
+        key = (provider, normalize_indicator(indicator))
+        found, value = self._get_memory(key)
+        return value if found else await asyncio.to_thread(self._get_stored, key)
+
+    def _get_memory(self, key: Tuple[str, str]) -> Tuple[bool, Optional[Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            self._count(key[0], "negative_hits" if entry[1] else "memory_hits")
+            return True, json.loads(entry[2])
+
+    def _get_stored(self, key: Tuple[str, str]) -> Optional[Any]:
+        try:
+            conn = get_connection()
+            try:
+                row = conn.execute(
+                    "SELECT expires_at, negative, result FROM reputation_cache WHERE provider = ? AND indicator = ?",
+                    key
+                ).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Reputation cache read failed: {e}")
+            row = None
+
+        with self._lock:
+            if row is None:
+                self._count(key[0], "misses")
+                return None
+            if row["expires_at"] <= time.time():
+                self._count(key[0], "expired")
+                return None
+            self._remember(key, (row["expires_at"], bool(row["negative"]), row["result"]))
+            self._count(key[0], "negative_hits" if row["negative"] else "db_hits")
+        return json.loads(row["result"])
+
+    def put(self, provider: str, indicator: str, value: Any, negative: bool = False, ttl: Optional[float] = None):
+        key = (provider, normalize_indicator(indicator))
+        if ttl is None:
+            ttl = NEGATIVE_TTL if negative else PROVIDER_TTLS.get(provider, DEFAULT_TTL)
+        now = time.time()
+        payload = json.dumps(value, default=str)
+        with self._lock:
+            self._remember(key, (now + ttl, negative, payload))
+            self._count(provider, "stores")
+
+        try:
+            conn = get_connection()
+            try:
+                conn.execute(f"PRAGMA busy_timeout = {WRITE_BUSY_TIMEOUT_MS}")
+                conn.execute('''
+                    INSERT OR REPLACE INTO reputation_cache (provider, indicator, result, negative, fetched_at, expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (provider, key[1], payload, int(negative), now, now + ttl))
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            # Still served from memory; the next process start simply misses
+            print(f"Reputation cache write failed: {e}")
+
+    async def put_async(self, provider: str, indicator: str, value: Any, negative: bool = False,
+                        ttl: Optional[float] = None):
+        await asyncio.to_thread(self.put, provider, indicator, value, negative, ttl)
+
+    def purge_expired(self) -> int:
+        conn = get_connection()
+        try:
+            removed = conn.execute("DELETE FROM reputation_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+            conn.commit()
+            return removed
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            providers = {name: dict(counters) for name, counters in self._counters.items()}
+            memory_entries = len(self._entries)
+        totals: Dict[str, int] = {}
+        for counters in providers.values():
+            for name, count in counters.items():
+                totals[name] = totals.get(name, 0) + count
+        hits = totals.get("memory_hits", 0) + totals.get("db_hits", 0) + totals.get("negative_hits", 0)
+        lookups = hits + totals.get("misses", 0) + totals.get("expired", 0)
+        conn = get_connection()
+        try:
+            row = conn.execute(
+                "SELECT COUNT(*), SUM(expires_at > ?) FROM reputation_cache", (time.time(),)
+            ).fetchone()
+        finally:
+            conn.close()
+        return {
+            "memory_entries": memory_entries,
+            "max_memory_entries": self.max_entries,
+            "stored_entries": row[0],
+            "fresh_entries": row[1] or 0,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            **totals,
+            "providers": providers
+        }
+
+reputation_cache = ReputationCache()
@@ -0,0 +1,152 @@
+import json
+import sqlite3
+from typing import Dict, Iterator, List, Optional
+
+from backend.database import DIRECTION_CODES, PROTOCOL_CODES, iso_to_epoch_us
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = ipc = pq = None
+
+# Rows per Parquet row group / Arrow record batch, read and written one at a time
+ARCHIVE_BATCH_SIZE = 100000
+# Schema metadata key holding the traffic_sessions row as JSON
+SESSION_METADATA_KEY = b"traffic_session"
+
+ARCHIVE_FORMATS = {
+    "parquet": {"extension": ".parquet", "media_type": "application/vnd.apache.parquet", "magic": b"PAR1"},
+    "arrow": {"extension": ".arrow", "media_type": "application/vnd.apache.arrow.file", "magic": b"ARROW1"},
+}
+
+# Session fields carried in an archive; ids, counts and storage paths are re-derived on import
+SESSION_FIELDS = ("session_id", "name", "description", "start_time", "end_time", "created_at")
+
+
+def archive_available() -> bool:
+    return pa is not None
+
+
+def _packet_schema():
+    return pa.schema([
+        ("timestamp", pa.string()),
+        ("ts_us", pa.int64()),
+        ("src_ip", pa.string()),
+        ("dst_ip", pa.string()),
+        ("protocol", pa.string()),
+        ("size", pa.int64()),
+        ("direction", pa.string()),
+        ("flow_id", pa.int64()),
+    ])
+
+
+def export_session(conn: sqlite3.Connection, session_id: str, path: str, fmt: str = "parquet") -> Optional[int]:
+    """
+    Writes a session and its packets to `path` as Parquet or an Arrow IPC
+    file, streaming ARCHIVE_BATCH_SIZE packets per row group so memory use
+    does not grow with the session. The session row travels in the schema
+    metadata. Returns the number of packets written, or None if the session
+    does not exist.
+    """
+    row = conn.execute("SELECT * FROM traffic_sessions WHERE session_id = ?", (session_id,)).fetchone()
+    if row is None:
+        return None
+    session = {field: row[field] for field in SESSION_FIELDS}
+    schema = _packet_schema().with_metadata({SESSION_METADATA_KEY: json.dumps(session)})
+
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+        write = lambda batch: writer.write_batch(batch, row_group_size=ARCHIVE_BATCH_SIZE)
+    else:
+        writer = ipc.new_file(path, schema)
+        write = writer.write_batch
+
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute('''
+        SELECT timestamp, ts_us, src_ip, dst_ip, protocol, size, direction, flow_id
+        FROM packets WHERE session_id = ? ORDER BY ts_us, id
+    ''', (session_id,))
+
+    written = 0
+    try:
+        while True:
+            rows = cursor.fetchmany(ARCHIVE_BATCH_SIZE)
+            if not rows:
+                break
+            columns = zip(*rows)
+            write(pa.record_batch(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema
+            ))
+            written += len(rows)
+    finally:
+        writer.close()
+    return written
+
+
+def detect_format(path: str) -> Optional[str]:
+    with open(path, "rb") as f:
+        head = f.read(6)
+    for fmt, spec in ARCHIVE_FORMATS.items():
+        if head.startswith(spec["magic"]):
+            return fmt
+    return None
+
+
+def read_session_metadata(path: str, fmt: str) -> Dict:
+    """The traffic_sessions fields stored with an archive, or {} for a bare packet file."""
+    if fmt == "parquet":
+        metadata = pq.read_schema(path).metadata or {}
+    else:
+        with pa.memory_map(path) as source:
+            metadata = ipc.open_file(source).schema.metadata or {}
+    raw = metadata.get(SESSION_METADATA_KEY)
+    session = json.loads(raw) if raw else {}
+    if not isinstance(session, dict):
+        raise ValueError("Session metadata is not an object")
+    return session
+
+
+def iter_archive_rows(path: str, fmt: str, session_id: str) -> Iterator[List[tuple]]:
+    """
+    Yields the archive's packets a batch at a time as database.packet_row
+    tuples for `session_id`. Only the timestamp, endpoint, protocol, size,
+    direction and flow_id columns are read; ts_us is recomputed when absent.
+    """
+    columns = [field.name for field in _packet_schema()]
+    if fmt == "parquet":
+        parquet = pq.ParquetFile(path)
+        present = [name for name in columns if name in parquet.schema_arrow.names]
+        batches = parquet.iter_batches(batch_size=ARCHIVE_BATCH_SIZE, columns=present)
+        yield from (_batch_rows(batch, session_id) for batch in batches)
+    else:
+        with pa.memory_map(path) as source:
+            reader = ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield _batch_rows(reader.get_batch(i), session_id)
+
+
+def _batch_rows(batch, session_id: str) -> List[tuple]:
+    data = batch.to_pydict()
+    n = batch.num_rows
+    for required in ("timestamp", "src_ip", "dst_ip", "protocol", "size", "direction"):
+        if required not in data:
+            raise ValueError(f"Archive is missing the '{required}' column")
+    ts_us = data.get("ts_us") or [None] * n
+    flow_ids = data.get("flow_id") or [None] * n
+    return [
+        (
+            session_id, timestamp, src_ip, dst_ip, protocol, size, direction,
+            ts if ts is not None else iso_to_epoch_us(timestamp),
+            DIRECTION_CODES.get(direction, 0),
+            PROTOCOL_CODES.get(protocol, 0),
+            flow_id
+        )
+        for timestamp, ts, src_ip, dst_ip, protocol, size, direction, flow_id in zip(
+            data["timestamp"], ts_us, data["src_ip"], data["dst_ip"],
+            data["protocol"], data["size"], data["direction"], flow_ids
+        )
+    ]
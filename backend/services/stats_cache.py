@@ -0,0 +1,42 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+class TTLCache:
+    """
+    Small in-process cache for dashboard statistics. Entries expire after
+    `ttl` seconds; a ttl of 0 disables caching. The counters behind the
+    stats endpoints are already O(1) reads, so this only saves a database
+    round trip per poll and a few seconds of staleness is acceptable.
+    """
+    def __init__(self, ttl: float = 2.0):
+        self.ttl = ttl
+        self._entries: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: Any):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def invalidate(self, key: Optional[str] = None):
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+stats_cache = TTLCache(ttl=float(os.getenv("STATS_CACHE_TTL", "2")))
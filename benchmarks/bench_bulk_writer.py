@@ -0,0 +1,75 @@
+"""
+Compares packet insert throughput of the original row-at-a-time path
+(one cursor.execute per packet, default rollback journal) with
+database.PacketWriter (executemany, WAL, batched transactions).
+
+Usage: python benchmarks/bench_bulk_writer.py [packet_count]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend import database
+from backend.database import PacketWriter, PACKET_COLUMNS, packet_row
+from backend.services.tor_simulator import generate_demo_traffic
+
+
+def make_packets(count: int):
+    # Reuse one simulated block to avoid measuring the generator itself
+    block = generate_demo_traffic("BENCH-0001", min(count, 10000))
+    for i in range(count):
+        yield block[i % len(block)]
+
+
+def bench_row_at_a_time(path: str, count: int) -> float:
+    conn = sqlite3.connect(path)
+    database.DATABASE_PATH = path
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    sql = f"INSERT INTO packets ({', '.join(PACKET_COLUMNS)}) VALUES ({', '.join('?' for _ in PACKET_COLUMNS)})"
+    for packet in make_packets(count):
+        cursor.execute(sql, packet_row(packet))
+    conn.commit()
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return count / elapsed
+
+
+def bench_bulk_writer(path: str, count: int, rebuild_indexes: bool) -> float:
+    database.DATABASE_PATH = path
+    conn = database.get_connection()
+    start = time.perf_counter()
+    with PacketWriter(conn, rebuild_indexes=rebuild_indexes) as writer:
+        writer.add_packets(make_packets(count))
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return count / elapsed
+
+
+def fresh_db(tmp: str, name: str) -> str:
+    path = os.path.join(tmp, name)
+    database.DATABASE_PATH = path
+    database.init_db()
+    # init_db enables WAL; the baseline measures the original rollback journal
+    if name.startswith("baseline"):
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+    return path
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        before = bench_row_at_a_time(fresh_db(tmp, "baseline.db"), count)
+        print(f"Row-at-a-time execute:        {before:>12,.0f} rows/s")
+
+        after = bench_bulk_writer(fresh_db(tmp, "bulk.db"), count, rebuild_indexes=False)
+        print(f"PacketWriter:                 {after:>12,.0f} rows/s ({after / before:.1f}x)")
+
+        rebuilt = bench_bulk_writer(fresh_db(tmp, "bulk_rebuild.db"), count, rebuild_indexes=True)
+        print(f"PacketWriter, rebuild indexes:{rebuilt:>12,.0f} rows/s ({rebuilt / before:.1f}x)")
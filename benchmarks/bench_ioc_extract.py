@@ -0,0 +1,120 @@
+"""
+Checks the single-pass IOC extractor against the previous three-pass
+findall extraction, and chunked feeding against one-shot extraction, then
+reports throughput in MB/s on synthetic paste-dump text.
+
+Usage: python benchmarks/bench_ioc_extract.py [megabytes]   (default: 32)
+"""
+import os
+import random
+import re
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.ioc_extractor import IOCExtractor, extract_iocs
+
+ONION_ALPHABET = string.ascii_lowercase + "234567"
+WORDS = ["the", "error", "connection", "from", "user", "login", "failed", "GET", "POST", "session",
+         "token", "v1.2", "3.14", "id=42", "--", "|", "http://", "[INFO]", "2025-12-01T10:00:00Z"]
+
+
+def legacy_extract(text: str):
+    """The previous extract_iocs: three findall passes and set() over each."""
+    ip_pattern = r'\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b'
+    domain_pattern = r'\b(?:[a-zA-Z0-9](?:[a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]{2,6}\b'
+    onion_pattern = r'\b[a-z2-7]{16,56}\.onion\b'
+    ips = list(set(re.findall(ip_pattern, text)))
+    domains = list(set(re.findall(domain_pattern, text)))
+    onions = list(set(re.findall(onion_pattern, text)))
+    domains = [d for d in domains if not d.endswith('.onion')]
+    return {"ips": ips, "domains": domains, "onions": onions}
+
+
+def make_text(megabytes: float, rng: random.Random) -> str:
+    ips = [f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+           for _ in range(5000)]
+    bad_ips = [f"{rng.randint(256, 999)}.{rng.randint(0, 255)}.1.1" for _ in range(200)]
+    domains = [f"{''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12)))}."
+               f"{rng.choice(['com', 'net', 'org', 'ru', 'io', 'info'])}" for _ in range(5000)]
+    onions = ["".join(rng.choices(ONION_ALPHABET, k=rng.choice([16, 56]))) + ".onion" for _ in range(1000)]
+    # Hosts that start like an IP: PTR-style names and invalid quads in front of a domain
+    hosts = [f"{rng.choice(ips + bad_ips)}.{rng.choice(domains)}" for _ in range(500)]
+    lines, size, target = [], 0, int(megabytes * 1024 * 1024)
+    while size < target:
+        tokens = rng.choices(WORDS, k=rng.randint(6, 16))
+        for _ in range(rng.randint(0, 3)):
+            pool = rng.choices([ips, domains, onions, bad_ips, hosts], weights=[5, 5, 2, 1, 1])[0]
+            tokens.insert(rng.randint(0, len(tokens)), rng.choice(pool))
+        line = " ".join(tokens)
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def check_against_legacy(rng: random.Random):
+    text = make_text(2, rng)
+    result, legacy = extract_iocs(text), legacy_extract(text)
+    # The old IP pass also reported the leading quad of hosts like 1.2.3.4.example.com;
+    # those now only count as part of the domain
+    standalone = set(re.findall(r'\b\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}\b(?!\.[a-zA-Z0-9])', text))
+    valid_legacy_ips = {ip for ip in legacy["ips"] if all(int(o) <= 255 for o in ip.split(".")) and ip in standalone}
+    assert set(result["ips"]) == valid_legacy_ips
+    assert set(result["domains"]) == set(legacy["domains"])
+    assert set(result["onions"]) == set(legacy["onions"])
+    print(f"Single pass matches the three-pass extraction "
+          f"({len(legacy['ips']) - len(valid_legacy_ips)} invalid IPs now rejected)")
+
+    extractor = IOCExtractor()
+    streamed = {"ips": [], "domains": [], "onions": []}
+    pos = 0
+    while pos < len(text):
+        step = rng.randint(1, 4096)
+        for key, values in extractor.feed(text[pos:pos + step]).items():
+            streamed[key] += values
+        pos += step
+    for key, values in extractor.close().items():
+        streamed[key] += values
+    for key in streamed:
+        assert len(streamed[key]) == len(set(streamed[key])), key
+        assert set(streamed[key]) == set(result[key]), key
+    print("Chunked feed() matches one-shot extraction")
+
+
+def timed(label: str, megabytes: float, fn):
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed:7.2f} s  {megabytes / elapsed:7.1f} MB/s")
+    return out
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 32
+    rng = random.Random(7)
+    check_against_legacy(rng)
+
+    text = make_text(megabytes, rng)
+    size_mb = len(text.encode()) / (1024 * 1024)
+    print(f"\n{size_mb:.1f} MB of synthetic paste text")
+    timed("three-pass findall (old)", size_mb, lambda: legacy_extract(text))
+    result = timed("single pass", size_mb, lambda: extract_iocs(text))
+
+    def streamed():
+        extractor = IOCExtractor()
+        chunk = 1024 * 1024
+        for pos in range(0, len(text), chunk):
+            extractor.feed(text[pos:pos + chunk])
+        extractor.close()
+        return extractor.counts()
+
+    counts = timed("single pass, 1 MB chunks", size_mb, streamed)
+    assert counts["count"] == result["count"]
+    print(f"\n{result['count']} unique indicators ({len(result['ips'])} IPs, {len(result['domains'])} domains, "
+          f"{len(result['onions'])} onions)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Checks decode_packet and the cell features it feeds on hand-built edge-case
+frames, then measures PCAP
+ingest throughput of the native memory-mapped reader against pyshark (when
+installed) on a synthetic capture.
+
+Usage: python benchmarks/bench_pcap_ingest.py [packet_count]
+"""
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.services.cell_features import MAX_BURSTS, CellFeatures
+from backend.services.pcap_analyzer import PCAPAnalyzer
+from backend.services.pcap_reader import LINKTYPE_ETHERNET, decode_packet
+
+
+def write_synthetic_pcap(path: str, packet_count: int):
+    """Writes an Ethernet/IPv4/TCP capture with TLS-looking payloads."""
+    rng = random.Random(42)
+    base_ts = 1_700_000_000
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+        ts_us = 0
+        for i in range(packet_count):
+            ts_us += rng.randint(10, 5000)
+            payload_len = rng.choice([0, 543, 586, 1086, 1400])
+            payload = (b'\x17\x03\x03' + b'\x00' * (payload_len - 3)) if payload_len else b''
+            src = bytes([10, 0, 0, rng.randint(1, 20)])
+            dst = bytes([185, 220, 101, rng.randint(1, 50)])
+            if i % 2:
+                src, dst = dst, src
+            tcp = struct.pack('>HHIIBBHHH', 50000 + (i % 100), 443, i, 0, 5 << 4, 0x18, 65535, 0, 0)
+            ip_len = 20 + len(tcp) + len(payload)
+            ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, ip_len, i & 0xFFFF, 0, 64, 6, 0, src, dst)
+            frame = b'\x00' * 12 + b'\x08\x00' + ip + tcp + payload
+            sec, usec = divmod(base_ts * 1_000_000 + ts_us, 1_000_000)
+            f.write(struct.pack('<IIII', sec, usec, len(frame), len(frame)))
+            f.write(frame)
+
+
+def _ipv4_tcp_frame(payload: bytes, ip_len=None, padding: int = 0) -> bytes:
+    tcp = struct.pack('>HHIIBBHHH', 50000, 443, 1, 1, 5 << 4, 0x10, 65535, 0, 0)
+    if ip_len is None:
+        ip_len = 20 + len(tcp) + len(payload)
+    ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, ip_len, 1, 0, 64, 6, 0, bytes([10, 0, 0, 1]), bytes([185, 220, 101, 1]))
+    return b'\x00' * 12 + b'\x08\x00' + ip + tcp + payload + b'\x00' * padding
+
+
+def _ipv6_tcp_frame(payload: bytes, padding: int = 0) -> bytes:
+    tcp = struct.pack('>HHIIBBHHH', 50000, 443, 1, 1, 5 << 4, 0x10, 65535, 0, 0)
+    ip = struct.pack('>IHBB16s16s', 6 << 28, len(tcp) + len(payload), 6, 64, b'\x20' + b'\x00' * 15, b'\x20' + b'\x01' * 15)
+    return b'\x00' * 12 + b'\x86\xdd' + ip + tcp + payload + b'\x00' * padding
+
+
+def check_decode_cases():
+    """(payload_offset, payload_len) on frames whose captured length differs from the datagram."""
+    cases = {
+        # Pure ACK padded to the 60-byte Ethernet minimum: the padding is not payload
+        "padded IPv4 ACK": (_ipv4_tcp_frame(b'', padding=6), (54, 0)),
+        "padded IPv4 data": (_ipv4_tcp_frame(b'\x17\x03', padding=4), (54, 2)),
+        "unpadded IPv4 data": (_ipv4_tcp_frame(b'\x17\x03\x03\x00\x05'), (54, 5)),
+        # Offloaded captures record a zero total length; the captured bytes count
+        "IPv4 total length 0 (TSO)": (_ipv4_tcp_frame(b'\x00' * 100, ip_len=0), (54, 100)),
+        "padded IPv6 ACK": (_ipv6_tcp_frame(b'', padding=6), (74, 0)),
+    }
+    for name, (frame, expected) in cases.items():
+        decoded = decode_packet(frame, 0, len(frame), LINKTYPE_ETHERNET)
+        assert decoded[6:8] == expected, (name, decoded[6:8], expected)
+    print(f"Decode edge cases: {len(cases)} as expected")
+
+
+def check_cell_features():
+    """Padded ACKs between and inside TLS records must not desync the record tracker."""
+    record = b'\x17\x03\x03\x02\x1a' + b'\x00' * 538
+    ack = _ipv4_tcp_frame(b'', padding=6)
+    features = CellFeatures()
+
+    def add(outbound, frame):
+        decoded = decode_packet(frame, 0, len(frame), LINKTYPE_ETHERNET)
+        features.add(outbound, frame, decoded[6], decoded[7])
+
+    for _ in range(3):
+        add(True, _ipv4_tcp_frame(record))
+        add(True, ack)
+        add(False, ack)
+        # A record split around an ACK, its tail coalesced with the next record
+        add(False, _ipv4_tcp_frame(record[:300]))
+        add(False, ack)
+        add(True, ack)
+        add(False, _ipv4_tcp_frame(record[300:] + record))
+    assert (features.cells_out, features.cells_in) == (3, 6), (features.cells_out, features.cells_in)
+    assert features.bursts == [1, -2] * 3, features.bursts
+
+    for _ in range(MAX_BURSTS):
+        add(True, _ipv4_tcp_frame(record))
+        add(False, _ipv4_tcp_frame(record))
+    assert len(features.bursts) == MAX_BURSTS
+    assert features.burst_count == 6 + 2 * MAX_BURSTS, features.burst_count
+    print(f"Cell features: padded ACKs ignored, {features.burst_count} bursts counted, {MAX_BURSTS} kept")
+
+
+def bench_native(path: str) -> float:
+    analyzer = PCAPAnalyzer()
+    count = 0
+
+    def sink(batch):
+        nonlocal count
+        count += len(batch)
+
+    start = time.perf_counter()
+    analyzer.ingest_pcap(path, "BENCH", sink)
+    elapsed = time.perf_counter() - start
+    return count / elapsed
+
+
+def bench_pyshark(path: str, limit: int = 5000) -> float:
+    import pyshark
+    cap = pyshark.FileCapture(path, keep_packets=False)
+    start = time.perf_counter()
+    count = 0
+    for pkt in cap:
+        _ = (pkt.sniff_timestamp, pkt.highest_layer, pkt.length)
+        count += 1
+        if count >= limit:
+            break
+    elapsed = time.perf_counter() - start
+    cap.close()
+    return count / elapsed
+
+
+if __name__ == "__main__":
+    packet_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    check_decode_cases()
+    check_cell_features()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.pcap")
+        write_synthetic_pcap(path, packet_count)
+        print(f"Capture: {packet_count:,} packets, {os.path.getsize(path) / 1e6:.1f} MB")
+
+        native = bench_native(path)
+        print(f"Native reader: {native:,.0f} packets/s")
+
+        try:
+            shark = bench_pyshark(path)
+            print(f"pyshark:       {shark:,.0f} packets/s ({native / shark:.1f}x slower)")
+        except Exception as e:
+            print(f"pyshark:       unavailable ({e})")
@@ -40,31 +40,29 @@ function Timeline() {
 
   const fetchPackets = async (sessionId) => {
     try {
-      const response = await sessionsAPI.getPackets(sessionId, 500);
+      const [response, timeline] = await Promise.all([
+        sessionsAPI.getPackets(sessionId, 500),
+        sessionsAPI.getTimeline(sessionId, 60000),
+      ]);
       setPackets(response.data.packets || []);
-      processChartData(response.data.packets || []);
+      processChartData(timeline.data);
     } catch (error) {
       console.error('Failed to fetch packets:', error);
     }
   };
 
-  const processChartData = (packets) => {
-    const timeGroups = {};
-    packets.forEach(p => {
-      const time = new Date(p.timestamp);
-      const minute = `${time.getHours()}:${String(time.getMinutes()).padStart(2, '0')}`;
-      if (!timeGroups[minute]) {
-        timeGroups[minute] = { time: minute, inbound: 0, outbound: 0, total: 0 };
-      }
-      if (p.direction === 'inbound') {
-        timeGroups[minute].inbound += p.size;
-      } else {
-        timeGroups[minute].outbound += p.size;
-      }
-      timeGroups[minute].total += p.size;
+  // Per-minute byte totals are aggregated server-side over the whole session
+  const processChartData = (timeline) => {
+    const inbound = timeline.by_direction.inbound?.bytes || [];
+    const data = timeline.start_us.map((startUs, i) => {
+      const time = new Date(startUs / 1000);
+      return {
+        time: `${time.getHours()}:${String(time.getMinutes()).padStart(2, '0')}`,
+        inbound: inbound[i] || 0,
+        outbound: timeline.bytes[i] - (inbound[i] || 0),
+        total: timeline.bytes[i],
+      };
     });
-    
-    const data = Object.values(timeGroups).sort((a, b) => a.time.localeCompare(b.time));
     setChartData(data);
   };
 
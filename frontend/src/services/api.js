@@ -26,30 +26,69 @@ export const sessionsAPI = {
   getSessions: () => api.get('/sessions/'),
   getSession: (sessionId) => api.get(`/sessions/${sessionId}`),
   generateDemo: (packetCount = 100) => api.post(`/sessions/generate-demo?packet_count=${packetCount}`),
-  uploadPcap: (file) => {
+  uploadPcap: async (file, { pollInterval = 1000, onProgress } = {}) => {
     const formData = new FormData();
     formData.append('file', file);
-    return api.post('/sessions/upload-pcap', formData, {
+    const accepted = await api.post('/sessions/upload-pcap', formData, {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
+    // Ingestion runs as a background job; wait for it on the event stream.
+    await jobsAPI.waitForJob(accepted.data.job_id, { pollInterval, onProgress });
+    const job = await sessionsAPI.getUploadJob(accepted.data.job_id);
+    if (job.data.status === 'completed') {
+      return { ...job, data: { ...accepted.data, ...job.data.result, job: job.data } };
+    }
+    throw new Error(job.data.error || 'PCAP ingestion failed');
   },
-  getPackets: (sessionId, limit = 500, offset = 0) =>
-    api.get(`/sessions/${sessionId}/packets`, { params: { limit, offset } }),
+  getUploadJob: (jobId) => api.get(`/sessions/upload-jobs/${jobId}`),
+  getPackets: (sessionId, limit = 500, { cursor, count = 'approximate' } = {}) =>
+    api.get(`/sessions/${sessionId}/packets`, { params: { limit, cursor, count } }),
+  streamPackets: async (sessionId, onBatch) => {
+    // NDJSON stream of every packet; onBatch receives arrays as lines arrive.
+    const response = await fetch(`${API_BASE}/sessions/${sessionId}/packets/stream`);
+    if (!response.ok) throw new Error(`Packet stream failed: ${response.status}`);
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+      const lines = buffered.split('\n');
+      buffered = done ? '' : lines.pop();
+      const batch = lines.filter(Boolean).map((line) => JSON.parse(line));
+      if (batch.length) onBatch(batch);
+      if (done) return;
+    }
+  },
+  getFlows: (sessionId, limit = 500, { offset = 0, sort = 'bytes' } = {}) =>
+    api.get(`/sessions/${sessionId}/flows`, { params: { limit, offset, sort } }),
+  getTimeline: (sessionId, bucketMs = 60000, params = {}) =>
+    api.get(`/sessions/${sessionId}/timeline`, { params: { bucket_ms: bucketMs, ...params } }),
   deleteSession: (sessionId) => api.delete(`/sessions/${sessionId}`),
+  exportSession: (sessionId, format = 'parquet') => `${API_BASE}/sessions/${sessionId}/export?format=${format}`,
+  importSession: (file) => {
+    const formData = new FormData();
+    formData.append('file', file);
+    return api.post('/sessions/import', formData, { headers: { 'Content-Type': 'multipart/form-data' } });
+  },
 };
 
 export const analysisAPI = {
   getAnalyses: () => api.get('/analysis/'),
   getAnalysis: (caseId) => api.get(`/analysis/${caseId}`),
   getInsights: (sessionId) => api.get(`/analysis/${sessionId}/insights`),
-  runAnalysis: (data) => api.post('/analysis/run', data),
+  runAnalysis: (data) => jobResult(api.post('/analysis/run', data)),
+  runFlowCorrelation: (data) => api.post('/analysis/flow-correlation', data),
+  runBatchAnalysis: (data) => api.post('/analysis/batch', data),
+  getBatchAnalysis: (batchId) => api.get(`/analysis/batch/${batchId}`),
+  startLiveCorrelation: (data) => api.post('/analysis/live', data),
   updateNotes: (caseId, notes) => api.post(`/analysis/${caseId}/notes?notes=${encodeURIComponent(notes)}`),
   deleteAnalysis: (caseId) => api.delete(`/analysis/${caseId}`),
 };
 
 export const reportsAPI = {
   getReports: () => api.get('/reports/'),
-  generateReport: (caseId) => api.post(`/reports/generate/${caseId}`),
+  generateReport: (caseId) => jobResult(api.post(`/reports/generate/${caseId}`)),
   downloadReport: (reportId) => `${API_BASE}/reports/download/${reportId}`,
   downloadReportByCase: (caseId) => `${API_BASE}/reports/download-by-case/${caseId}`,
   deleteReport: (reportId) => api.delete(`/reports/${reportId}`),
@@ -60,4 +99,72 @@ export const threatIntelAPI = {
   getMatches: (caseId) => api.get(`/threat-intel/matches/${caseId}`),
 };
 
+export const eventsAPI = {
+  // Server-Sent Events: job progress, new threat-intel matches and saved analyses.
+  // Filters take a value or an array: { sessionId, caseId, jobId, types, lastEventId }.
+  // Returns a function that closes the stream.
+  subscribe: ({ sessionId, caseId, jobId, types, lastEventId } = {}, onEvent, onError) => {
+    const params = new URLSearchParams();
+    const add = (key, value) => [].concat(value ?? []).forEach((v) => params.append(key, v));
+    add('session_id', sessionId);
+    add('case_id', caseId);
+    add('job_id', jobId);
+    add('types', types);
+    add('last_event_id', lastEventId);
+    const source = new EventSource(`${API_BASE}/events/?${params}`);
+    source.onmessage = (message) => onEvent(JSON.parse(message.data));
+    if (onError) source.onerror = onError;
+    return () => source.close();
+  },
+  getStats: () => api.get('/events/stats'),
+};
+
+const FINISHED_JOB_STATUSES = ['completed', 'failed', 'cancelled'];
+
+export const jobsAPI = {
+  getJobs: (params) => api.get('/jobs/', { params }),
+  getJob: (jobId) => api.get(`/jobs/${jobId}`),
+  cancelJob: (jobId) => api.post(`/jobs/${jobId}/cancel`),
+  // Resolves with the finished job. Pushed events drive it; polling is the
+  // fallback where EventSource is unavailable.
+  waitForJob: async (jobId, { pollInterval = 1000, onProgress } = {}) => {
+    if (typeof EventSource === 'undefined') {
+      for (;;) {
+        const job = await jobsAPI.getJob(jobId);
+        if (onProgress) onProgress(job.data);
+        if (FINISHED_JOB_STATUSES.includes(job.data.status)) return job;
+        await new Promise((resolve) => setTimeout(resolve, pollInterval));
+      }
+    }
+    await new Promise((resolve) => {
+      const finish = () => {
+        close();
+        resolve();
+      };
+      // Replaying from event 0 covers a job that finished before the stream opened
+      const close = eventsAPI.subscribe({ jobId, types: 'job', lastEventId: 0 }, (event) => {
+        if (event.type === 'job.progress' && onProgress) {
+          onProgress({ job_id: jobId, status: 'running', progress: event.data.progress });
+        }
+        if (event.type === 'job.finished') finish();
+      });
+      // ...and this one a job that finished long enough ago to leave the history
+      jobsAPI.getJob(jobId).then((job) => {
+        if (FINISHED_JOB_STATUSES.includes(job.data.status)) finish();
+      });
+    });
+    return jobsAPI.getJob(jobId);
+  },
+};
+
+// Waiting endpoints answer 202 with the job when it outlasts the server's
+// wait; follow it to the result so callers always get the finished response.
+const jobResult = async (request) => {
+  const response = await request;
+  if (response.status !== 202) return response;
+  const job = await jobsAPI.waitForJob(response.data.job_id);
+  if (job.data.status === 'completed') return { ...job, data: job.data.result };
+  throw new Error(job.data.error || `Job ${job.data.status}`);
+};
+
 export default api;